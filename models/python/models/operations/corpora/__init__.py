@@ -0,0 +1,40 @@
+"""
+Ingestion of the project's idiom and metaphor corpora into one normalized,
+memory-mappable format, and streaming access to the result.
+
+    info = ingest("magpie", ["MAGPIE_filtered_split_random.jsonl"], "data/corpora")
+    with open_corpus("data/corpora", "magpie") as corpus:
+        for record in corpus.iter_records(split="train", lemma="spill the beans"):
+            ...
+
+From the command line:
+    python -m models.operations.corpora ingest magpie MAGPIE_filtered_split_random.jsonl --out data/corpora
+"""
+
+import os
+
+from models.operations.corpora.parsers import PARSERS, normalize_lemma
+from models.operations.corpora.storage import CorpusReader, write_corpus
+from models.types.corpora import CorpusInfo
+
+CORPORA = tuple(PARSERS)
+
+def ingest(corpus: str, sources: list[str], root: str) -> CorpusInfo:
+    """Converts a corpus' distribution files into root/<corpus>."""
+    if corpus not in PARSERS:
+        raise ValueError(f"Unknown corpus {corpus!r}, expected one of {', '.join(CORPORA)}")
+    return write_corpus(os.path.join(root, corpus), corpus, PARSERS[corpus](sources), sources)
+
+def list_corpora(root: str) -> list[str]:
+    """The ingested corpora under root."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if os.path.exists(os.path.join(root, name, "meta.json"))
+    )
+
+def open_corpus(root: str, corpus: str) -> CorpusReader:
+    return CorpusReader(os.path.join(root, corpus))
+
+__all__ = ["CORPORA", "CorpusReader", "ingest", "list_corpora", "normalize_lemma", "open_corpus"]
@@ -0,0 +1,29 @@
+import argparse
+import sys
+
+from models.operations.corpora import CORPORA, ingest, list_corpora, open_corpus
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m models.operations.corpora", description="Corpus ingestion.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Normalize a corpus' distribution files")
+    ingest_parser.add_argument("corpus", choices=CORPORA)
+    ingest_parser.add_argument("sources", nargs="+", help="Distribution files of the corpus")
+    ingest_parser.add_argument("--out", required=True, help="Root directory of the ingested corpora")
+    info_parser = subparsers.add_parser("info", help="Summarize the ingested corpora")
+    info_parser.add_argument("root", help="Root directory of the ingested corpora")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        info = ingest(args.corpus, args.sources, args.out)
+        print(f"{info.corpus}: {info.records} records, {info.lemmas} lemmas, splits {info.splits}")
+        return 0
+
+    for corpus in list_corpora(args.root):
+        with open_corpus(args.root, corpus) as reader:
+            info = reader.info
+        print(f"{info.corpus}: {info.records} records, {info.lemmas} lemmas, splits {info.splits} ({info.created_at})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
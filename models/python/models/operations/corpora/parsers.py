@@ -0,0 +1,233 @@
+"""
+Parsers that convert each source corpus into CorpusRecords.
+
+Every parser takes the paths of the corpus' distribution files and yields
+records one at a time, so no corpus is ever fully loaded into memory. Corpora
+without an official split are split deterministically on the lemma (80/10/10),
+so all occurrences of an expression end up in the same split.
+"""
+
+import csv
+import json
+import os
+import re
+import zlib
+from collections.abc import Iterable, Iterator
+from typing import Callable
+
+from models.types.corpora import CorpusRecord, Split
+
+#### Helpers ####
+
+def normalize_lemma(expression: str) -> str:
+    """Lowercases and strips punctuation (except apostrophes and hyphens)."""
+    return " ".join(re.findall(r"[\w'-]+", expression.lower()))
+
+def hash_split(lemma: str) -> Split:
+    bucket = zlib.crc32(lemma.encode()) % 10
+    return "test" if bucket == 0 else "dev" if bucket == 1 else "train"
+
+def file_split(path: str) -> Split | None:
+    """Infers the split from a distribution file name, e.g. VUA_formatted_val.csv."""
+    name = os.path.basename(path).lower()
+    if re.search(r"test|eval", name):
+        return "test"
+    if re.search(r"dev|val", name):
+        return "dev"
+    if "train" in name:
+        return "train"
+    return None
+
+def token_span(sentence: str, index: int) -> tuple[int, int]:
+    """Character offsets of the index-th whitespace separated token."""
+    for i, match in enumerate(re.finditer(r"\S+", sentence)):
+        if i == index:
+            return match.start(), match.end()
+    return -1, -1
+
+def find_span(text: str, expression: str) -> tuple[int, int]:
+    match = re.search(re.escape(expression), text, re.IGNORECASE)
+    return (match.start(), match.end()) if match else (-1, -1)
+
+def read_rows(path: str) -> Iterator[dict]:
+    """Rows of a CSV, TSV or JSONL file as dicts."""
+    if path.endswith((".jsonl", ".json")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    with open(path, encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f, delimiter="\t" if path.endswith(".tsv") else ",")
+
+def first(row: dict, *fields: str, default=None):
+    for field in fields:
+        if row.get(field) not in (None, ""):
+            return row[field]
+    return default
+
+#### Conceptual metaphors ####
+
+def parse_vuamc(paths: Iterable[str]) -> Iterator[CorpusRecord]:
+    """
+    VU Amsterdam Metaphor Corpus in the CSV formats of Gao et al. (2018):
+    VUA_formatted_{train,val,test}.csv (one target verb per row, with
+    sentence, verb, verb_idx and label columns) and
+    VUA_seq_formatted_{train,val,test}.csv (one sentence per row with a
+    per-token label_seq, of which every metaphorical token becomes a record).
+    There is no lemmatization; the lemma is the normalized surface form.
+    """
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        split = file_split(path) or "train"
+        for n, row in enumerate(read_rows(path)):
+            sentence = row["sentence"]
+            if "label_seq" in row:
+                labels = json.loads(row["label_seq"])
+                tokens = sentence.split()
+                for i, label in enumerate(labels):
+                    if not int(label) or i >= len(tokens):
+                        continue
+                    start, end = token_span(sentence, i)
+                    yield CorpusRecord(
+                        corpus="vuamc", id=f"{name}-{n}-{i}", split=split,
+                        type="conceptual_metaphor", text=sentence,
+                        expression=sentence[start:end], lemma=normalize_lemma(tokens[i]),
+                        start=start, end=end,
+                    )
+            else:
+                start, end = token_span(sentence, int(row["verb_idx"]))
+                yield CorpusRecord(
+                    corpus="vuamc", id=f"{name}-{n}", split=split,
+                    type="conceptual_metaphor", text=sentence,
+                    expression=sentence[start:end] if start >= 0 else row["verb"],
+                    lemma=normalize_lemma(row["verb"]),
+                    start=start, end=end, figurative=bool(int(row["label"])),
+                )
+
+def _parse_verb_classification(corpus: str, paths: Iterable[str]) -> Iterator[CorpusRecord]:
+    # TroFi and MOH-X share the Gao et al. (2018) layout: verb (a lemma),
+    # sentence, verb_idx and label columns, without official splits
+    for path in paths:
+        for n, row in enumerate(read_rows(path)):
+            sentence = row["sentence"]
+            start, end = token_span(sentence, int(row["verb_idx"]))
+            lemma = normalize_lemma(row["verb"])
+            yield CorpusRecord(
+                corpus=corpus, id=f"{corpus}-{n}", split=hash_split(lemma),
+                type="conceptual_metaphor", text=sentence,
+                expression=sentence[start:end] if start >= 0 else row["verb"],
+                lemma=lemma, start=start, end=end, figurative=bool(int(row["label"])),
+            )
+
+def parse_trofi(paths: Iterable[str]) -> Iterator[CorpusRecord]:
+    """TroFi in the format of Gao et al. (2018), TroFi_formatted_all3737.csv."""
+    return _parse_verb_classification("trofi", paths)
+
+def parse_mohx(paths: Iterable[str]) -> Iterator[CorpusRecord]:
+    """MOH-X in the format of Gao et al. (2018), MOH-X_formatted_svo_cleaned.csv."""
+    return _parse_verb_classification("mohx", paths)
+
+def parse_metanet(paths: Iterable[str]) -> Iterator[CorpusRecord]:
+    """
+    MetaNet metaphor entries as JSONL (or CSV), one metaphor per row with a
+    name (e.g. "MORE IS UP"), source and target frames and example sentences.
+    Each example becomes a record without span annotation; the metaphor name
+    is the lemma, and the frame mapping the explanation.
+    """
+    for path in paths:
+        for n, row in enumerate(read_rows(path)):
+            name = first(row, "metaphor", "name")
+            if not name:
+                continue
+            source, target = first(row, "source", "source_frame"), first(row, "target", "target_frame")
+            explanation = f"{target} is understood in terms of {source}." if source and target else None
+            examples = first(row, "examples", "example", default=[])
+            if isinstance(examples, str):
+                examples = [e for e in examples.split("|") if e.strip()]
+            lemma = normalize_lemma(name)
+            for i, example in enumerate(examples or [""]):
+                yield CorpusRecord(
+                    corpus="metanet", id=f"metanet-{n}-{i}", split=hash_split(lemma),
+                    type="conceptual_metaphor", text=example.strip(), expression=name,
+                    lemma=lemma, explanation=explanation,
+                )
+
+#### Idioms ####
+
+MAGPIE_SPLITS: dict[str, Split] = {"training": "train", "development": "dev", "test": "test"}
+
+def parse_magpie(paths: Iterable[str]) -> Iterator[CorpusRecord]:
+    """
+    MAGPIE (MAGPIE_filtered_split_{random,typebased}.jsonl). The expression is
+    annotated in the middle sentence of each five sentence context; label "i"
+    is idiomatic and "l" literal, other labels are skipped.
+    """
+    for path in paths:
+        for row in read_rows(path):
+            if row["label"] not in ("i", "l"):
+                continue
+            text = row["context"][len(row["context"]) // 2]
+            offsets = row.get("offsets") or []
+            start = min((s for s, _ in offsets), default=-1)
+            end = max((e for _, e in offsets), default=-1)
+            yield CorpusRecord(
+                corpus="magpie", id=f"magpie-{row['id']}",
+                split=MAGPIE_SPLITS.get(row.get("split"), "train"), type="idiom",
+                text=text, expression=text[start:end] if start >= 0 else row["idiom"],
+                lemma=normalize_lemma(row["idiom"]), start=start, end=end,
+                figurative=row["label"] == "i",
+            )
+
+def parse_semeval2022(paths: Iterable[str], languages: tuple[str, ...] = ("EN",)) -> Iterator[CorpusRecord]:
+    """
+    SemEval 2022 Task 2 subtask A (train_{zero,one}_shot.csv, dev.csv,
+    eval.csv with DataID, Language, MWE, Target and Label columns). Label 0
+    is idiomatic and 1 literal; rows without a gold label are skipped.
+    """
+    for path in paths:
+        split = file_split(path) or "train"
+        for n, row in enumerate(read_rows(path)):
+            if row.get("Label") in (None, "") or row.get("Language", "EN") not in languages:
+                continue
+            text, mwe = row["Target"], row["MWE"]
+            start, end = find_span(text, mwe)
+            yield CorpusRecord(
+                corpus="semeval2022", id=f"semeval2022-{first(row, 'DataID', 'ID', default=n)}",
+                split=split, type="idiom", text=text,
+                expression=text[start:end] if start >= 0 else mwe,
+                lemma=normalize_lemma(mwe), start=start, end=end,
+                figurative=int(row["Label"]) == 0, language=row.get("Language", "EN").lower(),
+            )
+
+def parse_id10(paths: Iterable[str]) -> Iterator[CorpusRecord]:
+    """
+    ID10 idioms with human-written explanations, as CSV or JSONL with an
+    idiom, an explanation (or meaning / definition) and optionally an example
+    sentence.
+    """
+    for path in paths:
+        split = file_split(path)
+        for n, row in enumerate(read_rows(path)):
+            idiom = first(row, "idiom", "expression")
+            if not idiom:
+                continue
+            text = first(row, "sentence", "example", default="")
+            start, end = find_span(text, idiom) if text else (-1, -1)
+            lemma = normalize_lemma(idiom)
+            yield CorpusRecord(
+                corpus="id10", id=f"id10-{n}", split=split or hash_split(lemma), type="idiom",
+                text=text, expression=text[start:end] if start >= 0 else idiom,
+                lemma=lemma, start=start, end=end,
+                explanation=first(row, "explanation", "meaning", "definition"),
+            )
+
+PARSERS: dict[str, Callable[[Iterable[str]], Iterator[CorpusRecord]]] = {
+    "vuamc": parse_vuamc,
+    "trofi": parse_trofi,
+    "mohx": parse_mohx,
+    "metanet": parse_metanet,
+    "magpie": parse_magpie,
+    "semeval2022": parse_semeval2022,
+    "id10": parse_id10,
+}
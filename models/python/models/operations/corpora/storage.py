@@ -0,0 +1,213 @@
+"""
+Columnar on-disk format for normalized corpora.
+
+Each corpus is a directory holding:
+    data.arrow   all records as an uncompressed Arrow IPC file, sorted by
+                 (split, lemma) so every split and every lemma within a split
+                 is a contiguous row range
+    index.arrow  one (split, lemma, offset, length) row per such range
+    meta.json    a CorpusInfo
+
+Arrow IPC files are memory-mapped on read, so a reader only pages in the rows
+it actually touches.
+"""
+
+import datetime
+import json
+import os
+from collections import Counter
+from collections.abc import Iterable, Iterator
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from models.types.corpora import CorpusInfo, CorpusRecord
+
+SCHEMA_VERSION = 1
+
+SCHEMA = pa.schema([
+    ("corpus", pa.dictionary(pa.int8(), pa.string())),
+    ("id", pa.string()),
+    ("split", pa.dictionary(pa.int8(), pa.string())),
+    ("type", pa.dictionary(pa.int8(), pa.string())),
+    ("text", pa.string()),
+    ("expression", pa.string()),
+    ("lemma", pa.string()),
+    ("start", pa.int32()),
+    ("end", pa.int32()),
+    ("figurative", pa.bool_()),
+    ("explanation", pa.string()),
+    ("language", pa.dictionary(pa.int8(), pa.string())),
+])
+
+# Records are first written unsorted in batches as they are read. Each batch
+# would carry its own dictionaries, which an IPC file cannot replace, so the
+# scratch file keeps plain strings and is dictionary-encoded once, as a whole
+SCRATCH_SCHEMA = pa.schema([
+    (field.name, field.type.value_type if pa.types.is_dictionary(field.type) else field.type)
+    for field in SCHEMA
+])
+
+INDEX_SCHEMA = pa.schema([
+    ("split", pa.string()),
+    ("lemma", pa.string()),
+    ("offset", pa.int64()),
+    ("length", pa.int64()),
+])
+
+#### Writing ####
+
+def _write_batches(path: str, records: Iterable[CorpusRecord], batch_size: int) -> None:
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, SCRATCH_SCHEMA) as writer:
+        batch: list[dict] = []
+        for record in records:
+            batch.append(record.model_dump())
+            if len(batch) >= batch_size:
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=SCRATCH_SCHEMA))
+                batch = []
+        if batch:
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=SCRATCH_SCHEMA))
+
+def write_corpus(
+    directory: str, corpus: str, records: Iterable[CorpusRecord],
+    sources: list[str], batch_size: int = 10_000,
+) -> CorpusInfo:
+    """
+    Writes records as a corpus directory. Records are first streamed to a
+    scratch file and then sorted from its memory map, so memory use is
+    bounded by the sort permutation rather than the corpus size.
+    """
+    os.makedirs(directory, exist_ok=True)
+    scratch = os.path.join(directory, "data.arrow.unsorted")
+    _write_batches(scratch, records, batch_size)
+
+    with pa.memory_map(scratch) as source:
+        # One dictionary per column for all batches of the sorted file
+        table = pa.ipc.open_file(source).read_all().cast(SCHEMA).unify_dictionaries()
+        order = pc.sort_indices(
+            pa.table({"split": table["split"].cast(pa.string()), "lemma": table["lemma"]}),
+            sort_keys=[("split", "ascending"), ("lemma", "ascending")],
+        )
+
+        tmp = os.path.join(directory, "data.arrow.tmp")
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, SCHEMA) as writer:
+            for offset in range(0, len(order), batch_size):
+                writer.write_table(table.take(order[offset:offset + batch_size]))
+
+        split_column = table["split"].cast(pa.string()).take(order)
+        lemma_column = table["lemma"].take(order)
+    os.remove(scratch)
+
+    # Run-length encode the sorted (split, lemma) columns into row ranges
+    index: dict[str, list] = {"split": [], "lemma": [], "offset": [], "length": []}
+    previous = None
+    for row, key in enumerate(zip(split_column.to_pylist(), lemma_column.to_pylist())):
+        if key != previous:
+            index["split"].append(key[0])
+            index["lemma"].append(key[1])
+            index["offset"].append(row)
+            index["length"].append(0)
+            previous = key
+        index["length"][-1] += 1
+    with pa.OSFile(os.path.join(directory, "index.arrow.tmp"), "wb") as sink:
+        with pa.ipc.new_file(sink, INDEX_SCHEMA) as writer:
+            writer.write_table(pa.table(index, schema=INDEX_SCHEMA))
+
+    splits = Counter()
+    for split, length in zip(index["split"], index["length"]):
+        splits[split] += length
+    info = CorpusInfo(
+        corpus=corpus,
+        schema_version=SCHEMA_VERSION,
+        records=len(split_column),
+        splits=dict(splits),
+        lemmas=len(set(index["lemma"])),
+        sources=[os.path.basename(s) for s in sources],
+        created_at=datetime.datetime.now().isoformat(),
+    )
+    with open(os.path.join(directory, "meta.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump(info.model_dump(), f, indent=2)
+
+    # Swap all files in only once everything was written
+    for name in ("data.arrow", "index.arrow", "meta.json"):
+        os.replace(os.path.join(directory, f"{name}.tmp"), os.path.join(directory, name))
+    return info
+
+#### Reading ####
+
+class CorpusReader():
+    """
+    Streaming, memory-mapped access to a corpus directory.
+
+    Filtering by split and/or lemma only touches the matching row ranges.
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            self.info = CorpusInfo.model_validate(json.load(f))
+        if self.info.schema_version != SCHEMA_VERSION:
+            raise ValueError(
+                f"Corpus {directory} has schema version {self.info.schema_version},"
+                f" expected {SCHEMA_VERSION}; re-ingest it"
+            )
+        self._source = pa.memory_map(os.path.join(directory, "data.arrow"))
+        self._table = pa.ipc.open_file(self._source).read_all()
+        with pa.memory_map(os.path.join(directory, "index.arrow")) as source:
+            index = pa.ipc.open_file(source).read_all().to_pydict()
+        self._ranges: dict[tuple[str, str], tuple[int, int]] = {
+            (split, lemma): (offset, length)
+            for split, lemma, offset, length in zip(
+                index["split"], index["lemma"], index["offset"], index["length"],
+            )
+        }
+
+    def __len__(self) -> int:
+        return self._table.num_rows
+
+    def splits(self) -> list[str]:
+        return sorted(self.info.splits)
+
+    def lemmas(self, split: str | None = None) -> list[str]:
+        return sorted({l for s, l in self._ranges if split is None or s == split})
+
+    def ranges(self, split: str | None = None, lemma: str | None = None) -> list[tuple[int, int]]:
+        """The (offset, length) row ranges matching the filters, merged where adjacent."""
+        if split is not None and lemma is not None:
+            found = self._ranges.get((split, lemma))
+            return [found] if found else []
+        selected = sorted(
+            r for (s, l), r in self._ranges.items()
+            if (split is None or s == split) and (lemma is None or l == lemma)
+        )
+        merged: list[tuple[int, int]] = []
+        for offset, length in selected:
+            if merged and sum(merged[-1]) == offset:
+                merged[-1] = (merged[-1][0], merged[-1][1] + length)
+            else:
+                merged.append((offset, length))
+        return merged
+
+    def iter_batches(
+        self, split: str | None = None, lemma: str | None = None,
+        batch_size: int = 1024, columns: list[str] | None = None,
+    ) -> Iterator[pa.RecordBatch]:
+        table = self._table.select(columns) if columns else self._table
+        for offset, length in self.ranges(split, lemma):
+            yield from table.slice(offset, length).to_batches(max_chunksize=batch_size)
+
+    def iter_records(
+        self, split: str | None = None, lemma: str | None = None, batch_size: int = 1024,
+    ) -> Iterator[CorpusRecord]:
+        for batch in self.iter_batches(split, lemma, batch_size):
+            for row in batch.to_pylist():
+                yield CorpusRecord.model_validate(row)
+
+    def close(self) -> None:
+        self._table = None
+        self._source.close()
+
+    def __enter__(self) -> "CorpusReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,38 @@
+from typing import Literal
+
+from pydantic import BaseModel
+
+Split = Literal["train", "dev", "test"]
+ExpressionType = Literal["idiom", "conceptual_metaphor"]
+
+class CorpusRecord(BaseModel):
+    """
+    One annotated occurrence (or dictionary entry) of a figurative expression,
+    normalized across all source corpora.
+    """
+    corpus: str
+    id: str
+    split: Split
+    type: ExpressionType
+    # Context the expression occurs in; empty for dictionary entries without one
+    text: str = ""
+    # Surface form as it occurs in text
+    expression: str
+    # Canonical form used for indexing, e.g. "spill the beans" for "spilled the beans"
+    lemma: str
+    # Character offsets of the expression in text, or -1 when not annotated
+    start: int = -1
+    end: int = -1
+    # False for literal usages of a potentially figurative expression
+    figurative: bool = True
+    explanation: str | None = None
+    language: str = "en"
+
+class CorpusInfo(BaseModel):
+    corpus: str
+    schema_version: int
+    records: int
+    splits: dict[str, int]
+    lemmas: int
+    sources: list[str]
+    created_at: str
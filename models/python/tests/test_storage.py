@@ -0,0 +1,47 @@
+from models.operations.corpora.storage import CorpusReader, write_corpus
+from models.types.corpora import CorpusRecord
+
+SPLITS = ("train", "dev", "test")
+TYPES = ("idiom", "conceptual_metaphor")
+
+def make_records(n: int) -> list[CorpusRecord]:
+    return [
+        CorpusRecord(
+            corpus="test",
+            id=str(i),
+            split=SPLITS[i % 3],
+            # Values first appear in a different order in different batches
+            type=TYPES[(i // 5) % 2],
+            text=f"Sentence {i} with lemma {i % 7}.",
+            expression=f"lemma {i % 7}",
+            lemma=f"lemma {i % 7}",
+            start=len(f"Sentence {i} with "),
+            end=len(f"Sentence {i} with lemma {i % 7}"),
+            explanation=None if i % 4 else f"explanation {i}",
+            language="en" if i % 11 else "de",
+        )
+        for i in range(n)
+    ]
+
+def test_round_trip_over_several_batches(tmp_path):
+    records = make_records(30)
+    info = write_corpus(str(tmp_path), "test", records, ["source.jsonl"], batch_size=4)
+
+    assert info.records == 30
+    assert info.splits == {split: 10 for split in SPLITS}
+    with CorpusReader(str(tmp_path)) as reader:
+        assert len(reader) == 30
+        read = list(reader.iter_records())
+    assert sorted(read, key=lambda r: int(r.id)) == records
+    assert [(r.split, r.lemma) for r in read] == sorted((r.split, r.lemma) for r in records)
+
+def test_filters_by_split_and_lemma(tmp_path):
+    records = make_records(30)
+    write_corpus(str(tmp_path), "test", records, ["source.jsonl"], batch_size=4)
+
+    with CorpusReader(str(tmp_path)) as reader:
+        assert reader.splits() == sorted(SPLITS)
+        found = list(reader.iter_records(split="dev", lemma="lemma 3"))
+    assert sorted(r.id for r in found) == sorted(
+        r.id for r in records if r.split == "dev" and r.lemma == "lemma 3"
+    )
@@ -0,0 +1,76 @@
+"""
+Latency and bytes of repeat reads of stored adaptations.
+
+Stores --count synthetic adaptations of each size, then reads one adaptation
+(GET /api/adaptations/{id}) and the first list page (GET /api/adaptations)
+over and over in-process, three ways: re-rendered from the store every time
+(ADAPTATION_RESPONSE_CACHE_ENTRIES=0), from the rendered-response cache, and
+revalidated with If-None-Match as a polling client with the previous response
+would (304, no body). Reports milliseconds and response bytes per read.
+
+Usage:
+    python bench/adaptation_reads.py [--words 500 5000] [--reads 200]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+os.environ.update({
+    "OPENROUTER_API_KEY": "stub",
+    "LANGCHAIN_TRACING_V2": "false",
+    "LOG_LEVEL": "WARNING",
+})
+
+import conf
+from response_size import make_state
+
+MODES = ("uncached", "cached", "304")
+
+def measure(client, path: str, mode: str, reads: int) -> tuple[float, float]:
+    """Milliseconds and bytes per read of `path` in the given mode."""
+    os.environ["ADAPTATION_RESPONSE_CACHE_ENTRIES"] = "0" if mode == "uncached" else "1000"
+    conf.reload()
+    etag = client.get(path).headers["etag"]
+    headers = {"If-None-Match": etag} if mode == "304" else {}
+    size = 0
+    start = time.perf_counter()
+    for _ in range(reads):
+        response = client.get(path, headers=headers)
+        size += len(response.content)
+    return (time.perf_counter() - start) / reads * 1000, size / reads
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", nargs="+", type=int, default=[500, 5_000], help="Words per adaptation")
+    parser.add_argument("--count", type=int, default=10, help="Adaptations stored per size, one list page")
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+    import main as app
+    from routes.adaptation import close_adaptation_store, get_adaptation_store, new_record
+    from workflows import usage
+
+    client = TestClient(app.app)
+    print(f"{'words':>6} {'read':>7} {'mode':>9} {'ms/read':>8} {'bytes/read':>11}")
+    for words in args.words:
+        close_adaptation_store()
+        store = get_adaptation_store()
+        records = [new_record(*make_state(words, words // 50, seed=i)) for i in range(args.count)]
+        for record in records:
+            store.put(record["id"], record, owner=usage.ANONYMOUS)
+        paths = {
+            "detail": f"/api/adaptations/{records[0]['id']}",
+            "list": f"/api/adaptations?pageSize={args.count}",
+        }
+        for read, path in paths.items():
+            for mode in MODES:
+                ms, size = measure(client, path, mode, args.reads)
+                print(f"{words:>6} {read:>7} {mode:>9} {ms:>8.3f} {size:>11.0f}")
+
+if __name__ == "__main__":
+    main()
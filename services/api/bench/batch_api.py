@@ -0,0 +1,104 @@
+"""
+Throughput and cost of bulk adaptation, synchronous or through the batch API.
+
+Runs the same records through the `adapt` CLI's worker pool against the stub
+upstream, once with synchronous chat completions at --concurrency records in
+flight (the stub computing at most --capacity completions at once, like a
+provider's rate limit) and once with --batch-api, where the calls of all
+records in flight are collected into batch jobs that the stub answers after
+--batch-latency seconds whatever their size. Reports records per second,
+upstream requests and batch jobs, and the cost per 1k records at the
+MODEL_PRICES of the stub model (batched calls at BATCH_API_PRICE_FACTOR).
+
+Usage:
+    python bench/batch_api.py [--records 500] [--capacity 8] [--batch-latency 2]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import stub_upstream
+
+TEXTS = [
+    "He promised not to spill the beans, but time is money and he had to hit the sack.",
+    "Let's break the ice before the meeting starts.",
+    "The exam was a piece of cake, so she was over the moon.",
+    "They decided to bite the bullet and cut corners on the budget.",
+]
+
+MODEL = "stub/model"
+
+def counter(name: str) -> float:
+    from utils import metrics
+    counters = metrics.snapshot()["counters"]
+    return sum(value for key, value in counters.items() if key == name or key.startswith(name + "{"))
+
+def run(records: int, concurrency: int, batch_api: bool) -> dict:
+    import cli
+    from workflows import llm, metaphor
+
+    # Fresh clients, caches and batchers for each mode
+    metaphor.close()
+    llm.close()
+    before = {name: counter(name) for name in ("llm_cost_usd_total", "llm_calls_total", "batch_api_jobs_total")}
+    progress = cli.Progress(skipped=0, interval=3600)
+    # Distinct texts, so that no run is answered from the expression cache
+    items = (cli.Record(i, str(i), f"{TEXTS[i % len(TEXTS)]} ({i})") for i in range(records))
+    start = time.perf_counter()
+    with tempfile.TemporaryFile("w") as out:
+        cli.run(items, out, cli.Checkpoint(), concurrency, progress, batch_api=batch_api)
+    elapsed = time.perf_counter() - start
+    delta = {name: counter(name) - value for name, value in before.items()}
+    return {
+        "seconds": elapsed,
+        "per_second": progress.done / elapsed,
+        "failed": progress.failed,
+        "calls": delta["llm_calls_total"],
+        "jobs": delta["batch_api_jobs_total"],
+        "cost_per_1k": delta["llm_cost_usd_total"] / max(progress.done, 1) * 1000,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16, help="Records in flight on the synchronous path")
+    parser.add_argument("--batch-concurrency", type=int, default=2000, help="Records in flight on the batch path")
+    parser.add_argument("--capacity", type=int, default=8, help="Concurrent completions of the stub")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub seconds per completion")
+    parser.add_argument("--batch-latency", type=float, default=2.0, help="Stub seconds per batch job")
+    parser.add_argument("--port", type=int, default=8906)
+    args = parser.parse_args()
+
+    stub_upstream.serve(args.port, args.latency, concurrency=args.capacity, batch_latency=args.batch_latency)
+    os.environ.update({
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{args.port}/v1",
+        "OPENROUTER_API_KEY": "stub",
+        "OPENROUTER_MODEL": MODEL,
+        "CASCADE_MODEL": "",
+        "MODEL_PRICES": f'{{"{MODEL}": {{"input": 0.15, "output": 0.6}}}}',
+        "EXPRESSION_CACHE_ENABLED": "false",
+        "CHECKPOINTS_ENABLED": "false",
+        "GUARDRAIL_ENABLED": "false",
+        "BATCH_API_MAX_WAIT_SECONDS": "0.5",
+        "BATCH_API_POLL_SECONDS": "0.25",
+        "LOG_LEVEL": "WARNING",
+    })
+    from workflows.metaphor import get_graph
+    get_graph()
+
+    print(f"{args.records} records, stub capacity {args.capacity} at {args.latency:g}s per completion, {args.batch_latency:g}s per batch job")
+    print(f"{'mode':>6} {'records/s':>10} {'seconds':>8} {'failed':>7} {'calls':>7} {'jobs':>5} {'USD/1k':>8}")
+    for name, concurrency, batch_api in (("sync", args.concurrency, False), ("batch", args.batch_concurrency, True)):
+        row = run(args.records, concurrency, batch_api)
+        print(
+            f"{name:>6} {row['per_second']:>10.2f} {row['seconds']:>8.1f} {row['failed']:>7}"
+            f" {row['calls']:>7.0f} {row['jobs']:>5.0f} {row['cost_per_1k']:>8.4f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Throughput, token savings and added latency of detection micro-batching.
+
+Sends short single-sentence texts through the full workflow at a fixed
+arrival rate against the local stub upstream, once per batching window
+(BATCH_MAX_WAIT_MS, 0 = no batching). The upstream rate limit makes the
+upstream the bottleneck, as a provider's rate limit would. Reports
+throughput, latency percentiles, upstream calls and prompt/completion tokens
+per request, and the mean batch size.
+
+Usage:
+    python bench/batching.py [--requests 300] [--rate 40] [--windows 0 10 25 50 100]
+        [--upstream-rpm 1200] [--latency 0.3] [--max-tokens 2000]
+"""
+
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import conf
+import stub_upstream
+from utils import metrics
+
+SUBJECTS = ["My sister", "The new manager", "Our neighbour", "The team", "Everyone at the party", "The old man"]
+PLAIN = [
+    "went home early after the meeting.",
+    "bought fresh bread at the market.",
+    "wrote a long letter to the council.",
+    "painted the kitchen a pale blue.",
+    "waited for the bus in the rain.",
+]
+FIGURATIVE = [
+    "tried to break the ice with a joke.",
+    "said the exam was a piece of cake.",
+    "was feeling under the weather all week.",
+    "decided to hit the sack before midnight.",
+]
+
+def texts(n: int, seed: int = 0) -> list[str]:
+    """Short sentences, a quarter of them with an idiom."""
+    rng = random.Random(seed)
+    return [
+        f"{rng.choice(SUBJECTS)} {rng.choice(FIGURATIVE if rng.random() < 0.25 else PLAIN)}"
+        for _ in range(n)
+    ]
+
+def counters() -> dict[str, float]:
+    return metrics.snapshot()["counters"]
+
+def delta(before: dict, after: dict, prefix: str, label: str = "") -> float:
+    return sum(v - before.get(k, 0) for k, v in after.items() if k.startswith(prefix) and label in k)
+
+def run(window_ms: float, workload: list[str], rate: float) -> dict:
+    from workflows import metaphor
+
+    os.environ["BATCH_MAX_WAIT_MS"] = str(window_ms)
+    conf.reload()
+    metaphor.close()
+    before = counters()
+    latencies: list[float] = []
+
+    def one(text: str) -> None:
+        start = time.perf_counter()
+        metaphor.process_text(text)
+        latencies.append(time.perf_counter() - start)
+
+    # Open-loop arrivals, so that batching cannot slow down the arrival rate
+    rng = random.Random(1)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=512) as pool:
+        for text in workload:
+            pool.submit(one, text)
+            time.sleep(rng.expovariate(rate))
+    elapsed = time.perf_counter() - start
+
+    after = counters()
+    latencies.sort()
+    n = len(latencies)
+    dispatches = delta(before, after, "batch_dispatches_total")
+    return {
+        "window_ms": window_ms,
+        "throughput": n / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[max(0, math.ceil(0.95 * n) - 1)] * 1000,
+        "calls": delta(before, after, "llm_calls_total") / n,
+        "input_tokens": delta(before, after, "llm_tokens_total", "kind=input") / n,
+        "output_tokens": delta(before, after, "llm_tokens_total", "kind=output") / n,
+        "batch_size": delta(before, after, "batch_items_total") / dispatches if dispatches else 1.0,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=40, help="Arriving requests per second")
+    parser.add_argument("--windows", nargs="+", type=float, default=[0, 10, 25, 50, 100])
+    parser.add_argument("--upstream-rpm", type=float, default=1200)
+    parser.add_argument("--latency", type=float, default=0.3, help="Stub seconds per completion")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Stub seconds per completion token")
+    parser.add_argument("--max-tokens", type=int, default=2000, help="BATCH_MAX_TOKENS")
+    parser.add_argument("--port", type=int, default=8902)
+    args = parser.parse_args()
+
+    stub_upstream.serve(args.port, args.latency, token_latency=args.token_latency)
+    os.environ.update({
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{args.port}/v1",
+        "OPENROUTER_API_KEY": "stub",
+        "UPSTREAM_RATE_LIMIT_RPM": str(args.upstream_rpm),
+        "BATCH_MAX_TOKENS": str(args.max_tokens),
+        # Measure the upstream calls themselves, not the caches or guardrail
+        "EXPRESSION_CACHE_ENABLED": "false",
+        "CHECKPOINTS_ENABLED": "false",
+        "GUARDRAIL_ENABLED": "false",
+    })
+    from workflows.metaphor import get_graph
+    get_graph()
+
+    workload = texts(args.requests)
+    print(f"{len(workload)} requests at {args.rate:g}/s, upstream limit {args.upstream_rpm:g} rpm")
+    print(f"{'window ms':>9} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'calls/req':>9} {'in tok/req':>10} {'out tok/req':>11} {'batch':>6}")
+    for window in args.windows:
+        row = run(window, workload, args.rate)
+        print(
+            f"{row['window_ms']:>9g} {row['throughput']:>7.1f} {row['p50_ms']:>8.0f} {row['p95_ms']:>8.0f}"
+            f" {row['calls']:>9.2f} {row['input_tokens']:>10.0f} {row['output_tokens']:>11.0f} {row['batch_size']:>6.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Latency/quality trade-off of the model cascade on the evaluation corpora.
+
+Runs the test split of corpora ingested with models.operations.corpora
+through the full workflow once per policy: the strong model alone, the small
+model alone, and the cascade at each confidence threshold. Detection is
+scored against the gold spans (an expression counts as found when a detected
+span overlaps it; detections in literal usages are false positives), and
+latency, escalation rate and cost are reported next to it.
+
+Usage:
+    python bench/cascade.py data/corpora --strong <model> --small <model> \\
+        [--corpora magpie semeval2022 vuamc] [--limit 200] [--thresholds 0.6 0.8 0.9]
+    python bench/cascade.py data/corpora --stub   # offline dry run against stub_upstream
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import conf
+import stub_upstream
+from models.operations.corpora import open_corpus
+from utils import metrics
+from workflows import usage
+from workflows.embeddings import get_encoder
+from workflows.llm import get_llm
+from workflows.metaphor import get_graph, process_text
+
+def load(root: str, corpora: list[str], limit: int) -> dict[str, list[tuple[int, int, bool]]]:
+    """Up to `limit` test texts per corpus, with their (start, end, figurative) gold spans."""
+    texts: dict[str, list[tuple[int, int, bool]]] = {}
+    for corpus in corpora:
+        selected = 0
+        with open_corpus(root, corpus) as reader:
+            for record in reader.iter_records(split="test"):
+                if not record.text or record.start < 0:
+                    continue
+                if record.text not in texts:
+                    if selected >= limit:
+                        continue
+                    texts[record.text] = []
+                    selected += 1
+                texts[record.text].append((record.start, record.end, record.figurative))
+    return texts
+
+def score(expressions: list[dict], gold: list[tuple[int, int, bool]]) -> tuple[int, int, int]:
+    """Returns (true positives, false positives, false negatives)."""
+    figurative = [(s, e) for s, e, f in gold if f]
+    overlaps = lambda a, b: a[0] < b[1] and b[0] < a[1]
+    predicted = [(e["startIndex"], e["endIndex"]) for e in expressions]
+    tp = sum(any(overlaps(p, g) for g in figurative) for p in predicted)
+    fn = sum(not any(overlaps(p, g) for p in predicted) for g in figurative)
+    return tp, len(predicted) - tp, fn
+
+def cascade_counts() -> dict[str, float]:
+    counters = metrics.snapshot()["counters"]
+    return {k: v for k, v in counters.items() if k.startswith("cascade_results_total")}
+
+def run(policy: str, env: dict[str, str], texts: dict, concurrency: int) -> dict:
+    os.environ.update(env)
+    if "CASCADE_MODEL" not in env:
+        os.environ.pop("CASCADE_MODEL", None)
+    conf.reload()
+    before = cascade_counts()
+
+    def one(item):
+        text, gold = item
+        with usage.track() as request_usage:
+            start = time.perf_counter()
+            state = process_text(text)
+            latency = time.perf_counter() - start
+        return latency, score(state["expressions"], gold), request_usage.report()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, texts.items()))
+
+    after = cascade_counts()
+    delta = lambda outcome: sum(
+        v - before.get(k, 0) for k, v in after.items() if f"outcome={outcome}" in k
+    )
+    latencies = sorted(r[0] for r in results)
+    tp, fp, fn = (sum(r[1][i] for r in results) for i in range(3))
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    accepted, escalated = delta("accepted"), delta("escalated")
+    return {
+        "policy": policy,
+        "texts": len(results),
+        "p50_s": statistics.median(latencies),
+        "p95_s": latencies[max(0, math.ceil(0.95 * len(latencies)) - 1)],
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "escalated": escalated / (accepted + escalated) if accepted + escalated else 0.0,
+        "guardrail_retries": delta("rejected"),
+        "cost_usd": sum(r[2]["costUsd"] for r in results),
+        "tokens": sum(r[2]["inputTokens"] + r[2]["outputTokens"] for r in results),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora_root", help="Root directory of the ingested corpora")
+    parser.add_argument("--corpora", nargs="+", default=["magpie", "semeval2022", "vuamc"])
+    parser.add_argument("--limit", type=int, default=200, help="Texts per corpus")
+    parser.add_argument("--strong", help="Strong model (default: OPENROUTER_MODEL)")
+    parser.add_argument("--small", help="Cascade model")
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[0.6, 0.8, 0.9])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--stub", action="store_true", help="Use a local stub upstream")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    os.environ["EXPRESSION_CACHE_ENABLED"] = "false"
+    if args.stub:
+        stub_upstream.serve(8901, 0.4, {"small": 0.1})
+        os.environ.update({
+            "OPENROUTER_BASE_URL": "http://127.0.0.1:8901/v1",
+            "OPENROUTER_API_KEY": "stub",
+        })
+        args.strong, args.small = args.strong or "strong", args.small or "small"
+    conf.reload()
+    strong = args.strong or os.environ.get("OPENROUTER_MODEL")
+    if not strong or not args.small:
+        parser.error("--strong (or OPENROUTER_MODEL) and --small are required")
+
+    texts = load(args.corpora_root, args.corpora, args.limit)
+    # Keep one-off startup costs out of the first policy's latencies
+    get_graph()
+    get_encoder()
+    get_llm(strong), get_llm(args.small)
+    policies = [
+        ("strong", {"OPENROUTER_MODEL": strong}),
+        ("small", {"OPENROUTER_MODEL": args.small}),
+    ] + [
+        (f"cascade@{t}", {
+            "OPENROUTER_MODEL": strong,
+            "CASCADE_MODEL": args.small,
+            "CASCADE_CONFIDENCE_THRESHOLD": str(t),
+        })
+        for t in args.thresholds
+    ]
+
+    report = []
+    print(f"{len(texts)} texts from {', '.join(args.corpora)}")
+    print(f"{'policy':<14} {'p50 s':>7} {'p95 s':>7} {'prec':>6} {'recall':>6} {'F1':>6} {'escal':>6} {'retry':>6} {'cost $':>9}")
+    for name, env in policies:
+        row = run(name, env, texts, args.concurrency)
+        report.append(row)
+        print(
+            f"{name:<14} {row['p50_s']:>7.2f} {row['p95_s']:>7.2f} {row['precision']:>6.1%}"
+            f" {row['recall']:>6.1%} {row['f1']:>6.1%} {row['escalated']:>6.1%}"
+            f" {row['guardrail_retries']:>6.0f} {row['cost_usd']:>9.4f}"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Peak memory of adapting a document by size, streamed or as one JSON body.
+
+Sends generated plain-text documents of increasing size against the stub
+upstream, once streamed to /adapt/document and once as the `text` of a single
+/adapt request. Each measurement serves the app with uvicorn in a fresh
+process and reports the time taken and how far the peak RSS of the process
+grew above its level after warm-up; the streamed upload should stay flat as
+the size grows.
+
+Usage:
+    python bench/documents.py [--sizes 1 4 8] [--chunk-chars 16000] [--latency 0]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from typing import Iterator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import stub_upstream
+
+# Literal text, so that the run is dominated by reading and chunking rather
+# than by simplifying expressions
+PARAGRAPH = (
+    "The committee met on Tuesday to review the budget for the coming year."
+    " Members discussed the new library and the repairs to the old bridge.\n\n"
+).encode()
+
+def document(size: int, block_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Yields `size` bytes of text without holding the whole document."""
+    block = PARAGRAPH * (block_size // len(PARAGRAPH))
+    sent = 0
+    while sent < size:
+        data = block[:size - sent]
+        sent += len(data)
+        yield data
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+def measure(args: argparse.Namespace, mode: str, size: int) -> None:
+    """Serves the app in this process and prints the seconds taken and peak RSS growth."""
+    stub_upstream.serve(args.port, args.latency)
+    os.environ.update({
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{args.port}/v1",
+        "OPENROUTER_API_KEY": "stub",
+        "EXPRESSION_CACHE_ENABLED": "false",
+        "CHECKPOINTS_ENABLED": "false",
+        "GUARDRAIL_ENABLED": "false",
+        "REQUEST_TIMEOUT_SECONDS": "0",
+        "DOCUMENT_CHUNK_CHARS": str(args.chunk_chars),
+        "DOCUMENT_MAX_BYTES": str(size + 1),
+        "LOG_LEVEL": "WARNING",
+    })
+    import httpx
+    import uvicorn
+    import main as app
+
+    server = uvicorn.Server(uvicorn.Config(app.app, port=args.port + 1, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    client = httpx.Client(base_url=f"http://127.0.0.1:{args.port + 1}", timeout=None)
+    while not server.started:
+        time.sleep(0.05)
+    while client.get("/ready").status_code != 200:
+        time.sleep(0.1)
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "stream":
+        with client.stream("POST", "/adapt/document?filename=doc.txt", content=document(size)) as response:
+            response.raise_for_status()
+            # Read the result line by line rather than all at once
+            for line in response.iter_lines():
+                last = line
+        assert json.loads(last)["done"]
+    else:
+        text = b"".join(document(size)).decode()
+        client.post("/adapt", json={"text": text, "compact": True}).raise_for_status()
+    print(json.dumps({"seconds": time.perf_counter() - start, "rss_mb": peak_rss_mb() - baseline}))
+    server.should_exit = True
+
+def run(args: argparse.Namespace, mode: str, size: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--measure", mode, str(size), *sys.argv[1:]],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1, 4, 8], help="Document sizes in MB")
+    parser.add_argument("--chunk-chars", type=int, default=16000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub seconds per completion")
+    parser.add_argument("--skip-json", action="store_true", help="Only measure the streamed upload")
+    parser.add_argument("--port", type=int, default=8905)
+    parser.add_argument("--measure", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(args, args.measure[0], int(args.measure[1]))
+        return
+
+    print(f"{'MB':>6} {'streamed s':>10} {'RSS MB':>8} {'json s':>8} {'RSS MB':>8}")
+    for mb in args.sizes:
+        size = int(mb * 2**20)
+        streamed = run(args, "stream", size)
+        row = f"{mb:>6g} {streamed['seconds']:>10.1f} {streamed['rss_mb']:>8.1f}"
+        if not args.skip_json:
+            whole = run(args, "json", size)
+            row += f" {whole['seconds']:>8.1f} {whole['rss_mb']:>8.1f}"
+        print(row)
+
+if __name__ == "__main__":
+    main()
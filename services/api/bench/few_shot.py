@@ -0,0 +1,118 @@
+"""
+Lookup latency and recall of the few-shot example index against exact
+brute-force search, on synthetic clustered embeddings of increasing size.
+Then the latency of a whole retrieval as detection pays it, encoding
+included, by number of sentences in the text, with the configured
+EMBEDDING_MODEL (EMBEDDING_MODEL=hashing runs offline).
+
+Usage:
+    python bench/few_shot.py [--dim 384] [--queries 200] [--texts 50]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import conf
+from workflows import examples as few_shot
+from workflows.embeddings import get_encoder, normalize_rows
+from workflows.examples import ExampleIndex, write_index
+
+WORDS = ["river", "market", "teacher", "storm", "garden", "letter", "engine", "winter", "bridge", "song"]
+VERBS = ["crossed", "watched", "painted", "followed", "repaired", "carried", "opened", "missed"]
+
+def make_vectors(n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    topics = normalize_rows(rng.normal(size=(max(1, n // 50), dim)))
+    return normalize_rows(topics[rng.integers(len(topics), size=n)] + rng.normal(scale=0.04, size=(n, dim)))
+
+def make_sentences(n: int, rng: np.random.Generator) -> list[str]:
+    return [
+        f"The {rng.choice(WORDS)} {rng.choice(VERBS)} the {rng.choice(WORDS)} near the {rng.choice(WORDS)}."
+        for _ in range(n)
+    ]
+
+def retrieval(texts: int, rng: np.random.Generator, n: int = 10_000) -> None:
+    """Milliseconds per retrieve() call, encoding the text included."""
+    encoder = get_encoder()
+    sentences = make_sentences(n, rng)
+    examples = {
+        "text": sentences,
+        "expression": [s.split()[1] for s in sentences],
+        "type": ["idiom"] * n,
+        "lemma": [f"lemma {i}" for i in range(n)],
+        "explanation": [None] * n,
+    }
+    vectors = np.concatenate([encoder.encode(sentences[i:i + 256]) for i in range(0, n, 256)])
+    with tempfile.TemporaryDirectory() as directory:
+        write_index(directory, examples, vectors, {"encoder": encoder.name})
+        os.environ["FEW_SHOT_INDEX_PATH"] = directory
+        conf.reload()
+        few_shot.close()
+        few_shot.get_index()
+
+        print(f"\nretrieval with {encoder.name} over {n} examples")
+        print(f"{'sentences':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for count in (1, 8, 32):
+            latencies = []
+            for _ in range(texts):
+                text = " ".join(make_sentences(count, rng))
+                start = time.perf_counter()
+                few_shot.retrieve(text)
+                latencies.append((time.perf_counter() - start) * 1000)
+            print(f"{count:>9} {np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 99):>8.3f}")
+        few_shot.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--texts", type=int, default=50, help="Texts per size in the retrieval run")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'examples':>9} {'build s':>8} {'p50 ms':>8} {'p99 ms':>8} {'brute ms':>9} {'recall':>7}")
+    for n in (1_000, 10_000, 100_000):
+        vectors = make_vectors(n, args.dim, rng)
+        examples = {
+            "text": [f"sentence {i}" for i in range(n)],
+            "expression": [f"expression {i}" for i in range(n)],
+            "type": ["idiom"] * n,
+            "lemma": [f"lemma {i}" for i in range(n)],
+            "explanation": [None] * n,
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            write_index(directory, examples, vectors, {"encoder": "synthetic"})
+            build = time.perf_counter() - start
+
+            index = ExampleIndex(directory)
+            queries = normalize_rows(vectors[rng.integers(n, size=args.queries)] + rng.normal(scale=0.05, size=(args.queries, args.dim)))
+            stored = np.asarray(index.vectors)
+            latencies, brute, hits = [], [], 0
+            for query in queries:
+                start = time.perf_counter()
+                rows = index.search(query[None, :], args.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+                start = time.perf_counter()
+                exact = np.argpartition(-(stored @ query), args.k)[:args.k]
+                brute.append((time.perf_counter() - start) * 1000)
+                hits += len(set(rows) & set(exact.tolist()))
+            index.close()
+
+        print(
+            f"{n:>9} {build:>8.2f} {np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 99):>8.3f}"
+            f" {np.median(brute):>9.3f} {hits / (args.k * len(queries)):>7.1%}"
+        )
+
+    retrieval(args.texts, rng)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Hit rate of the idiom dictionary and the simplification latency it saves.
+
+Builds a dictionary from corpora ingested with models.operations.corpora and
+simplifies the idiom occurrences of their test splits (in the context they
+occur in) once with the LLM only and once with the dictionary. Reports how
+many occurrences were found in their canonical form or as a variant, the
+lookup latency, and the latency, upstream calls and completion tokens per
+expression of both runs.
+
+Usage:
+    python bench/idioms.py data/corpora --corpora id10 magpie [--limit 500]
+    python bench/idioms.py data/corpora --stub   # offline dry run against stub_upstream
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import stub_upstream
+from models.operations.corpora import open_corpus
+from utils import metrics
+from workflows import idioms
+from workflows.metaphor import simplify
+import conf
+
+def load(root: str, corpora: list[str], limit: int) -> list[tuple[str, dict]]:
+    """Up to `limit` figurative idiom occurrences per corpus, as (text, expression)."""
+    occurrences = []
+    for corpus in corpora:
+        selected = 0
+        with open_corpus(root, corpus) as reader:
+            for record in reader.iter_records(split="test"):
+                if selected >= limit:
+                    break
+                if record.type != "idiom" or not record.figurative or not record.text or record.start < 0:
+                    continue
+                occurrences.append((record.text, {"type": "idiom", "startIndex": record.start, "endIndex": record.end}))
+                selected += 1
+    return occurrences
+
+def counters() -> dict[str, float]:
+    return metrics.snapshot()["counters"]
+
+def delta(before: dict, after: dict, prefix: str, label: str = "") -> float:
+    return sum(v - before.get(k, 0) for k, v in after.items() if k.startswith(prefix) and label in k)
+
+def run(occurrences: list[tuple[str, dict]], dictionary: str | None) -> dict:
+    os.environ["IDIOM_DICTIONARY_PATH"] = dictionary or ""
+    conf.reload()
+    idioms.close()
+    idioms.get_dictionary()
+    words = conf.get_expression_cache_conf().context_words
+
+    before = counters()
+    latencies = []
+    for text, expression in occurrences:
+        start = time.perf_counter()
+        simplify(text, expression, words)
+        latencies.append((time.perf_counter() - start) * 1000)
+    after = counters()
+    n = len(occurrences)
+    return {
+        "mean_ms": statistics.fmean(latencies),
+        "p50_ms": statistics.median(latencies),
+        "calls": delta(before, after, "llm_calls_total") / n,
+        "output_tokens": delta(before, after, "llm_tokens_total", "kind=output") / n,
+        "outcomes": {
+            outcome: delta(before, after, "idiom_lookups_total", f"outcome={outcome}") / n
+            for outcome in ("exact", "variant", "miss")
+        },
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora_root")
+    parser.add_argument("--corpora", nargs="+", default=["id10", "magpie"])
+    parser.add_argument("--dictionary", help="Dictionary directory; built from --corpora when omitted")
+    parser.add_argument("--limit", type=int, default=500, help="Occurrences per corpus")
+    parser.add_argument("--stub", action="store_true", help="Run against a local stub upstream")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub seconds per completion")
+    parser.add_argument("--port", type=int, default=8903)
+    args = parser.parse_args()
+
+    if args.stub:
+        stub_upstream.serve(args.port, args.latency, token_latency=0.01)
+        os.environ.update({
+            "OPENROUTER_BASE_URL": f"http://127.0.0.1:{args.port}/v1",
+            "OPENROUTER_API_KEY": "stub",
+        })
+
+    occurrences = load(args.corpora_root, args.corpora, args.limit)
+    if not occurrences:
+        sys.exit("No idiom occurrences with spans in the test splits")
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.dictionary is None:
+            count = idioms.build(args.corpora_root, directory, args.corpora, ["idiom"])
+            print(f"Built a dictionary of {count} idioms from {', '.join(args.corpora)}")
+            args.dictionary = directory
+
+        lookup = idioms.IdiomDictionary(args.dictionary)
+        lookups = []
+        for text, expression in occurrences:
+            start = time.perf_counter()
+            lookup.lookup(text[expression["startIndex"]:expression["endIndex"]])
+            lookups.append((time.perf_counter() - start) * 1_000_000)
+        lookup.close()
+
+        llm_only = run(occurrences, None)
+        with_dictionary = run(occurrences, args.dictionary)
+        idioms.close()
+
+    outcomes = with_dictionary["outcomes"]
+    print(f"{len(occurrences)} occurrences: {outcomes['exact']:.1%} exact, {outcomes['variant']:.1%} variant, {outcomes['miss']:.1%} not found")
+    print(f"Lookup p50 {statistics.median(lookups):.1f} µs, max {max(lookups):.1f} µs")
+    print(f"{'':>16} {'mean ms':>8} {'p50 ms':>8} {'calls':>6} {'out tok':>8}")
+    for name, row in (("LLM only", llm_only), ("with dictionary", with_dictionary)):
+        print(f"{name:>16} {row['mean_ms']:>8.0f} {row['p50_ms']:>8.0f} {row['calls']:>6.2f} {row['output_tokens']:>8.1f}")
+    print(f"Saved {llm_only['mean_ms'] - with_dictionary['mean_ms']:.0f} ms per expression")
+
+if __name__ == "__main__":
+    main()
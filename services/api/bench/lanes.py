@@ -0,0 +1,140 @@
+"""
+Interactive latency under bulk load, with and without priority lanes.
+
+Runs a steady stream of interactive requests from a few principals next to
+two bulk jobs in the batch lane (one with many more workers than the other)
+against the stub upstream, whose capacity is limited to --capacity
+concurrent completions like a provider's. Once with the upstream shared
+first come, first served (UPSTREAM_CONCURRENCY=0), once scheduled across
+lanes and principals (UPSTREAM_CONCURRENCY=--capacity). Reports the
+interactive latency percentiles, the throughput of each bulk job and the
+mean wait for an upstream slot per lane.
+
+Usage:
+    python bench/lanes.py [--seconds 20] [--rate 2] [--capacity 8] [--bulk-workers 24 8]
+"""
+
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import conf
+import stub_upstream
+from utils import metrics
+from workflows import priority, usage
+
+INTERACTIVE = [
+    "Let's break the ice before the meeting starts.",
+    "The exam was a piece of cake.",
+    "She was feeling under the weather.",
+]
+BULK = "He promised not to spill the beans, but time is money and he had to hit the sack."
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[max(0, math.ceil(p * len(values)) - 1)]
+
+def counters() -> dict[str, float]:
+    return metrics.snapshot()["counters"]
+
+def run(concurrency: int, seconds: float, rate: float, bulk_workers: list[int]) -> dict:
+    from workflows import metaphor
+
+    os.environ["UPSTREAM_CONCURRENCY"] = str(concurrency)
+    conf.reload()
+    priority.close()
+    metaphor.close()
+    before = counters()
+    stop = threading.Event()
+    latencies: list[float] = []
+    bulk_done = [0] * len(bulk_workers)
+
+    def bulk(job: int) -> None:
+        while not stop.is_set():
+            with usage.track(f"bulk-{job}"), priority.lane("batch"):
+                metaphor.process_text(BULK)
+            bulk_done[job] += 1
+
+    def interactive(i: int) -> None:
+        start = time.perf_counter()
+        with usage.track(f"user-{i % 3}"), priority.lane("interactive"):
+            metaphor.process_text(INTERACTIVE[i % len(INTERACTIVE)])
+        latencies.append(time.perf_counter() - start)
+
+    workers = [
+        threading.Thread(target=bulk, args=(job,), daemon=True)
+        for job, count in enumerate(bulk_workers) for _ in range(count)
+    ]
+    for worker in workers:
+        worker.start()
+    # Let the bulk jobs fill the upstream first
+    time.sleep(1)
+    rng = random.Random(0)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        i = 0
+        while time.perf_counter() - start < seconds:
+            pool.submit(interactive, i)
+            i += 1
+            time.sleep(rng.expovariate(rate))
+        elapsed = time.perf_counter() - start
+        stop.set()
+    for worker in workers:
+        worker.join()
+
+    after = counters()
+    delta = lambda name, lane: after.get(f"{name}{{lane={lane},scheduler=upstream}}", 0) - before.get(f"{name}{{lane={lane},scheduler=upstream}}", 0)
+    waits = {
+        lane: delta("scheduler_wait_ms_total", lane) / max(delta("scheduler_admitted_total", lane), 1)
+        for lane in ("interactive", "batch")
+    }
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "bulk": [done / elapsed for done in bulk_done],
+        "waits": waits,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--rate", type=float, default=2, help="Interactive requests per second")
+    parser.add_argument("--capacity", type=int, default=8, help="Concurrent completions of the stub")
+    parser.add_argument("--bulk-workers", nargs="+", type=int, default=[24, 8], help="Workers per bulk job")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub seconds per completion")
+    parser.add_argument("--port", type=int, default=8904)
+    args = parser.parse_args()
+
+    stub_upstream.serve(args.port, args.latency, concurrency=args.capacity)
+    os.environ.update({
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{args.port}/v1",
+        "OPENROUTER_API_KEY": "stub",
+        "EXPRESSION_CACHE_ENABLED": "false",
+        "CHECKPOINTS_ENABLED": "false",
+        "GUARDRAIL_ENABLED": "false",
+    })
+    from workflows.metaphor import get_graph
+    get_graph()
+
+    jobs = " ".join(f"{f'job {job}/s':>8}" for job in range(len(args.bulk_workers)))
+    print(f"Interactive at {args.rate:g}/s next to bulk jobs with {args.bulk_workers} workers, upstream capacity {args.capacity}")
+    print(f"{'upstream':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {jobs} {'wait int ms':>11} {'wait batch ms':>13}")
+    for name, concurrency in (("shared", 0), ("lanes", args.capacity)):
+        row = run(concurrency, args.seconds, args.rate, args.bulk_workers)
+        bulk = " ".join(f"{rate:>8.2f}" for rate in row["bulk"])
+        print(
+            f"{name:>10} {row['p50_ms']:>8.0f} {row['p95_ms']:>8.0f} {row['max_ms']:>8.0f} {bulk}"
+            f" {row['waits']['interactive']:>11.0f} {row['waits']['batch']:>13.0f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Health check and interactive latency under batch overload, with and without
+load shedding.
+
+Boots the API (one worker) against the stub upstream and floods it with
+large /adapt requests in the batch lane from --batch-clients clients, while a
+prober calls /health?quick=true every 100ms and a few clients send short
+interactive requests. Once with shedding off (LOAD_SHED_LAG_MS empty), once
+with --lag-ms and --in-flight as the batch lane's thresholds. Shed batch
+clients back off for --backoff seconds (not the full Retry-After, to keep the
+pressure on).
+Reports health check and interactive latency percentiles, the batch
+requests served and shed per second and the peak event loop lag.
+
+Usage:
+    python bench/loadshed.py [--duration 10] [--batch-clients 64] [--lag-ms 50] [--in-flight 16]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import stub_upstream
+from response_size import make_state
+from scaling import wait_ready
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INTERACTIVE = "When I arrived at the party, I tried to break the ice with my new colleagues."
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+def request(port: int, path: str, body: dict | None = None, lane: str | None = None) -> tuple[int, float]:
+    start = time.perf_counter()
+    headers = {"Content-Type": "application/json"}
+    if lane:
+        headers["X-Priority"] = lane
+    data = json.dumps(body).encode() if body is not None else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=data, headers=headers), timeout=120) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+def drive(args, port: int) -> dict:
+    stop = threading.Event()
+    health: list[float] = []
+    interactive: list[float] = []
+    batch = {"ok": 0, "shed": 0}
+    lag_ms = 0.0
+
+    def batch_client(i: int) -> None:
+        n = 0
+        while not stop.is_set():
+            text = make_state(args.words, args.words // 50, seed=i * 100_000 + n)[0]
+            status, _ = request(port, "/adapt", {"text": text, "compact": True}, "batch")
+            n += 1
+            if status == 503:
+                batch["shed"] += 1
+                time.sleep(args.backoff)
+            else:
+                batch["ok"] += 1
+
+    def interactive_client(i: int) -> None:
+        n = 0
+        while not stop.is_set():
+            status, seconds = request(port, "/adapt", {"text": f"{INTERACTIVE} ({i}, {n})"})
+            if status == 200:
+                interactive.append(seconds)
+            n += 1
+            time.sleep(0.5)
+
+    def prober() -> None:
+        nonlocal lag_ms
+        while not stop.is_set():
+            health.append(request(port, "/health?quick=true")[1])
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=120) as response:
+                lag_ms = max(lag_ms, json.load(response)["gauges"].get("event_loop_lag_ms", 0.0))
+            time.sleep(0.1)
+
+    workers = args.batch_clients + args.interactive_clients + 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(args.batch_clients):
+            pool.submit(batch_client, i)
+        for i in range(args.interactive_clients):
+            pool.submit(interactive_client, i)
+        pool.submit(prober)
+        time.sleep(args.duration)
+        stop.set()
+    return {
+        "health_p50_ms": percentile(health, 0.5) * 1000,
+        "health_p99_ms": percentile(health, 0.99) * 1000,
+        "interactive_p50_ms": percentile(interactive, 0.5) * 1000,
+        "interactive_p95_ms": percentile(interactive, 0.95) * 1000,
+        "batch_ok": batch["ok"] / args.duration,
+        "batch_shed": batch["shed"] / args.duration,
+        "lag_ms": lag_ms,
+    }
+
+def run(args, lag_ms: str, in_flight: str) -> dict:
+    env = {
+        **os.environ,
+        "HTTP_PORT": str(args.port),
+        "HTTP_WORKERS": "1",
+        "HTTP_AUTORELOAD": "false",
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{args.upstream_port}/v1",
+        "OPENROUTER_API_KEY": "stub",
+        "LANGCHAIN_TRACING_V2": "false",
+        "EXPRESSION_CACHE_ENABLED": "false",
+        "CHECKPOINTS_ENABLED": "false",
+        "LOAD_SHED_LAG_MS": lag_ms,
+        "LOAD_SHED_IN_FLIGHT": in_flight,
+        "LOG_LEVEL": "WARNING",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "src/main.py"], cwd=API_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(args.port)
+        return drive(args, args.port)
+    finally:
+        server.terminate()
+        server.wait()
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--batch-clients", type=int, default=64)
+    parser.add_argument("--interactive-clients", type=int, default=2)
+    parser.add_argument("--words", type=int, default=500, help="Words per batch request")
+    parser.add_argument("--lag-ms", type=float, default=50, help="Batch lane lag threshold when shedding")
+    parser.add_argument("--in-flight", type=int, default=16, help="Batch lane in-flight limit when shedding")
+    parser.add_argument("--backoff", type=float, default=0.5, help="Seconds a shed batch client waits")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub upstream latency (s)")
+    parser.add_argument("--port", type=int, default=8960)
+    parser.add_argument("--upstream-port", type=int, default=8907)
+    args = parser.parse_args()
+
+    upstream = stub_upstream.serve(args.upstream_port, args.latency)
+    print(f"{args.batch_clients} batch clients ({args.words} words), {args.interactive_clients} interactive clients, {args.duration:g}s")
+    print(
+        f"{'shedding':>8} {'health p50':>10} {'health p99':>10} {'inter p50':>9} {'inter p95':>9}"
+        f" {'batch/s':>8} {'shed/s':>7} {'peak lag ms':>11}"
+    )
+    try:
+        shed = (f"background={args.lag_ms},batch={args.lag_ms}", f"background={args.in_flight},batch={args.in_flight}")
+        for name, (lag_ms, in_flight) in (("off", ("", "")), ("on", shed)):
+            r = run(args, lag_ms, in_flight)
+            print(
+                f"{name:>8} {r['health_p50_ms']:>10.1f} {r['health_p99_ms']:>10.1f} {r['interactive_p50_ms']:>9.0f}"
+                f" {r['interactive_p95_ms']:>9.0f} {r['batch_ok']:>8.1f} {r['batch_shed']:>7.1f} {r['lag_ms']:>11.0f}"
+            )
+    finally:
+        upstream.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Micro-benchmarks of the API's hot paths, compared against stored baselines.
+
+Each benchmark times one small operation in-process (per call, median of
+several interleaved timeit runs), without network access or an upstream. Results can be
+saved as the baseline in bench/baselines/micro.json and later runs compared
+against it: a benchmark more than --threshold slower than its baseline is a
+regression, and the comparison then exits with status 1. Timings are
+compared as measured. A fixed pure-Python calibration workload is timed in
+the same run only to detect drift in machine speed: the comparison warns
+when it, the machine or the Python version differ from the baseline's, as
+baselines are only meaningful on the machine they were recorded on.
+
+New hot paths are added with the @benchmark decorator: the decorated setup
+function returns the operation to time.
+
+Usage:
+    python bench/micro.py [-k response]                # run and print
+    python bench/micro.py --save                       # record the baseline
+    python bench/micro.py --compare [--threshold 0.5]  # flag regressions
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import timeit
+from typing import Callable
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(API_DIR, "src"))
+
+os.environ.update({
+    "OPENROUTER_API_KEY": "stub",
+    "OPENROUTER_BASE_URL": "http://127.0.0.1:9/v1",
+    "LANGCHAIN_TRACING_V2": "false",
+    "TRACING_EXPORTER": "",
+    "LOG_LEVEL": "WARNING",
+})
+
+BASELINE_PATH = os.path.join(API_DIR, "bench", "baselines", "micro.json")
+
+# Fewer runs per comparison make the median too noisy to gate on
+MIN_COMPARE_REPEAT = 5
+# Change in the calibration timing beyond which the machine is considered
+# to run at a different speed than when the baseline was recorded
+CALIBRATION_DRIFT = 0.15
+
+BENCHMARKS: dict[str, Callable[[], Callable[[], object]]] = {}
+
+def benchmark(name: str):
+    def decorator(setup: Callable[[], Callable[[], object]]):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+#### Benchmarks ####
+
+@benchmark("env.parse")
+def env_parse():
+    import conf
+    from utils import env
+    return lambda: env.parse(conf.REQUEST_TIMEOUT_SECONDS)
+
+@benchmark("conf.get")
+def conf_get():
+    import conf
+    return conf.get_deadline_conf
+
+@benchmark("log.format")
+def log_format():
+    from utils import log
+    formatter = log.Formatter()
+    record = logging.LogRecord("routes.adaptation", logging.INFO, __file__, 1, "Adapted %d expressions\nin 2 lines", (12,), None)
+    return lambda: formatter.format(record)
+
+def sample_record(words: int = 5_000, expressions: int = 100) -> dict:
+    from response_size import make_state
+    from routes.adaptation import new_record
+    return new_record(*make_state(words, expressions))
+
+@benchmark("response.build")
+def response_build():
+    from routes.adaptation import build_response
+    record = sample_record()
+    return lambda: build_response(record)
+
+@benchmark("response.build_compact")
+def response_build_compact():
+    from routes.adaptation import build_compact_response
+    record = sample_record()
+    return lambda: build_compact_response(record)
+
+@benchmark("response.serialize")
+def response_serialize():
+    from routes.adaptation import build_response
+    from utils.responses import FastJSONResponse
+    response = build_response(sample_record())
+    return lambda: FastJSONResponse(response).body
+
+@benchmark("graph.compile")
+def graph_compile():
+    from workflows import metaphor
+    # get_graph() caches the compiled graph; time compiling it afresh
+    return lambda: metaphor.get_graph.__wrapped__()
+
+@benchmark("app.version")
+def app_version():
+    from routes.base import get_app_version
+    return get_app_version
+
+@benchmark("spans.split_sentences")
+def split_sentences():
+    from workflows.spans import split_sentences
+    text = sample_record()["originalText"]
+    text = ". ".join(text[i:i + 120] for i in range(0, len(text), 120))
+    return lambda: split_sentences(text)
+
+@benchmark("spans.locate")
+def locate():
+    from workflows.metaphor import locate
+    record = sample_record()
+    text = record["originalText"]
+    originals = [(text[e["startIndex"]:e["endIndex"]], e["startIndex"]) for e in record["expressions"]]
+
+    def run():
+        for original, offset in originals:
+            locate(text, original, offset)
+    return run
+
+@benchmark("cache.get")
+def cache_get():
+    from utils.cache import Cache
+    cache = Cache("bench", max_entries=10_000)
+    for i in range(10_000):
+        cache.put(f"key-{i}", {"explanation": "x", "simplifiedVersion": "y"})
+
+    def run():
+        cache.get("key-5000")
+        cache.get("missing")
+    return run
+
+@benchmark("documents.chunk")
+def chunk():
+    from workflows.documents import Chunker
+    text = sample_record(words=20_000)["originalText"]
+    text = ". ".join(text[i:i + 120] for i in range(0, len(text), 120))
+    pieces = [text[i:i + 16_384] for i in range(0, len(text), 16_384)]
+
+    def run():
+        chunker = Chunker(2000)
+        for piece in pieces:
+            for _ in chunker.feed(piece):
+                pass
+        for _ in chunker.finish():
+            pass
+    return run
+
+#### Runner ####
+
+def calibration() -> None:
+    words = [f"word-{i * 7919 % 1000}" for i in range(1000)]
+    sorted(words)
+    "".join(words).count("1")
+    sum(len(word) for word in words)
+
+def measure(operations: dict[str, Callable[[], object]], repeat: int) -> dict[str, float]:
+    """
+    Seconds per call of each operation, median of `repeat` runs of about
+    0.2s. The runs of all operations are interleaved, so that a slow spell of
+    the machine does not fall on one of them only.
+    """
+    timers = {name: timeit.Timer(operation) for name, operation in operations.items()}
+    numbers = {name: timer.autorange()[0] for name, timer in timers.items()}
+    runs: dict[str, list[float]] = {name: [] for name in operations}
+    for _ in range(repeat):
+        for name, timer in timers.items():
+            runs[name].append(timer.timeit(numbers[name]) / numbers[name])
+    return {name: statistics.median(seconds) for name, seconds in runs.items()}
+
+def environment() -> dict:
+    return {"machine": platform.machine(), "processor": platform.processor(), "python": platform.python_version()}
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-k", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=9)
+    parser.add_argument("--save", action="store_true", help="Record the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare with the baseline; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Slowdown over the baseline that counts as a regression")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+    if args.compare and args.repeat < MIN_COMPARE_REPEAT:
+        parser.error(f"--compare needs --repeat {MIN_COMPARE_REPEAT} or more")
+    logging.disable(logging.CRITICAL)
+
+    baseline = {}
+    if args.compare:
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        baseline = stored["results"]
+        if stored.get("environment") != environment():
+            print(f"warning: baseline recorded on {stored.get('environment')}, running on {environment()}", file=sys.stderr)
+
+    operations = {name: setup() for name, setup in BENCHMARKS.items() if args.k in name}
+    results = measure({"(calibration)": calibration, **operations}, args.repeat)
+    calibrate = results.pop("(calibration)")
+    suspects = {
+        name: operations[name] for name, seconds in results.items()
+        if name in baseline and seconds > baseline[name] * (1 + args.threshold)
+    }
+    if suspects:
+        # Measure apparent regressions again before reporting them, as a
+        # noisy neighbour can slow down a whole round
+        again = measure(suspects, args.repeat)
+        results.update({name: min(results[name], seconds) for name, seconds in again.items()})
+    regressions = []
+    print(f"{'benchmark':<24} {'µs/call':>10} {'baseline':>10} {'change':>8}")
+    row = f"{'(calibration)':<24} {calibrate * 1e6:>10.2f}"
+    if baseline:
+        row += f" {stored['calibration'] * 1e6:>10.2f} {calibrate / stored['calibration'] - 1:>+8.0%}"
+    print(row)
+    for name, seconds in results.items():
+        row = f"{name:<24} {seconds * 1e6:>10.2f}"
+        if name in baseline:
+            expected = baseline[name]
+            change = seconds / expected - 1
+            flag = " REGRESSION" if change > args.threshold else ""
+            if flag:
+                regressions.append(name)
+            row += f" {expected * 1e6:>10.2f} {change:>+8.0%}{flag}"
+        print(row)
+    if baseline and abs(calibrate / stored["calibration"] - 1) > CALIBRATION_DRIFT:
+        print(
+            f"warning: the calibration workload ran {calibrate / stored['calibration'] - 1:+.0%} against the"
+            " baseline's; the machine's speed has drifted, so changes may not be the code's",
+            file=sys.stderr,
+        )
+
+    if args.save:
+        previous = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f)
+            # Benchmarks not run this time (-k) keep their baseline
+            previous = stored["results"]
+        stored = {"environment": environment(), "calibration": calibrate, "results": {**previous, **results}}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved {len(results)} baselines to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
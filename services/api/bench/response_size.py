@@ -0,0 +1,68 @@
+"""
+Response size and serialization time of the full AdaptationResponse versus
+the offset-based CompactAdaptationResponse, for texts of increasing length.
+
+Usage:
+    python bench/response_size.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from routes.adaptation import build_compact_response, build_response, new_record
+from workflows.metaphor import get_edits
+from workflows.spans import apply_edits
+
+IDIOMS = ["break the ice", "a piece of cake", "spill the beans", "time is money", "under the weather"]
+FILLER = "the reader walked along the quiet road and thought about what had happened".split()
+
+def make_state(words: int, expressions: int, seed: int = 0) -> tuple[str, dict]:
+    """Builds a synthetic text of about `words` words and its workflow state."""
+    rng = random.Random(seed)
+    every = max(1, words // max(1, expressions))
+    parts, spans, position = [], [], 0
+    for i in range(words):
+        if i % every == 0 and len(spans) < expressions:
+            token = rng.choice(IDIOMS)
+            spans.append((position, position + len(token)))
+        else:
+            token = rng.choice(FILLER)
+        parts.append(token)
+        position += len(token) + 1
+    text = " ".join(parts)
+    state = {"expressions": [
+        {
+            "type": "idiom",
+            "startIndex": start,
+            "endIndex": end,
+            "explanation": f"An explanation of '{text[start:end]}' in plain words.",
+            "simplifiedVersion": "a plain phrase",
+        }
+        for start, end in spans
+    ]}
+    state["result"] = apply_edits(text, get_edits(state["expressions"]))
+    return text, state
+
+def measure(build, record: dict, number: int) -> tuple[int, float]:
+    body = build(record).model_dump_json()
+    seconds = timeit.timeit(lambda: build(record).model_dump_json(), number=number) / number
+    return len(body.encode()), seconds * 1000
+
+def main() -> None:
+    print(f"{'words':>7} {'exprs':>6} {'full KB':>8} {'full ms':>8} {'compact KB':>10} {'compact ms':>10} {'size':>6}")
+    for words, expressions in [(200, 5), (5_000, 100), (50_000, 500), (200_000, 2_000)]:
+        record = new_record(*make_state(words, expressions))
+        number = max(3, 2_000_000 // (words * 10))
+        full_size, full_ms = measure(build_response, record, number)
+        compact_size, compact_ms = measure(build_compact_response, record, number)
+        print(
+            f"{words:>7} {expressions:>6} {full_size / 1024:>8.1f} {full_ms:>8.2f}"
+            f" {compact_size / 1024:>10.1f} {compact_ms:>10.2f} {compact_size / full_size:>6.0%}"
+        )
+
+if __name__ == "__main__":
+    main()
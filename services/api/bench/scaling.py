@@ -0,0 +1,119 @@
+"""
+Throughput scaling of the API from 1 to N worker processes.
+
+Starts the stub upstream (see stub_upstream.py), then for each worker count
+boots the API with HTTP_WORKERS=n, drives it with concurrent /adapt clients
+for a fixed duration and reports throughput and latency percentiles.
+
+Usage:
+    python bench/scaling.py --max-workers 4 --clients 32 --duration 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import stub_upstream
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEXTS = [
+    "When I arrived at the party, I tried to break the ice with my new colleagues.",
+    "The exam was a piece of cake, so I left early.",
+    "Please don't spill the beans about the surprise party.",
+    "I was under the weather yesterday, so I decided to hit the sack early.",
+]
+
+def wait_ready(port: int, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"API on port {port} did not become ready")
+
+def post(port: int, text: str) -> float:
+    start = time.perf_counter()
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/adapt",
+        data=json.dumps({"text": text}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    urllib.request.urlopen(request, timeout=120).read()
+    return time.perf_counter() - start
+
+def drive(port: int, clients: int, duration: float) -> list[float]:
+    stop = time.monotonic() + duration
+
+    def client(i: int) -> list[float]:
+        latencies = []
+        n = 0
+        while time.monotonic() < stop:
+            # Vary the text per request so the expression cache does not dominate
+            text = f"{TEXTS[(i + n) % len(TEXTS)]} (client {i}, request {n})"
+            latencies.append(post(port, text))
+            n += 1
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        return [t for latencies in pool.map(client, range(clients)) for t in latencies]
+
+def run(workers: int, args) -> dict:
+    env = {
+        **os.environ,
+        "HTTP_PORT": str(args.port),
+        "HTTP_WORKERS": str(workers),
+        "HTTP_AUTORELOAD": "false",
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{args.upstream_port}/v1",
+        "OPENROUTER_API_KEY": "stub",
+        "LANGCHAIN_TRACING_V2": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "src/main.py"], cwd=API_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(args.port)
+        latencies = drive(args.port, args.clients, args.duration)
+    finally:
+        server.terminate()
+        server.wait()
+    latencies.sort()
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "rps": len(latencies) / args.duration,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub upstream latency (s)")
+    parser.add_argument("--port", type=int, default=8950)
+    parser.add_argument("--upstream-port", type=int, default=8900)
+    args = parser.parse_args()
+
+    upstream = stub_upstream.serve(args.upstream_port, args.latency)
+    print(f"{'workers':>7} {'requests':>8} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    try:
+        for workers in range(1, args.max_workers + 1):
+            r = run(workers, args)
+            print(f"{r['workers']:>7} {r['requests']:>8} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+    finally:
+        upstream.shutdown()
+
+if __name__ == "__main__":
+    main()
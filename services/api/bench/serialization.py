@@ -0,0 +1,50 @@
+"""
+Serialization cost of /adapt responses: FastAPI's default `response_model`
+path (re-validation, jsonable_encoder, json.dumps) versus FastJSONResponse,
+over realistic response sizes. Also checks both produce the same JSON.
+
+Usage:
+    python bench/serialization.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from response_size import make_state
+from routes.adaptation import AdaptationResponse, CompactAdaptationResponse, build_compact_response, build_response, new_record
+from utils.responses import FastJSONResponse
+
+FIELD = create_model_field("response", AdaptationResponse | CompactAdaptationResponse)
+LOOP = asyncio.new_event_loop()
+
+def default_path(model) -> bytes:
+    content = LOOP.run_until_complete(serialize_response(field=FIELD, response_content=model))
+    return JSONResponse(content).body
+
+def fast_path(model) -> bytes:
+    return FastJSONResponse(model).body
+
+def main() -> None:
+    print(f"{'words':>7} {'exprs':>6} {'shape':>8} {'default ms':>10} {'fast ms':>8} {'speedup':>8}")
+    for words, expressions in [(200, 5), (5_000, 100), (50_000, 500), (200_000, 2_000)]:
+        record = new_record(*make_state(words, expressions))
+        number = max(3, 1_000_000 // (words * 10))
+        for shape, build in [("full", build_response), ("compact", build_compact_response)]:
+            model = build(record)
+            if json.loads(default_path(model)) != json.loads(fast_path(model)):
+                raise AssertionError(f"Fast path output differs for {shape} response of {words} words")
+            default_ms = timeit.timeit(lambda: default_path(model), number=number) / number * 1000
+            fast_ms = timeit.timeit(lambda: fast_path(model), number=number) / number * 1000
+            print(f"{words:>7} {expressions:>6} {shape:>8} {default_ms:>10.2f} {fast_ms:>8.2f} {default_ms / fast_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Cold-start cost of the API.
+
+Reports the import time of `main` (from `python -X importtime`, best of
+several fresh interpreters) with the slowest top-level imports, and the time
+from process start until the server answers /health and until /ready reports
+that warm-up has finished.
+
+Usage:
+    python bench/startup.py [--runs 5] [--top 15] [--port 8765]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = {
+    **os.environ,
+    "OPENROUTER_API_KEY": "stub",
+    "LANGCHAIN_TRACING_V2": "false",
+    "LOG_LEVEL": "WARNING",
+}
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def import_times() -> tuple[float, dict[str, float]]:
+    """Total import time of main and the cumulative time of each of its imports, in ms."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.join(API_DIR, "src"), env=ENV, capture_output=True, text=True, check=True,
+    )
+    # Children are printed before their parent, one indentation level deeper
+    modules: dict[str, float] = {}
+    children: dict[str, float] = {}
+    total = 0.0
+    for match in LINE.finditer(result.stderr):
+        cumulative, depth, module = int(match[2]) / 1000, len(match[3]), match[4]
+        if depth == 3:
+            children[module] = cumulative
+        elif depth == 1:
+            if module == "main":
+                total, modules = cumulative, children
+            children = {}
+    return total, modules
+
+def wait_for(port: int, path: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1)
+            return
+        except (OSError, urllib.error.HTTPError):
+            time.sleep(0.02)
+    raise TimeoutError(f"{path} did not answer within {timeout}s")
+
+def boot_times(port: int) -> tuple[float, float]:
+    """Seconds from process start until /health answers and until /ready is 200."""
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "src/main.py"], cwd=API_DIR,
+        env={**ENV, "HTTP_PORT": str(port), "HTTP_WORKERS": "1", "HTTP_AUTORELOAD": "false"},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(port, "/health?quick=true", 60)
+        listening = time.perf_counter() - start
+        wait_for(port, "/ready", 120)
+        ready = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+    return listening, ready
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.runs)]
+    total, modules = min(runs, key=lambda run: run[0])
+    print(f"import main: {total:.0f} ms (best of {args.runs})")
+    for module, ms in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {ms:>8.1f} ms  {module}")
+
+    listening, ready = boot_times(args.port)
+    print(f"process start -> /health: {listening:.2f} s")
+    print(f"process start -> /ready:  {ready:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions API.
+
+Answers the workflow's structured-output prompts with canned results after a
+configurable delay, so benchmarks can exercise the full request path without
+network access or API spend. Also serves the batch API (/files and
+/batches), running each job after a fixed delay. Point the API at it with:
+
+    OPENROUTER_BASE_URL=http://127.0.0.1:8900/v1 OPENROUTER_API_KEY=stub
+
+Usage:
+    python bench/stub_upstream.py --port 8900 --latency 0.2
+"""
+
+import argparse
+import email
+import email.policy
+import json
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+IDIOMS = {
+    "break the ice": "start talking",
+    "a piece of cake": "very easy",
+    "spill the beans": "tell the secret",
+    "let the cat out of the bag": "tell the secret",
+    "time is money": "time is valuable",
+    "under the weather": "ill",
+    "hit the sack": "go to bed",
+}
+
+def complete(body: dict) -> dict:
+    """Returns the message content for a chat completion request."""
+    content = answer(body)
+    json_schema = (body.get("response_format") or {}).get("json_schema", {})
+    if "confidence" in json_schema.get("schema", {}).get("properties", {}):
+        # Deterministic per prompt, spread over [0.5, 1)
+        prompt = json.dumps(body["messages"], sort_keys=True).encode()
+        content["confidence"] = 0.5 + (zlib.crc32(prompt) % 500) / 1000
+    return content
+
+def detect(text: str) -> list[dict]:
+    found = [m.group(0) for i in IDIOMS for m in re.finditer(re.escape(i), text, re.IGNORECASE)]
+    return [{"type": "idiom", "original": f} for f in found]
+
+def answer(body: dict) -> dict:
+    schema = (body.get("response_format") or {}).get("json_schema", {}).get("name", "")
+    user = next((m["content"] for m in reversed(body["messages"]) if m["role"] == "user"), "")
+    if isinstance(user, list):
+        user = " ".join(part.get("text", "") for part in user)
+    if schema == "Detection":
+        return {"expressions": detect(user)}
+    if schema == "BatchDetection":
+        texts = re.split(r"(?:^|\n\n)\[(\d+)\] ", user)[1:]
+        return {"texts": [{"id": int(i), "expressions": detect(t)} for i, t in zip(texts[::2], texts[1::2])]}
+    if schema == "Simplification":
+        expression = re.search(r"Expression: (.*)", user)
+        expression = (expression.group(1) if expression else user).lower()
+        idiom = next((i for i in IDIOMS if i in expression), "")
+        return {
+            "explanation": f"'{idiom}' is a figure of speech.",
+            "simplifiedVersion": IDIOMS.get(idiom, "it"),
+        }
+    if schema == "Rephrasing":
+        expression = re.search(r"Expression: (.*)", user)
+        expression = (expression.group(1) if expression else user).lower()
+        return {"simplifiedVersion": next((v for i, v in IDIOMS.items() if i in expression), "it")}
+    if schema == "Judgement":
+        return {"equivalent": True}
+    return {"text": user}
+
+def chat_completion(body: dict) -> dict:
+    """Returns the chat completion response for a request body."""
+    content = json.dumps(complete(body))
+    prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in body["messages"])
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+def parse_upload(content_type: str, data: bytes) -> tuple[str, bytes]:
+    """Returns the name and content of the file in a multipart/form-data body."""
+    message = email.message_from_bytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + data, policy=email.policy.HTTP,
+    )
+    part = next(part for part in message.iter_parts() if part.get_filename())
+    return part.get_filename(), part.get_payload(decode=True)
+
+class Handler(BaseHTTPRequestHandler):
+    latency = 0.0
+    # Per-model overrides of latency
+    model_latency: dict[str, float] = {}
+    # Additional seconds per completion token
+    token_latency = 0.0
+    # Completions computed at once, like a provider's capacity; None is unlimited
+    slots: threading.Semaphore | None = None
+    # Seconds a batch job takes, whatever its size
+    batch_latency = 1.0
+    # Uploaded files and batch jobs by id, shared by all requests
+    files: dict[str, dict] = {}
+    batches: dict[str, dict] = {}
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path.endswith("/files"):
+            filename, content = parse_upload(self.headers["Content-Type"], data)
+            self.send_json(self.add_file(filename, content, "batch"))
+        elif self.path.endswith("/batches"):
+            self.send_json(self.create_batch(json.loads(data)))
+        else:
+            self.complete_chat(json.loads(data))
+
+    def do_GET(self):
+        parts = self.path.rstrip("/").split("/")
+        if parts[-2] == "batches" and parts[-1] in self.batches:
+            self.send_json(self.batches[parts[-1]])
+        elif parts[-1] == "content" and parts[-2] in self.files:
+            self.send_json(None, self.files[parts[-2]]["content"], "application/jsonl")
+        else:
+            self.send_json({"error": {"message": f"Not found: {self.path}"}}, status=404)
+
+    def complete_chat(self, body: dict) -> None:
+        payload = chat_completion(body)
+        completion_tokens = payload["usage"]["completion_tokens"]
+        delay = self.model_latency.get(body.get("model"), self.latency) + self.token_latency * completion_tokens
+        if self.slots is None:
+            time.sleep(delay)
+        else:
+            with self.slots:
+                time.sleep(delay)
+        self.send_json(payload)
+
+    def add_file(self, filename: str, content: bytes, purpose: str) -> dict:
+        file = {
+            "id": f"file-{uuid.uuid4().hex}",
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        self.files[file["id"]] = {**file, "content": content}
+        return file
+
+    def create_batch(self, params: dict) -> dict:
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": params["endpoint"],
+            "input_file_id": params["input_file_id"],
+            "completion_window": params["completion_window"],
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+        }
+        self.batches[batch["id"]] = batch
+        threading.Thread(target=self.run_batch, args=(batch,), daemon=True).start()
+        return batch
+
+    def run_batch(self, batch: dict) -> None:
+        batch["status"] = "in_progress"
+        time.sleep(self.batch_latency)
+        lines = []
+        for line in self.files[batch["input_file_id"]]["content"].decode().splitlines():
+            request = json.loads(line)
+            lines.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": chat_completion(request["body"])},
+                "error": None,
+            }))
+        output = self.add_file("output.jsonl", "\n".join(lines).encode(), "batch_output")
+        batch.update(
+            status="completed", output_file_id=output["id"], completed_at=int(time.time()),
+            request_counts={"total": len(lines), "completed": len(lines), "failed": 0},
+        )
+
+    def send_json(self, payload: dict | None, raw: bytes | None = None, content_type: str = "application/json", status: int = 200):
+        data = raw if raw is not None else json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client aborted the request, e.g. for a cancelled run
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(
+    port: int,
+    latency: float,
+    model_latency: dict[str, float] | None = None,
+    token_latency: float = 0.0,
+    concurrency: int | None = None,
+    batch_latency: float = 1.0,
+) -> ThreadingHTTPServer:
+    """Starts the stub in a background thread and returns the server."""
+    handler = type("StubHandler", (Handler,), {
+        "latency": latency, "model_latency": model_latency or {}, "token_latency": token_latency,
+        "slots": threading.Semaphore(concurrency) if concurrency else None,
+        "batch_latency": batch_latency, "files": {}, "batches": {},
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds to wait per completion")
+    parser.add_argument(
+        "--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+        help="Latency for a specific model, e.g. small=0.05 (repeatable)",
+    )
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Additional seconds per completion token")
+    parser.add_argument("--concurrency", type=int, default=None, help="Completions computed at once (default unlimited)")
+    parser.add_argument("--batch-latency", type=float, default=1.0, help="Seconds each batch job takes")
+    args = parser.parse_args()
+    model_latency = {m: float(s) for m, s in (item.rsplit("=", 1) for item in args.model_latency)}
+    server = serve(args.port, args.latency, model_latency, args.token_latency, args.concurrency, args.batch_latency)
+    print(f"Stub upstream listening on http://127.0.0.1:{args.port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
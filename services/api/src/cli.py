@@ -0,0 +1,338 @@
+"""
+Bulk adaptation of corpora through the metaphor workflow.
+
+Streams records from a JSONL, CSV or plain-text file (one record per
+paragraph), runs them through the workflow on a bounded worker pool and
+appends each result to a JSONL output file as soon as it completes. The output
+file doubles as the checkpoint: re-running the same command skips every record
+already written, so an interrupted run picks up where it stopped. Records that
+fail, including input lines that cannot be read, are written as a line with
+an "error" instead of "adaptedText", and are retried by the next run. With
+--batch-api, the LLM calls of all records in flight are sent to the provider
+as batch jobs, which is slower per record but cheaper.
+
+Usage:
+    adapt corpus.jsonl -o adapted.jsonl --concurrency 8
+    adapt book.txt -o book.adapted.jsonl
+    adapt corpus.jsonl -o adapted.jsonl --batch-api --concurrency 2000
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Iterator, NamedTuple, TextIO
+
+from utils import log
+import conf
+
+log.init(conf.get_log_level())
+logger = log.get_logger(__name__)
+
+#### Types ####
+
+class Record(NamedTuple):
+    index: int
+    id: str
+    text: str
+    # Why the record could not be read, if it could not
+    error: str | None = None
+
+#### Input ####
+
+def detect_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if ext in (".csv", ".tsv"):
+        return "csv"
+    return "text"
+
+def read_records(
+    f: TextIO, fmt: str, text_field: str, id_field: str | None, delimiter: str = ",",
+) -> Iterator[Record]:
+    """
+    Yields records one at a time without reading the whole input. Rows that
+    are malformed or lack the text field are yielded with an error.
+    """
+    if fmt == "jsonl":
+        rows = read_jsonl(f)
+    elif fmt == "csv":
+        rows = csv.DictReader(f, delimiter=delimiter)
+    else:
+        rows = ({text_field: p} for p in read_paragraphs(f))
+    for index, row in enumerate(rows):
+        if isinstance(row, str):
+            yield Record(index=index, id=str(index), text="", error=row)
+            continue
+        record_id = str(row[id_field]) if id_field and row.get(id_field) is not None else str(index)
+        text = row.get(text_field)
+        if not isinstance(text, str):
+            yield Record(index=index, id=record_id, text="", error=f"No text in field {text_field!r}")
+            continue
+        yield Record(index=index, id=record_id, text=text)
+
+def read_jsonl(f: TextIO) -> Iterator[dict | str]:
+    """Yields the objects of non-blank lines, or an error for lines that are not one."""
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield f"Invalid JSON: {e}"
+            continue
+        yield row if isinstance(row, dict) else "Not a JSON object"
+
+def read_paragraphs(f: TextIO) -> Iterator[str]:
+    """Yields blank-line separated paragraphs."""
+    lines = []
+    for line in f:
+        if line.strip():
+            lines.append(line.rstrip("\n"))
+        elif lines:
+            yield "\n".join(lines)
+            lines = []
+    if lines:
+        yield "\n".join(lines)
+
+#### Checkpoint ####
+
+class Checkpoint():
+    """
+    Tracks which record indices are settled as a watermark (every index below
+    it is settled) plus the sparse set of settled indices above it. Records
+    settle at most `concurrency` positions out of order, so this stays small.
+
+    A record is settled once it is done or has failed. Failed records are also
+    kept in `failed`, and do not count as done: their output line is an error,
+    so the next run retries them, and a later result clears the failure.
+    """
+
+    def __init__(self):
+        self.watermark = 0
+        self.done: set[int] = set()
+        self.failed: set[int] = set()
+
+    def __contains__(self, index: int) -> bool:
+        return (index < self.watermark or index in self.done) and index not in self.failed
+
+    def __len__(self) -> int:
+        return self.watermark + len(self.done) - len(self.failed)
+
+    def add(self, index: int, failed: bool = False) -> None:
+        if failed:
+            self.failed.add(index)
+        else:
+            self.failed.discard(index)
+        if index < self.watermark:
+            return
+        self.done.add(index)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    @classmethod
+    def load(cls, path: str) -> "Checkpoint":
+        """
+        Rebuilds the checkpoint from an existing output file, truncating a
+        trailing partial line left behind by a crash mid-write.
+        """
+        checkpoint = cls()
+        if not os.path.exists(path):
+            return checkpoint
+        valid_size = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    row = json.loads(line)
+                    checkpoint.add(row["index"], failed="error" in row)
+                except (ValueError, KeyError, TypeError):
+                    break
+                valid_size += len(line)
+        if valid_size < os.path.getsize(path):
+            logger.warning(f"Truncating incomplete output at byte {valid_size} of {path}")
+            os.truncate(path, valid_size)
+        return checkpoint
+
+#### Progress ####
+
+class Progress():
+    """Periodically reports progress and throughput to stderr."""
+
+    def __init__(self, skipped: int, interval: float):
+        self.skipped = skipped
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.chars = 0
+        self.start = time.monotonic()
+        self.last_report = self.start
+        self.tty = sys.stderr.isatty()
+
+    def update(self, chars: int = 0, failed: bool = False) -> None:
+        if failed:
+            self.failed += 1
+        else:
+            self.done += 1
+            self.chars += chars
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self, final: bool = False) -> None:
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        line = (
+            f"{self.done} done, {self.failed} failed, {self.skipped} skipped"
+            f" | {self.done / elapsed:.2f} rec/s, {self.chars / elapsed:.0f} chars/s"
+            f" | {elapsed:.0f}s elapsed"
+        )
+        if self.tty and not final:
+            sys.stderr.write(f"\r\033[K{line}")
+        else:
+            sys.stderr.write(("\r\033[K" if self.tty else "") + line + "\n")
+        sys.stderr.flush()
+
+#### Processing ####
+
+def adapt_record(record: Record, lane: str, batch_api: bool = False) -> dict:
+    from workflows import llm, priority
+    from workflows.metaphor import process_text, workflow_version
+
+    # Records with the same text may be in flight at once, so each has a run
+    # of its own
+    run_id = hashlib.sha256(f"{workflow_version()}\x00{record.index}\x00{record.text}".encode()).hexdigest()
+    with priority.lane(lane), llm.batch_api(batch_api):
+        state = process_text(record.text, run_id)
+    return {
+        "index": record.index,
+        "id": record.id,
+        "originalText": record.text,
+        "adaptedText": state["result"],
+        "expressions": [
+            {**e, "original": record.text[e["startIndex"]:e["endIndex"]]}
+            for e in state["expressions"]
+        ],
+    }
+
+def run(
+    records: Iterator[Record],
+    out: TextIO,
+    checkpoint: Checkpoint,
+    concurrency: int,
+    progress: Progress,
+    lane: str = "batch",
+    batch_api: bool = False,
+    fsync_every: int = 100,
+) -> None:
+    """Runs records through the workflow, keeping at most 2x concurrency in flight."""
+    pending: dict[Future, Record] = {}
+    written = 0
+
+    def write(row: dict) -> None:
+        nonlocal written
+        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        written += 1
+        if written % fsync_every == 0:
+            out.flush()
+            os.fsync(out.fileno())
+
+    def fail(record: Record, error: str) -> None:
+        logger.error(f"Record {record.id} (#{record.index}) failed: {error}")
+        write({"index": record.index, "id": record.id, "error": error})
+        checkpoint.add(record.index, failed=True)
+        progress.update(failed=True)
+
+    def drain(block: bool) -> None:
+        finished, _ = wait(pending, return_when=FIRST_COMPLETED, timeout=None if block else 0)
+        for future in finished:
+            record = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                fail(record, str(e) or type(e).__name__)
+                continue
+            write(result)
+            checkpoint.add(record.index)
+            progress.update(chars=len(record.text))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for record in records:
+            if record.index in checkpoint:
+                continue
+            if record.error:
+                fail(record, record.error)
+                continue
+            while len(pending) >= concurrency * 2:
+                drain(block=True)
+            pending[pool.submit(adapt_record, record, lane, batch_api)] = record
+            drain(block=False)
+        while pending:
+            drain(block=True)
+    out.flush()
+    os.fsync(out.fileno())
+
+#### Entry Point ####
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Adapt a corpus through the metaphor workflow.")
+    parser.add_argument("input", help="Input file (.jsonl, .csv/.tsv or plain text), or - for stdin")
+    parser.add_argument("-o", "--output", required=True, help="Output JSONL file; also used to resume")
+    parser.add_argument("--format", choices=["auto", "jsonl", "csv", "text"], default="auto")
+    parser.add_argument("--text-field", default="text", help="Field holding the text (jsonl/csv)")
+    parser.add_argument("--id-field", default=None, help="Field holding a record id (jsonl/csv)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of records in flight")
+    parser.add_argument(
+        "--lane", choices=["interactive", "batch", "background"], default="batch",
+        help="Priority lane of the upstream calls (see UPSTREAM_CONCURRENCY)",
+    )
+    parser.add_argument(
+        "--batch-api", action="store_true",
+        help="Send the LLM calls as provider batch jobs (see BATCH_API_*); use a high --concurrency",
+    )
+    parser.add_argument("--restart", action="store_true", help="Ignore existing output and start over")
+    parser.add_argument("--progress-interval", type=float, default=1.0, help="Seconds between progress reports")
+    args = parser.parse_args()
+
+    if not conf.validate():
+        raise ValueError("Invalid configuration.")
+
+    fmt = args.format
+    if fmt == "auto":
+        fmt = "jsonl" if args.input == "-" else detect_format(args.input)
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    checkpoint = Checkpoint.load(args.output)
+    if len(checkpoint) or checkpoint.failed:
+        logger.info(
+            f"Resuming: {len(checkpoint)} records already in {args.output},"
+            f" retrying {len(checkpoint.failed)} failed"
+        )
+
+    progress = Progress(skipped=len(checkpoint), interval=args.progress_interval)
+    f = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    try:
+        with open(args.output, "a", encoding="utf-8") as out:
+            records = read_records(
+                f, fmt, args.text_field, args.id_field,
+                delimiter="\t" if args.input.endswith(".tsv") else ",",
+            )
+            run(records, out, checkpoint, max(1, args.concurrency), progress, args.lane, args.batch_api)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; re-run the same command to resume")
+    finally:
+        if f is not sys.stdin:
+            f.close()
+        progress.report(final=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
+import functools
+import json
+import os
+from typing import Literal
+
 from pydantic import BaseModel
 
-from utils import auth, env, log
+from utils import env, log
 from utils.env import EnvVarSpec
 
 logger = log.get_logger(__name__)
@@ -14,6 +19,108 @@ class HttpServerConf(BaseModel):
     host: str
     port: int
     autoreload: bool
+    workers: int
+
+class GuardrailConf(BaseModel):
+    enabled: bool
+    accept_threshold: float
+    reject_threshold: float
+
+class ModelPrice(BaseModel):
+    # USD per million tokens
+    input: float
+    output: float
+
+class BudgetConf(BaseModel):
+    # 0 disables the respective budget
+    request_usd: float
+    principal_daily_usd: float
+    # Cheaper model to switch to when the configured one would exceed a budget
+    fallback_model: str | None
+
+class DeadlineConf(BaseModel):
+    # Longest a request may take; 0 disables the deadline
+    timeout_seconds: float
+    # Time kept back from the deadline to compose and return partial results
+    reserve_seconds: float
+
+class LoadShedConf(BaseModel):
+    # How often the event loop's lag is sampled
+    interval_ms: float
+    # Event loop lag beyond which requests of a lane are rejected; lanes
+    # without a threshold are never shed for lag
+    lag_ms: dict[str, float]
+    # Requests in flight beyond which new requests of a lane are rejected
+    in_flight: dict[str, int]
+    retry_after_seconds: int
+
+class SchedulerConf(BaseModel):
+    # Concurrent upstream calls; 0 leaves them unlimited and unscheduled
+    concurrency: int
+    # Relative share of the slots per lane when lanes compete
+    weights: dict[str, float]
+    # Slots only interactive calls may use
+    reserved: int
+
+class BatchingConf(BaseModel):
+    # How long a batch waits for more texts; 0 disables batching
+    max_wait_ms: float
+    # Estimated prompt tokens of all texts in a batch
+    max_tokens: int
+    # Only texts up to this many estimated tokens are batched
+    max_item_tokens: int
+
+class DocumentConf(BaseModel):
+    # Largest upload accepted by /adapt/document
+    max_bytes: int
+    # Characters per chunk the document is adapted in
+    chunk_chars: int
+    # Chunks of one document adapted at once
+    concurrency: int
+
+class CheckpointConf(BaseModel):
+    enabled: bool
+    # SQLite file; None keeps checkpoints in memory
+    path: str | None
+    # Checkpoints of runs not resumed within this long are deleted
+    ttl_seconds: float
+
+class CascadeConf(BaseModel):
+    # Cheaper model tried before OPENROUTER_MODEL; None disables the cascade
+    model: str | None
+    confidence_threshold: float
+
+class BatchApiConf(BaseModel):
+    # OpenAI-style API with /files and /batches endpoints
+    base_url: str
+    api_key: str
+    # Requests per batch job
+    max_requests: int
+    # How long a job collects requests before it is submitted
+    max_wait_seconds: float
+    poll_seconds: float
+    # Share of the synchronous price paid for batched calls
+    price_factor: float
+
+class TracingConf(BaseModel):
+    # "otlp" or "file"; None disables tracing
+    exporter: Literal["otlp", "file"] | None
+    otlp_endpoint: str
+    file_path: str
+    # Share of traces kept that are neither slow nor failed
+    sample_ratio: float
+    # Traces of requests taking at least this long are always kept
+    slow_ms: float
+
+class FewShotConf(BaseModel):
+    index_path: str | None
+    examples: int
+
+class ExpressionCacheConf(BaseModel):
+    enabled: bool
+    max_entries: int
+    path: str | None
+    context_words: int
 
 #### Env Vars ####
 
@@ -34,6 +141,14 @@ HTTP_AUTORELOAD = EnvVarSpec(
     type=(bool, ...),
 )
 
+# Number of worker processes; "auto" uses one per CPU core
+HTTP_WORKERS = EnvVarSpec(
+    id="HTTP_WORKERS",
+    default="1",
+    parse=lambda x: (os.cpu_count() or 1) if x.lower() == "auto" else int(x),
+    type=(int, ...),
+)
+
 HTTP_EXPOSE_ERRORS = EnvVarSpec(
     id="HTTP_EXPOSE_ERRORS",
     default="false",
@@ -41,6 +156,15 @@ HTTP_EXPOSE_ERRORS = EnvVarSpec(
     type=(bool, ...),
 )
 
+# Render JSON responses with orjson, skipping FastAPI's re-validation of
+# response models the routes built themselves
+HTTP_FAST_JSON = EnvVarSpec(
+    id="HTTP_FAST_JSON",
+    default="true",
+    parse=lambda x: x.lower() == "true",
+    type=(bool, ...),
+)
+
 ## OpenRouter ##
 
 OPENROUTER_API_KEY = EnvVarSpec(id="OPENROUTER_API_KEY", default="")
@@ -62,11 +186,433 @@ LANGCHAIN_API_KEY = EnvVarSpec(id="LANGCHAIN_API_KEY", default="")
 
 LANGCHAIN_PROJECT = EnvVarSpec(id="LANGCHAIN_PROJECT", default="default")
 
+## Tracing ##
+
+# Where OpenTelemetry spans are exported: "otlp" (a collector), "file" (JSON
+# lines) or "" to disable tracing. Requires the `tracing` extra
+TRACING_EXPORTER = EnvVarSpec(
+    id="TRACING_EXPORTER",
+    default="",
+    parse=lambda x: x.lower(),
+    type=(Literal["", "otlp", "file"], ...),
+)
+
+TRACING_OTLP_ENDPOINT = EnvVarSpec(id="TRACING_OTLP_ENDPOINT", default="http://localhost:4318/v1/traces")
+
+TRACING_FILE_PATH = EnvVarSpec(id="TRACING_FILE_PATH", default="traces.jsonl")
+
+# Traces of failed and slow requests are always kept, others with this probability
+TRACING_SAMPLE_RATIO = EnvVarSpec(
+    id="TRACING_SAMPLE_RATIO",
+    default="0.1",
+    parse=float,
+    type=(float, ...),
+)
+
+TRACING_SLOW_MS = EnvVarSpec(
+    id="TRACING_SLOW_MS",
+    default="2000",
+    parse=float,
+    type=(float, ...),
+)
+
+## Shared State ##
+
+# Path to a SQLite file that caches and rate limits are stored in, so they are
+# shared between worker processes; empty keeps all state in-process
+SHARED_STATE_PATH = EnvVarSpec(id="SHARED_STATE_PATH", default="", is_optional=True)
+
+# Upstream LLM requests per minute across all workers; 0 disables the limit
+UPSTREAM_RATE_LIMIT_RPM = EnvVarSpec(
+    id="UPSTREAM_RATE_LIMIT_RPM",
+    default="0",
+    parse=float,
+    type=(float, ...),
+)
+
+## Priority lanes ##
+
+# Upstream LLM calls in flight at once, scheduled across priority lanes and
+# principals; 0 leaves them unlimited
+UPSTREAM_CONCURRENCY = EnvVarSpec(
+    id="UPSTREAM_CONCURRENCY",
+    default="0",
+    parse=int,
+    type=(int, ...),
+)
+
+# Share of the upstream slots per lane while lanes compete for them, as
+# comma-separated lane=weight pairs
+UPSTREAM_LANE_WEIGHTS = EnvVarSpec(
+    id="UPSTREAM_LANE_WEIGHTS",
+    default="interactive=8,batch=2,background=1",
+    parse=lambda x: {
+        lane.strip(): float(weight) for lane, weight in (item.split("=", 1) for item in x.split(",") if item.strip())
+    },
+    type=(dict[str, float], ...),
+)
+
+# Upstream slots kept free for interactive calls
+UPSTREAM_RESERVED_SLOTS = EnvVarSpec(
+    id="UPSTREAM_RESERVED_SLOTS",
+    default="2",
+    parse=int,
+    type=(int, ...),
+)
+
+## Deadlines ##
+
+# Deadline in seconds for /adapt requests, which clients can shorten with an
+# X-Request-Timeout header; LLM calls still running at the deadline are
+# cancelled and the results so far are returned as partial. 0 disables it.
+REQUEST_TIMEOUT_SECONDS = EnvVarSpec(
+    id="REQUEST_TIMEOUT_SECONDS",
+    default="60",
+    parse=float,
+    type=(float, ...),
+)
+
+# Seconds before the deadline at which the workflow stops
+REQUEST_TIMEOUT_RESERVE_SECONDS = EnvVarSpec(
+    id="REQUEST_TIMEOUT_RESERVE_SECONDS",
+    default="0.5",
+    parse=float,
+    type=(float, ...),
+)
+
+## Load Shedding ##
+
+# Milliseconds between samples of the event loop's lag (how late a timer fires),
+# which is exported with the number of requests in flight
+LOAD_SHED_INTERVAL_MS = EnvVarSpec(
+    id="LOAD_SHED_INTERVAL_MS",
+    default="50",
+    parse=float,
+    type=(float, ...),
+)
+
+# Event loop lag in ms per lane (X-Priority) beyond which new requests of the
+# lane are rejected with 503 and Retry-After; health checks are never shed
+LOAD_SHED_LAG_MS = EnvVarSpec(
+    id="LOAD_SHED_LAG_MS",
+    default="background=100,batch=250",
+    parse=lambda x: {
+        lane.strip(): float(value) for lane, value in (item.split("=", 1) for item in x.split(",") if item.strip())
+    },
+    type=(dict[str, float], ...),
+)
+
+# Requests in flight per lane beyond which new requests of the lane are
+# rejected, e.g. "background=16,batch=32"; empty sets no limit
+LOAD_SHED_IN_FLIGHT = EnvVarSpec(
+    id="LOAD_SHED_IN_FLIGHT",
+    default="",
+    parse=lambda x: {
+        lane.strip(): int(value) for lane, value in (item.split("=", 1) for item in x.split(",") if item.strip())
+    },
+    type=(dict[str, int], ...),
+)
+
+LOAD_SHED_RETRY_AFTER_SECONDS = EnvVarSpec(
+    id="LOAD_SHED_RETRY_AFTER_SECONDS",
+    default="5",
+    parse=int,
+    type=(int, ...),
+)
+
+## Detection Batching ##
+
+# Detection of short texts from concurrent requests is batched into one LLM
+# call. Each request then waits up to this long for other requests to join
+# its batch; 0 disables batching.
+BATCH_MAX_WAIT_MS = EnvVarSpec(
+    id="BATCH_MAX_WAIT_MS",
+    default="0",
+    parse=float,
+    type=(float, ...),
+)
+
+BATCH_MAX_TOKENS = EnvVarSpec(
+    id="BATCH_MAX_TOKENS",
+    default="2000",
+    parse=int,
+    type=(int, ...),
+)
+
+BATCH_MAX_ITEM_TOKENS = EnvVarSpec(
+    id="BATCH_MAX_ITEM_TOKENS",
+    default="200",
+    parse=int,
+    type=(int, ...),
+)
+
+## Live Adaptation ##
+
+# Quiet time after a text revision on /adapt/live before it is analyzed, so
+# that bursts of keystrokes are adapted once
+LIVE_DEBOUNCE_MS = EnvVarSpec(
+    id="LIVE_DEBOUNCE_MS",
+    default="300",
+    parse=int,
+    type=(int, ...),
+)
+
+## Document Uploads ##
+
+# Largest document accepted by /adapt/document, in bytes
+DOCUMENT_MAX_BYTES = EnvVarSpec(
+    id="DOCUMENT_MAX_BYTES",
+    default="52428800",
+    parse=int,
+    type=(int, ...),
+)
+
+# Documents are adapted in chunks of whole sentences of about this many
+# characters
+DOCUMENT_CHUNK_CHARS = EnvVarSpec(
+    id="DOCUMENT_CHUNK_CHARS",
+    default="2000",
+    parse=int,
+    type=(int, ...),
+)
+
+DOCUMENT_CONCURRENCY = EnvVarSpec(
+    id="DOCUMENT_CONCURRENCY",
+    default="4",
+    parse=int,
+    type=(int, ...),
+)
+
+## Checkpoints ##
+
+# Checkpoint workflow runs after every node, so that a failed or interrupted
+# run is resumed from there when the same request is retried
+CHECKPOINTS_ENABLED = EnvVarSpec(
+    id="CHECKPOINTS_ENABLED",
+    default="true",
+    parse=lambda x: x.lower() == "true",
+    type=(bool, ...),
+)
+
+# Path to a SQLite file to keep checkpoints in; defaults to SHARED_STATE_PATH,
+# and to in-memory if that is unset too
+CHECKPOINT_PATH = EnvVarSpec(id="CHECKPOINT_PATH", default="", is_optional=True)
+
+CHECKPOINT_TTL_SECONDS = EnvVarSpec(
+    id="CHECKPOINT_TTL_SECONDS",
+    default="86400",
+    parse=float,
+    type=(float, ...),
+)
+
+## Model Cascade ##
+
+# Small, fast model that handles detection and simplification first; only
+# answers it is unsure about, and simplifications the guardrail rejects, are
+# escalated to OPENROUTER_MODEL. Empty disables the cascade.
+CASCADE_MODEL = EnvVarSpec(id="CASCADE_MODEL", default="", is_optional=True)
+
+# Self-reported confidence (0-1) below which the cascade model's answer is escalated
+CASCADE_CONFIDENCE_THRESHOLD = EnvVarSpec(
+    id="CASCADE_CONFIDENCE_THRESHOLD",
+    default="0.8",
+    parse=float,
+    type=(float, ...),
+)
+
+## Batch API ##
+
+# Provider batch API the `adapt --batch-api` CLI submits its LLM calls to as
+# batch jobs; default to OPENROUTER_BASE_URL and OPENROUTER_API_KEY
+BATCH_API_BASE_URL = EnvVarSpec(id="BATCH_API_BASE_URL", default="", is_optional=True)
+
+BATCH_API_KEY = EnvVarSpec(id="BATCH_API_KEY", default="", is_optional=True)
+
+BATCH_API_MAX_REQUESTS = EnvVarSpec(
+    id="BATCH_API_MAX_REQUESTS",
+    default="10000",
+    parse=int,
+    type=(int, ...),
+)
+
+# A job is submitted this long after its first request, unless it fills up first
+BATCH_API_MAX_WAIT_SECONDS = EnvVarSpec(
+    id="BATCH_API_MAX_WAIT_SECONDS",
+    default="30",
+    parse=float,
+    type=(float, ...),
+)
+
+BATCH_API_POLL_SECONDS = EnvVarSpec(
+    id="BATCH_API_POLL_SECONDS",
+    default="30",
+    parse=float,
+    type=(float, ...),
+)
+
+# Batched calls are accounted at this share of MODEL_PRICES
+BATCH_API_PRICE_FACTOR = EnvVarSpec(
+    id="BATCH_API_PRICE_FACTOR",
+    default="0.5",
+    parse=float,
+    type=(float, ...),
+)
+
+## Usage and Budgets ##
+
+# JSON object of per-model prices in USD per million tokens, e.g.
+# {"openai/gpt-4o-mini": {"input": 0.15, "output": 0.6}}; models without a
+# price are counted in tokens only
+MODEL_PRICES = EnvVarSpec(
+    id="MODEL_PRICES",
+    default="{}",
+    parse=lambda x: {model: ModelPrice(**price) for model, price in json.loads(x).items()},
+    type=(dict, ...),
+)
+
+# Maximum cost in USD of a single /adapt request; 0 disables the budget
+REQUEST_BUDGET_USD = EnvVarSpec(
+    id="REQUEST_BUDGET_USD",
+    default="0",
+    parse=float,
+    type=(float, ...),
+)
+
+# Maximum cost in USD per principal per UTC day; 0 disables the budget
+PRINCIPAL_DAILY_BUDGET_USD = EnvVarSpec(
+    id="PRINCIPAL_DAILY_BUDGET_USD",
+    default="0",
+    parse=float,
+    type=(float, ...),
+)
+
+# Model used instead of OPENROUTER_MODEL for calls that would otherwise exceed
+# a budget; without one, such requests are cut off
+BUDGET_FALLBACK_MODEL = EnvVarSpec(id="BUDGET_FALLBACK_MODEL", default="", is_optional=True)
+
+# Path to a SQLite file holding usage per principal and model; defaults to
+# SHARED_STATE_PATH, and to in-memory if that is unset too
+USAGE_LEDGER_PATH = EnvVarSpec(id="USAGE_LEDGER_PATH", default="", is_optional=True)
+
+## Adaptation Store ##
+
+# Path to a SQLite file to keep adaptations in; defaults to SHARED_STATE_PATH,
+# and to an in-memory store if that is unset too
+ADAPTATION_STORE_PATH = EnvVarSpec(id="ADAPTATION_STORE_PATH", default="", is_optional=True)
+
+ADAPTATION_STORE_MAX_DOCUMENTS = EnvVarSpec(
+    id="ADAPTATION_STORE_MAX_DOCUMENTS",
+    default="10000",
+    parse=int,
+    type=(int, ...),
+)
+
+# How long browsers and shared caches may reuse an adaptation read from
+# /api/adaptations/{id} without revalidating it; adaptations never change
+ADAPTATION_CACHE_MAX_AGE_SECONDS = EnvVarSpec(
+    id="ADAPTATION_CACHE_MAX_AGE_SECONDS",
+    default="3600",
+    parse=int,
+    type=(int, ...),
+)
+
+# Rendered adaptation responses kept in memory for repeat reads; 0 disables
+ADAPTATION_RESPONSE_CACHE_ENTRIES = EnvVarSpec(
+    id="ADAPTATION_RESPONSE_CACHE_ENTRIES",
+    default="1000",
+    parse=int,
+    type=(int, ...),
+)
+
+## Expression Cache ##
+
+EXPRESSION_CACHE_ENABLED = EnvVarSpec(
+    id="EXPRESSION_CACHE_ENABLED",
+    default="true",
+    parse=lambda x: x.lower() == "true",
+    type=(bool, ...),
+)
+
+EXPRESSION_CACHE_MAX_ENTRIES = EnvVarSpec(
+    id="EXPRESSION_CACHE_MAX_ENTRIES",
+    default="10000",
+    parse=int,
+    type=(int, ...),
+)
+
+# Path to a SQLite file to persist the cache in; empty keeps it in memory only
+EXPRESSION_CACHE_PATH = EnvVarSpec(id="EXPRESSION_CACHE_PATH", default="", is_optional=True)
+
+# Number of words on each side of an expression that make up its context window
+EXPRESSION_CACHE_CONTEXT_WORDS = EnvVarSpec(
+    id="EXPRESSION_CACHE_CONTEXT_WORDS",
+    default="4",
+    parse=int,
+    type=(int, ...),
+)
+
+## Guardrails ##
+
+GUARDRAIL_ENABLED = EnvVarSpec(
+    id="GUARDRAIL_ENABLED",
+    default="true",
+    parse=lambda x: x.lower() == "true",
+    type=(bool, ...),
+)
+
+# The threshold defaults are provisional: they were picked from the range of
+# BAAI/bge-small-en-v1.5 similarities of paraphrases, not calibrated on labeled
+# pairs of this task. Replace them with the output of
+# `python -m workflows.validation calibrate` (see its docstring).
+
+# Embedding similarity at or above which a simplification is accepted outright
+GUARDRAIL_ACCEPT_THRESHOLD = EnvVarSpec(
+    id="GUARDRAIL_ACCEPT_THRESHOLD",
+    default="0.85",
+    parse=float,
+    type=(float, ...),
+)
+
+# Embedding similarity below which a simplification is rejected outright;
+# scores in between are escalated to an LLM judge
+GUARDRAIL_REJECT_THRESHOLD = EnvVarSpec(
+    id="GUARDRAIL_REJECT_THRESHOLD",
+    default="0.6",
+    parse=float,
+    type=(float, ...),
+)
+
+# fastembed model name, or "hashing" for a lexical encoder whose scores say
+# nothing about meaning: with it, every guardrail pair goes to the LLM judge
+EMBEDDING_MODEL = EnvVarSpec(id="EMBEDDING_MODEL", default="BAAI/bge-small-en-v1.5")
+
+## Few-shot detection ##
+
+# Directory of an example index built with `python -m workflows.examples build`;
+# detection is zero-shot when unset
+FEW_SHOT_INDEX_PATH = EnvVarSpec(id="FEW_SHOT_INDEX_PATH", default="", is_optional=True)
+
+# Number of retrieved examples added to the detection prompt
+FEW_SHOT_EXAMPLES = EnvVarSpec(
+    id="FEW_SHOT_EXAMPLES",
+    default="4",
+    parse=int,
+    type=(int, ...),
+)
+
+## Idiom dictionary ##
+
+# Directory of a dictionary built with `python -m workflows.idioms build`;
+# every expression is simplified by the LLM when unset
+IDIOM_DICTIONARY_PATH = EnvVarSpec(id="IDIOM_DICTIONARY_PATH", default="", is_optional=True)
+
 #### Validation ####
 VALIDATED_ENV_VARS = [
     HTTP_AUTORELOAD,
     HTTP_EXPOSE_ERRORS,
+    HTTP_FAST_JSON,
     HTTP_PORT,
+    HTTP_WORKERS,
     LOG_LEVEL,
     OPENROUTER_API_KEY,
     OPENROUTER_MODEL,
@@ -75,6 +621,60 @@ VALIDATED_ENV_VARS = [
     LANGCHAIN_TRACING_V2,
     LANGCHAIN_API_KEY,
     LANGCHAIN_PROJECT,
+    TRACING_EXPORTER,
+    TRACING_OTLP_ENDPOINT,
+    TRACING_FILE_PATH,
+    TRACING_SAMPLE_RATIO,
+    TRACING_SLOW_MS,
+    SHARED_STATE_PATH,
+    UPSTREAM_RATE_LIMIT_RPM,
+    UPSTREAM_CONCURRENCY,
+    UPSTREAM_LANE_WEIGHTS,
+    UPSTREAM_RESERVED_SLOTS,
+    REQUEST_TIMEOUT_SECONDS,
+    REQUEST_TIMEOUT_RESERVE_SECONDS,
+    LOAD_SHED_INTERVAL_MS,
+    LOAD_SHED_LAG_MS,
+    LOAD_SHED_IN_FLIGHT,
+    LOAD_SHED_RETRY_AFTER_SECONDS,
+    BATCH_MAX_WAIT_MS,
+    BATCH_MAX_TOKENS,
+    BATCH_MAX_ITEM_TOKENS,
+    LIVE_DEBOUNCE_MS,
+    DOCUMENT_MAX_BYTES,
+    DOCUMENT_CHUNK_CHARS,
+    DOCUMENT_CONCURRENCY,
+    CHECKPOINTS_ENABLED,
+    CHECKPOINT_PATH,
+    CHECKPOINT_TTL_SECONDS,
+    CASCADE_MODEL,
+    CASCADE_CONFIDENCE_THRESHOLD,
+    BATCH_API_BASE_URL,
+    BATCH_API_KEY,
+    BATCH_API_MAX_REQUESTS,
+    BATCH_API_MAX_WAIT_SECONDS,
+    BATCH_API_POLL_SECONDS,
+    BATCH_API_PRICE_FACTOR,
+    MODEL_PRICES,
+    REQUEST_BUDGET_USD,
+    PRINCIPAL_DAILY_BUDGET_USD,
+    BUDGET_FALLBACK_MODEL,
+    USAGE_LEDGER_PATH,
+    ADAPTATION_STORE_PATH,
+    ADAPTATION_STORE_MAX_DOCUMENTS,
+    ADAPTATION_CACHE_MAX_AGE_SECONDS,
+    ADAPTATION_RESPONSE_CACHE_ENTRIES,
+    EXPRESSION_CACHE_ENABLED,
+    EXPRESSION_CACHE_MAX_ENTRIES,
+    EXPRESSION_CACHE_PATH,
+    EXPRESSION_CACHE_CONTEXT_WORDS,
+    GUARDRAIL_ENABLED,
+    GUARDRAIL_ACCEPT_THRESHOLD,
+    GUARDRAIL_REJECT_THRESHOLD,
+    EMBEDDING_MODEL,
+    FEW_SHOT_INDEX_PATH,
+    FEW_SHOT_EXAMPLES,
+    IDIOM_DICTIONARY_PATH,
 ]
 
 def validate() -> bool:
@@ -82,33 +682,213 @@ def validate() -> bool:
 
 #### Getters ####
 
+# Getters parse their variables on first use only, as parsing costs far more
+# than the hot paths reading them. Call reload() after changing the environment.
+_getters: list = []
+
+def cached(getter):
+    getter = functools.cache(getter)
+    _getters.append(getter)
+    return getter
+
+def reload() -> None:
+    """Forgets the parsed values, so that the next reads see the current environment."""
+    for getter in _getters:
+        getter.cache_clear()
+
+@cached
 def get_http_expose_errors() -> str:
     return env.parse(HTTP_EXPOSE_ERRORS)
 
+@cached
+def get_http_fast_json() -> bool:
+    return env.parse(HTTP_FAST_JSON)
+
+@cached
 def get_log_level() -> str:
     return env.parse(LOG_LEVEL)
 
+@cached
 def get_http_conf() -> HttpServerConf:
     return HttpServerConf(
         host=env.parse(HTTP_HOST),
         port=env.parse(HTTP_PORT),
         autoreload=env.parse(HTTP_AUTORELOAD),
+        workers=env.parse(HTTP_WORKERS),
     )
 
+@cached
 def get_openrouter_api_key() -> str:
     return env.parse(OPENROUTER_API_KEY)
 
+@cached
 def get_openrouter_model() -> str:
     return env.parse(OPENROUTER_MODEL)
 
+@cached
 def get_openrouter_base_url() -> str:
     return env.parse(OPENROUTER_BASE_URL)
 
+@cached
 def get_langchain_tracing_v2() -> bool:
     return env.parse(LANGCHAIN_TRACING_V2)
 
+@cached
 def get_langchain_api_key() -> str:
     return env.parse(LANGCHAIN_API_KEY)
 
+@cached
 def get_langchain_project() -> str:
     return env.parse(LANGCHAIN_PROJECT)
+
+@cached
+def get_tracing_conf() -> TracingConf:
+    return TracingConf(
+        exporter=env.parse(TRACING_EXPORTER) or None,
+        otlp_endpoint=env.parse(TRACING_OTLP_ENDPOINT),
+        file_path=env.parse(TRACING_FILE_PATH),
+        sample_ratio=env.parse(TRACING_SAMPLE_RATIO),
+        slow_ms=env.parse(TRACING_SLOW_MS),
+    )
+
+@cached
+def get_shared_state_path() -> str | None:
+    return env.parse(SHARED_STATE_PATH) or None
+
+@cached
+def get_upstream_rate_limit_rpm() -> float:
+    return env.parse(UPSTREAM_RATE_LIMIT_RPM)
+
+@cached
+def get_scheduler_conf() -> SchedulerConf:
+    return SchedulerConf(
+        concurrency=env.parse(UPSTREAM_CONCURRENCY),
+        weights=env.parse(UPSTREAM_LANE_WEIGHTS),
+        reserved=env.parse(UPSTREAM_RESERVED_SLOTS),
+    )
+
+@cached
+def get_deadline_conf() -> DeadlineConf:
+    return DeadlineConf(
+        timeout_seconds=env.parse(REQUEST_TIMEOUT_SECONDS),
+        reserve_seconds=env.parse(REQUEST_TIMEOUT_RESERVE_SECONDS),
+    )
+
+@cached
+def get_load_shed_conf() -> LoadShedConf:
+    return LoadShedConf(
+        interval_ms=env.parse(LOAD_SHED_INTERVAL_MS),
+        lag_ms=env.parse(LOAD_SHED_LAG_MS),
+        in_flight=env.parse(LOAD_SHED_IN_FLIGHT),
+        retry_after_seconds=env.parse(LOAD_SHED_RETRY_AFTER_SECONDS),
+    )
+
+@cached
+def get_batching_conf() -> BatchingConf:
+    return BatchingConf(
+        max_wait_ms=env.parse(BATCH_MAX_WAIT_MS),
+        max_tokens=env.parse(BATCH_MAX_TOKENS),
+        max_item_tokens=env.parse(BATCH_MAX_ITEM_TOKENS),
+    )
+
+@cached
+def get_live_debounce_ms() -> int:
+    return env.parse(LIVE_DEBOUNCE_MS)
+
+@cached
+def get_document_conf() -> DocumentConf:
+    return DocumentConf(
+        max_bytes=env.parse(DOCUMENT_MAX_BYTES),
+        chunk_chars=env.parse(DOCUMENT_CHUNK_CHARS),
+        concurrency=env.parse(DOCUMENT_CONCURRENCY),
+    )
+
+@cached
+def get_checkpoint_conf() -> CheckpointConf:
+    return CheckpointConf(
+        enabled=env.parse(CHECKPOINTS_ENABLED),
+        path=env.parse(CHECKPOINT_PATH) or get_shared_state_path(),
+        ttl_seconds=env.parse(CHECKPOINT_TTL_SECONDS),
+    )
+
+@cached
+def get_cascade_conf() -> CascadeConf:
+    return CascadeConf(
+        model=env.parse(CASCADE_MODEL) or None,
+        confidence_threshold=env.parse(CASCADE_CONFIDENCE_THRESHOLD),
+    )
+
+@cached
+def get_batch_api_conf() -> BatchApiConf:
+    return BatchApiConf(
+        base_url=env.parse(BATCH_API_BASE_URL) or get_openrouter_base_url(),
+        api_key=env.parse(BATCH_API_KEY) or get_openrouter_api_key(),
+        max_requests=env.parse(BATCH_API_MAX_REQUESTS),
+        max_wait_seconds=env.parse(BATCH_API_MAX_WAIT_SECONDS),
+        poll_seconds=env.parse(BATCH_API_POLL_SECONDS),
+        price_factor=env.parse(BATCH_API_PRICE_FACTOR),
+    )
+
+@cached
+def get_model_prices() -> dict[str, ModelPrice]:
+    return env.parse(MODEL_PRICES)
+
+@cached
+def get_budget_conf() -> BudgetConf:
+    return BudgetConf(
+        request_usd=env.parse(REQUEST_BUDGET_USD),
+        principal_daily_usd=env.parse(PRINCIPAL_DAILY_BUDGET_USD),
+        fallback_model=env.parse(BUDGET_FALLBACK_MODEL) or None,
+    )
+
+@cached
+def get_usage_ledger_path() -> str | None:
+    return env.parse(USAGE_LEDGER_PATH) or get_shared_state_path()
+
+@cached
+def get_adaptation_store_path() -> str | None:
+    return env.parse(ADAPTATION_STORE_PATH) or get_shared_state_path()
+
+@cached
+def get_adaptation_store_max_documents() -> int:
+    return env.parse(ADAPTATION_STORE_MAX_DOCUMENTS)
+
+@cached
+def get_adaptation_cache_max_age_seconds() -> int:
+    return env.parse(ADAPTATION_CACHE_MAX_AGE_SECONDS)
+
+@cached
+def get_adaptation_response_cache_entries() -> int:
+    return env.parse(ADAPTATION_RESPONSE_CACHE_ENTRIES)
+
+@cached
+def get_expression_cache_conf() -> ExpressionCacheConf:
+    return ExpressionCacheConf(
+        enabled=env.parse(EXPRESSION_CACHE_ENABLED),
+        max_entries=env.parse(EXPRESSION_CACHE_MAX_ENTRIES),
+        path=env.parse(EXPRESSION_CACHE_PATH) or get_shared_state_path(),
+        context_words=env.parse(EXPRESSION_CACHE_CONTEXT_WORDS),
+    )
+
+@cached
+def get_guardrail_conf() -> GuardrailConf:
+    return GuardrailConf(
+        enabled=env.parse(GUARDRAIL_ENABLED),
+        accept_threshold=env.parse(GUARDRAIL_ACCEPT_THRESHOLD),
+        reject_threshold=env.parse(GUARDRAIL_REJECT_THRESHOLD),
+    )
+
+@cached
+def get_embedding_model() -> str:
+    return env.parse(EMBEDDING_MODEL)
+
+@cached
+def get_few_shot_conf() -> FewShotConf:
+    return FewShotConf(
+        index_path=env.parse(FEW_SHOT_INDEX_PATH) or None,
+        examples=env.parse(FEW_SHOT_EXAMPLES),
+    )
+
+@cached
+def get_idiom_dictionary_path() -> str | None:
+    return env.parse(IDIOM_DICTIONARY_PATH) or None
@@ -1,13 +1,73 @@
 """Centralized initialization and deinitialization for the API."""
 
+import asyncio
+import time
+
 from fastapi import FastAPI
 
+from routes import adaptation
+from utils import loadshed, log, metrics, tracing
+from workflows import embeddings, examples, idioms, llm, metaphor, priority, usage
+import conf
+
+logger = log.get_logger(__name__)
+
+
+def warm_up() -> None:
+    """Loads everything the first request would otherwise pay for."""
+    # Drop expression cache entries left behind by older prompts/models
+    if cache := metaphor.get_expression_cache():
+        cache.invalidate()
+    metaphor.get_graph()
+    # Opening the checkpointer also expires checkpoints of abandoned runs
+    if checkpointer := metaphor.get_checkpointer():
+        metaphor.get_graph(checkpointer)
+    llm.get_llm()
+    llm.get_upstream_limiter()
+    priority.get_scheduler()
+    usage.get_ledger()
+    adaptation.get_adaptation_store()
+    if conf.get_guardrail_conf().enabled:
+        # Without its model, the guardrail is skipped rather than the service kept unready
+        embeddings.get_encoder_or_none()
+    # Memory-map the few-shot index up front rather than on the first request
+    examples.get_index()
+    idioms.get_dictionary()
+
+
+async def _warm_up(app: FastAPI) -> None:
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(warm_up)
+    except Exception:
+        logger.exception("Warm-up failed; the service will not report ready")
+        return
+    app.state.ready = True
+    metrics.gauge("ready", 1)
+    logger.info(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
+
 
 async def init(app: FastAPI) -> None:
     """Initialize all components during app startup."""
-    pass
+    # Warm up in the background so the server starts listening (and /health
+    # answers) right away; /ready reports when warm-up is done
+    tracing.init()
+    loadshed.init()
+    app.state.ready = False
+    metrics.gauge("ready", 0)
+    app.state.warm_up = asyncio.create_task(_warm_up(app))
 
 
 async def deinit(app: FastAPI) -> None:
     """Deinitialize all components during app shutdown."""
-    pass
+    # The warm-up thread can't be interrupted; let it finish before closing
+    await asyncio.gather(app.state.warm_up, return_exceptions=True)
+    metaphor.close()
+    examples.close()
+    idioms.close()
+    llm.close()
+    priority.close()
+    usage.close()
+    adaptation.close_adaptation_store()
+    loadshed.close()
+    tracing.close()
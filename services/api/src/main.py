@@ -1,10 +1,18 @@
+import os
+import tempfile
 import uvicorn
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from utils import log
+from utils.responses import FastJSONResponse
+from utils.loadshed import LoadShedMiddleware
+from utils.tracing import TracingMiddleware
 from routes.base import router
 from routes.adaptation import router as adaptation_router
+from routes.live import router as live_router
+from routes.documents import router as documents_router
 import conf
 from init import init, deinit
 
@@ -34,10 +42,13 @@ app = FastAPI(
     docs_url="/docs",
     lifespan=lifespan,
     debug=conf.get_http_expose_errors(),
+    default_response_class=FastJSONResponse if conf.get_http_fast_json() else JSONResponse,
 )
 
 app.include_router(router)
 app.include_router(adaptation_router)
+app.include_router(live_router)
+app.include_router(documents_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -46,18 +57,33 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TracingMiddleware)
+# Outermost, so that shed requests cost as little as possible
+app.add_middleware(LoadShedMiddleware)
 
 def main() -> None:
     if not conf.validate():
         raise ValueError("Invalid configuration.")
 
     http_conf = conf.get_http_conf()
-    logger.info(f"Starting API on port {http_conf.port}")
+    workers = max(1, http_conf.workers)
+    if workers > 1 and http_conf.autoreload:
+        logger.warning("HTTP_AUTORELOAD does not support multiple workers; starting a single worker")
+        workers = 1
+    if workers > 1 and not conf.get_shared_state_path():
+        # Workers inherit the environment, so they all pick up the same store
+        path = os.path.join(tempfile.gettempdir(), "e2r-shared-state.sqlite3")
+        os.environ[conf.SHARED_STATE_PATH.id] = path
+        conf.reload()
+        logger.info(f"Sharing caches and rate limits between workers via {path}")
+
+    logger.info(f"Starting API on port {http_conf.port} with {workers} worker(s)")
     uvicorn.run(
         "main:app",
         host=http_conf.host,
         port=http_conf.port,
         reload=http_conf.autoreload,
+        workers=workers,
         log_level="info",
         log_config=None
     )
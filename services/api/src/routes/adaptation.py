@@ -1,13 +1,36 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, HTTPException, Query, Response
 from pydantic import BaseModel
-from typing import List
+from typing import Annotated, Awaitable, Callable, Dict, List
+import asyncio
+import hashlib
+import math
 import uuid
 import datetime
-from workflows.metaphor import process_text
+import orjson
+import conf
+from routes.utils import OptionalRequestPrincipal
+from utils import log, metrics
+from utils.cache import Cache
+from utils.responses import FastJSONResponse
+from utils.singleflight import SingleFlight
+from utils.store import Store
+from workflows.incremental import process_text_incremental
+from workflows.metaphor import get_edits, process_text, workflow_version
+from workflows.spans import TYPES, Spans
+from workflows import deadline, priority, usage
+
+logger = log.get_logger(__name__)
 
 # Define models here since they are simple and specific to this endpoint for now
 class AdaptationRequest(BaseModel):
     text: str
+    # Return a CompactAdaptationResponse instead of the full response
+    compact: bool = False
+    # Id of an adaptation of an earlier version of this text; only the
+    # changed parts of the text are then re-analyzed
+    previousId: str | None = None
+    # Include the token usage and cost of this request in the response
+    includeUsage: bool = False
 
 class FigurativeExpression(BaseModel):
     id: str
@@ -18,31 +41,395 @@ class FigurativeExpression(BaseModel):
     explanation: str
     simplifiedVersion: str
 
+class ModelUsage(BaseModel):
+    calls: int
+    inputTokens: int
+    outputTokens: int
+    costUsd: float
+
+class UsageReport(BaseModel):
+    inputTokens: int
+    outputTokens: int
+    costUsd: float
+    models: Dict[str, ModelUsage]
+
 class AdaptationResponse(BaseModel):
     id: str
     originalText: str
     adaptedText: str
     expressions: List[FigurativeExpression]
     createdAt: str
+    # The deadline was reached before every expression was simplified; those
+    # left have an empty explanation and keep their original wording
+    partial: bool = False
+    usage: UsageReport | None = None
+
+class CompactAdaptationResponse(BaseModel):
+    """
+    Offset-based variant of AdaptationResponse for large texts. Expression i
+    spans originalText[spans[2i]:spans[2i+1]] and has type types[typeIds[i]];
+    adaptedText is originalText with each [start, end, replacement] edit applied.
+    """
+    id: str
+    originalText: str
+    types: List[str]
+    spans: List[int]
+    typeIds: List[int]
+    explanations: List[str]
+    edits: List[tuple[int, int, str]]
+    createdAt: str
+    partial: bool = False
+    usage: UsageReport | None = None
+
+class AdaptationPage(BaseModel):
+    # Newest first
+    data: List[AdaptationResponse | CompactAdaptationResponse]
+    total: int
+    page: int
+    pageSize: int
+    totalPages: int
 
 router = APIRouter()
 
-@router.post("/adapt", response_model=AdaptationResponse)
-async def adapt_text(request: AdaptationRequest):
+# Identical texts submitted concurrently share one workflow run
+adaptations_in_flight = SingleFlight("adapt")
+
+_adaptation_store: Store | None = None
+
+def get_adaptation_store() -> Store:
+    global _adaptation_store
+    if _adaptation_store is None:
+        _adaptation_store = Store(
+            "adaptations",
+            path=conf.get_adaptation_store_path(),
+            max_documents=conf.get_adaptation_store_max_documents(),
+        )
+    return _adaptation_store
+
+def close_adaptation_store() -> None:
+    global _adaptation_store, _response_cache
+    if _adaptation_store is not None:
+        _adaptation_store.close()
+        _adaptation_store = None
+    _response_cache = None
+
+def adaptation_key(text: str, previous_id: str | None = None, principal: str = usage.ANONYMOUS) -> str:
+    # Runs are shared by a principal's requests only, as their usage and
+    # budget are the principal's
+    return hashlib.sha256(f"{workflow_version()}\x00{principal}\x00{previous_id}\x00{text}".encode()).hexdigest()
+
+def shift(expressions: list[dict], offset: int) -> list[dict]:
+    return [
+        {**e, "startIndex": e["startIndex"] + offset, "endIndex": e["endIndex"] + offset}
+        for e in expressions
+    ]
+
+def server_timing(timings: dict[str, float]) -> str:
+    return ", ".join(f"{stage.replace('.', '-')};dur={ms:.1f}" for stage, ms in timings.items())
+
+async def in_worker(fn: Callable[..., dict], *args) -> dict:
     """
-    Receive text, log it to console, and return a mock response.
+    Runs a workflow in a worker thread, in a deadline scope of its own that is
+    cancelled along with the task: cancelling the task alone would leave the
+    thread running, and its LLM calls with it.
     """
-    # Log to console as requested
-    print(f"Received adaptation request: {request.text}")
+    with deadline.within(None) as scope:
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except asyncio.CancelledError:
+            scope.cancel()
+            raise
 
-    # Run workflow
-    result = process_text(request.text)
+async def run_coalesced(key: str, text: str, run: Callable[[], Awaitable[dict]]) -> dict:
+    """
+    Runs the workflow for `key`, or joins the run already in flight for it.
+    A joined run keeps the deadline of the request that started it, so a
+    request that joined waits no longer than its own deadline (and then gets
+    `text` back unanalyzed, as partial), and takes the result only if the run
+    did not stop at that other deadline: otherwise it runs again, under its
+    own.
+    """
+    while True:
+        if not adaptations_in_flight.pending(key):
+            return await adaptations_in_flight.do(key, run)
+        try:
+            state = await asyncio.wait_for(adaptations_in_flight.do(key, run), deadline.remaining())
+        except TimeoutError:
+            logger.info("Deadline reached waiting for a coalesced run; returning the text unanalyzed")
+            return {"result": text, "expressions": [], "partial": True, "timings": {}}
+        except deadline.DeadlineExceeded:
+            if deadline.expired():
+                raise
+        else:
+            if not state.get("partial") or deadline.expired():
+                return state
+        metrics.inc("singleflight_reruns_total", flight=adaptations_in_flight.name)
 
-    # Mock response
+def workflow_timeout(requested: float | None) -> float | None:
+    """
+    Seconds the workflow may run for: the configured request timeout or the
+    client's, whichever is shorter, less the reserve for returning results.
+    """
+    deadline_conf = conf.get_deadline_conf()
+    timeouts = [t for t in (deadline_conf.timeout_seconds, requested) if t]
+    if not timeouts:
+        return None
+    return max(min(timeouts) - deadline_conf.reserve_seconds, 0.0)
+
+def new_record(text: str, state: dict, usage_report: dict | None = None) -> dict:
+    """The stored form of an adaptation, which both response shapes are built from."""
+    return {
+        "id": str(uuid.uuid4()),
+        "originalText": text,
+        "adaptedText": state["result"], # Result from LangGraph workflow
+        "expressions": state["expressions"],
+        "createdAt": datetime.datetime.now().isoformat(),
+        "partial": state.get("partial", False),
+        "usage": usage_report,
+    }
+
+def build_response(record: dict, include_usage: bool = False) -> AdaptationResponse:
+    text = record["originalText"]
     return AdaptationResponse(
-        id=str(uuid.uuid4()),
-        originalText=request.text,
-        adaptedText=result, # Result from LangGraph workflow
-        expressions=[],
-        createdAt=datetime.datetime.now().isoformat()
+        id=record["id"],
+        originalText=text,
+        adaptedText=record["adaptedText"],
+        expressions=[
+            FigurativeExpression(
+                id=f"expr-{i + 1}",
+                original=text[expression["startIndex"]:expression["endIndex"]],
+                **expression,
+            )
+            for i, expression in enumerate(record["expressions"])
+        ],
+        createdAt=record["createdAt"],
+        partial=record.get("partial", False),
+        usage=record.get("usage") if include_usage else None,
+    )
+
+def build_compact_response(record: dict, include_usage: bool = False) -> CompactAdaptationResponse:
+    spans = Spans.from_expressions(record["expressions"])
+    return CompactAdaptationResponse(
+        id=record["id"],
+        originalText=record["originalText"],
+        types=list(TYPES),
+        spans=spans.offsets(),
+        typeIds=spans.type_ids.tolist(),
+        explanations=[e["explanation"] for e in record["expressions"]],
+        edits=get_edits(record["expressions"]),
+        createdAt=record["createdAt"],
+        partial=record.get("partial", False),
+        usage=record.get("usage") if include_usage else None,
     )
+
+@router.post("/adapt", response_model=AdaptationResponse | CompactAdaptationResponse)
+async def adapt_text(
+    request: AdaptationRequest,
+    http_response: Response,
+    principal: OptionalRequestPrincipal,
+    x_request_timeout: Annotated[float | None, Header(gt=0)] = None,
+    x_priority: Annotated[priority.Lane, Header()] = "interactive",
+):
+    """
+    Receive text, run it through the adaptation workflow and return the result.
+    The optional X-Request-Timeout header (in seconds) shortens the deadline,
+    and X-Priority: batch or background runs the request's LLM calls in a
+    lower priority lane.
+    """
+    # Log to console as requested
+    print(f"Received adaptation request: {request.text}")
+
+    store = get_adaptation_store()
+    principal_id = principal.claims.get("sub") or usage.ANONYMOUS
+
+    if request.previousId is None:
+        # Surrounding whitespace doesn't change the analysis, so requests that
+        # differ only in it share a run; offsets are shifted back per request
+        text = request.text.strip()
+        leading = request.text[:len(request.text) - len(request.text.lstrip())]
+        trailing = request.text[len(leading) + len(text):]
+        run = lambda: in_worker(process_text, text, key)
+    else:
+        previous = store.get(request.previousId, owner=principal_id)
+        if previous is None:
+            raise HTTPException(status_code=404, detail="Previous adaptation not found")
+        text, leading, trailing = request.text, "", ""
+        run = lambda: in_worker(
+            process_text_incremental, text, previous["originalText"], previous["expressions"], key,
+        )
+    # Also identifies the workflow run, so that retrying a request whose run
+    # failed resumes it
+    key = adaptation_key(text, request.previousId, principal_id)
+
+    # Run workflow (off the event loop). LLM usage is accounted to this
+    # request; requests coalesced onto another one's run cost nothing extra,
+    # but do not inherit its deadline (see run_coalesced).
+    with (
+        usage.track(principal_id) as request_usage,
+        priority.lane(x_priority),
+        deadline.within(workflow_timeout(x_request_timeout)),
+    ):
+        try:
+            state = await run_coalesced(key, text, run)
+        except usage.BudgetExceeded as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        except deadline.DeadlineExceeded as e:
+            metrics.inc("deadline_exceeded_total", outcome="timeout")
+            raise HTTPException(status_code=504, detail=str(e))
+    if state.get("partial"):
+        metrics.inc("deadline_exceeded_total", outcome="partial")
+
+    record = new_record(request.text, {
+        "result": leading + state["result"] + trailing,
+        "expressions": shift(state["expressions"], len(leading)),
+        "partial": state.get("partial", False),
+    }, request_usage.report())
+    store.put(record["id"], record, owner=principal_id)
+
+    if request.compact:
+        response = build_compact_response(record, request.includeUsage)
+    else:
+        response = build_response(record, request.includeUsage)
+    headers = {"Server-Timing": server_timing(state.get("timings", {}))}
+    if conf.get_http_fast_json():
+        return FastJSONResponse(response, headers=headers)
+    http_response.headers.update(headers)
+    return response
+
+#### Reads ####
+
+# Part of every ETag; bump it when the response models change, so that
+# clients and caches do not reuse responses of the old shape
+RESPONSE_VERSION = 1
+
+_response_cache: Cache | None = None
+
+def get_response_cache() -> Cache | None:
+    """Rendered adaptation responses by ETag, or None if disabled."""
+    global _response_cache
+    entries = conf.get_adaptation_response_cache_entries()
+    if entries <= 0:
+        return None
+    if _response_cache is None:
+        _response_cache = Cache(f"adaptation-responses-{RESPONSE_VERSION}", max_entries=entries)
+    return _response_cache
+
+def representation_key(id: str, compact: bool, include_usage: bool) -> str:
+    """Identifies one rendered representation of an adaptation."""
+    shape = "compact" if compact else "full"
+    return f'{id}-{shape}{"-usage" if include_usage else ""}-{RESPONSE_VERSION}'
+
+def owner_tag(owner: str) -> str:
+    return hashlib.sha256(owner.encode()).hexdigest()[:16]
+
+def adaptation_etag(id: str, compact: bool, include_usage: bool, owner: str) -> str:
+    """
+    Strong ETag of one representation of an adaptation, which never changes.
+    It includes the owner, so that a response is never revalidated for
+    another principal.
+    """
+    return f'"{representation_key(id, compact, include_usage)}-{owner_tag(owner)}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header lists `etag`, compared weakly as RFC 9110 asks."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def cache_control(max_age: int | None) -> str:
+    # Without auth, adaptations are the same for everyone and may be kept by
+    # shared caches; with auth, only by the client
+    scope = "private" if conf.USE_AUTH else "public"
+    if max_age is None:
+        return f"{scope}, no-cache"
+    return f"{scope}, max-age={max_age}, immutable"
+
+def render_adaptations(ids: list[str], compact: bool, include_usage: bool) -> tuple[list[bytes], int]:
+    """
+    JSON of each stored adaptation in `ids`, in order, from the response cache
+    or else loaded, rendered and cached; and how many were not cached.
+    Adaptations no longer in the store are left out. The ids must already be
+    checked to belong to the caller.
+    """
+    cache = get_response_cache()
+    bodies = {}
+    if cache is not None:
+        for id in ids:
+            if (body := cache.get(representation_key(id, compact, include_usage))) is not None:
+                bodies[id] = body
+    missing = [id for id in ids if id not in bodies]
+    build = build_compact_response if compact else build_response
+    for id, record in get_adaptation_store().get_many(missing).items():
+        bodies[id] = FastJSONResponse(build(record, include_usage)).body
+        if cache is not None:
+            cache.put(representation_key(id, compact, include_usage), bodies[id])
+    return [bodies[id] for id in ids if id in bodies], len(missing)
+
+@router.get("/api/adaptations", response_model=AdaptationPage)
+async def list_adaptations(
+    principal: OptionalRequestPrincipal,
+    page: Annotated[int, Query(ge=1)] = 1,
+    page_size: Annotated[int, Query(alias="pageSize", ge=1, le=100)] = 10,
+    compact: bool = False,
+    include_usage: Annotated[bool, Query(alias="includeUsage")] = False,
+    if_none_match: Annotated[str | None, Header()] = None,
+):
+    """
+    The caller's stored adaptations, newest first. The ETag covers the caller,
+    the ids on the page and the total, so a client polling the list gets an
+    empty 304 until one of its adaptations is added or removed.
+    """
+    owner = principal.claims.get("sub") or usage.ANONYMOUS
+    store = get_adaptation_store()
+    total = store.count(owner=owner)
+    ids = store.ids(offset=(page - 1) * page_size, limit=page_size, owner=owner)
+    digest = hashlib.sha256(
+        f"{owner}\x00{page}\x00{page_size}\x00{total}\x00{compact}\x00{include_usage}\x00{RESPONSE_VERSION}\x00{' '.join(ids)}".encode()
+    ).hexdigest()
+    etag = f'"{digest[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control(None)}
+    if etag_matches(if_none_match, etag):
+        metrics.inc("adaptation_reads_total", kind="list", outcome="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    # The page is assembled from the JSON of each adaptation, which is
+    # usually cached, rather than rendered as a whole
+    bodies, rendered = render_adaptations(ids, compact, include_usage)
+    metrics.inc("adaptation_reads_total", kind="list", outcome="rendered" if rendered else "cached")
+    data = b",".join(bodies)
+    meta = orjson.dumps({
+        "total": total, "page": page, "pageSize": page_size, "totalPages": math.ceil(total / page_size),
+    })
+    return Response(b'{"data":[' + data + b"]," + meta[1:], media_type="application/json", headers=headers)
+
+@router.get("/api/adaptations/{id}", response_model=AdaptationResponse | CompactAdaptationResponse)
+async def get_adaptation(
+    id: str,
+    principal: OptionalRequestPrincipal,
+    compact: bool = False,
+    include_usage: Annotated[bool, Query(alias="includeUsage")] = False,
+    if_none_match: Annotated[str | None, Header()] = None,
+):
+    """
+    A stored adaptation of the caller's; other principals' adaptations are not
+    found. Adaptations never change, so the response has a strong ETag and may
+    be reused for ADAPTATION_CACHE_MAX_AGE_SECONDS; revalidating it with
+    If-None-Match returns an empty 304.
+    """
+    owner = principal.claims.get("sub") or usage.ANONYMOUS
+    store = get_adaptation_store()
+    if not store.contains(id, owner=owner):
+        raise HTTPException(status_code=404, detail="Adaptation not found")
+    etag = adaptation_etag(id, compact, include_usage, owner)
+    headers = {"ETag": etag, "Cache-Control": cache_control(conf.get_adaptation_cache_max_age_seconds())}
+    if etag_matches(if_none_match, etag):
+        metrics.inc("adaptation_reads_total", kind="detail", outcome="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    bodies, rendered = render_adaptations([id], compact, include_usage)
+    if not bodies:
+        raise HTTPException(status_code=404, detail="Adaptation not found")
+    metrics.inc("adaptation_reads_total", kind="detail", outcome="rendered" if rendered else "cached")
+    return Response(bodies[0], media_type="application/json", headers=headers)
@@ -5,8 +5,11 @@ import time
 from pathlib import Path
 from typing import Optional, List
 from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.responses import JSONResponse
 
-from utils import log
+from routes.utils import OptionalRequestPrincipal
+from utils import log, metrics
+from workflows import usage
 import conf
 # from routes.utils import RequestPrincipal # NOTE: uncomment to use auth
 # from routes.utils import DBSession # NOTE: uncomment to use postgres
@@ -42,6 +45,26 @@ def get_app_version() -> str:
 async def root():
     return {"message": "Hello World"}
 
+@router.get("/metrics")
+async def get_metrics():
+    """In-process counters and gauges."""
+    return metrics.snapshot()
+
+@router.get("/usage")
+async def get_usage(
+    principal: OptionalRequestPrincipal,
+    day: Optional[str] = Query(None, description="UTC day (YYYY-MM-DD); all time if omitted"),
+):
+    """The caller's LLM calls, tokens and cost per model."""
+    return usage.get_ledger().summary(day, principal=principal.claims.get("sub") or usage.ANONYMOUS)
+
+@router.get("/ready")
+async def readiness_check(request: Request):
+    """Readiness probe: 503 until warm-up has finished, 200 afterwards."""
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+    return {"status": "ready"}
+
 @router.get("/health")
 async def health_check(
     request: Request,
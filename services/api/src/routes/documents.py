@@ -0,0 +1,250 @@
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import ClientDisconnect
+from typing import IO, Annotated, Iterator
+import asyncio
+import collections
+import json
+import tempfile
+import conf
+from routes.adaptation import adaptation_key, in_worker, run_coalesced, shift, workflow_timeout
+from routes.utils import OptionalRequestPrincipal
+from utils import log, metrics
+from workflows.documents import SPOOL_MEMORY_BYTES, Chunk, Chunker, UnsupportedDocument, detect_format, get_reader
+from workflows.metaphor import process_text
+from workflows import deadline, priority, usage
+
+logger = log.get_logger(__name__)
+
+router = APIRouter()
+
+#### Uploads ####
+
+class RawUpload():
+    """A document sent as the request body itself."""
+
+    def __init__(self, filename: str | None, media_type: str | None):
+        self.filename = filename
+        self.media_type = media_type
+
+    def write(self, data: bytes) -> list[bytes]:
+        return [data]
+
+class MultipartUpload():
+    """
+    The first file of a multipart/form-data body, parsed as the body arrives.
+    Other fields are skipped.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.filename: str | None = None
+        self.media_type: str | None = None
+        self._data: list[bytes] = []
+        self._headers: dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+        self._in_file = False
+        self._done = False
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def write(self, data: bytes) -> list[bytes]:
+        """Parses the next part of the body; returns the file data in it."""
+        self._parser.write(data)
+        data, self._data = self._data, []
+        return data
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._field.lower()] = self._value
+        self._field, self._value = b"", b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self._done or b"filename" not in options:
+            return
+        self._in_file = True
+        self.filename = options[b"filename"].decode("utf-8", "replace")
+        self.media_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file:
+            self._data.append(data[start:end])
+
+    def _on_part_end(self) -> None:
+        if self._in_file:
+            self._in_file = False
+            self._done = True
+
+#### Processing ####
+
+async def adapt_chunk(chunk: Chunk, principal: str) -> dict:
+    """
+    Adapts one chunk under its own deadline; expression offsets are document
+    offsets. Identical chunks in flight at once, in this document or in other
+    requests of the principal, share one run (and so one checkpoint).
+    """
+    key = adaptation_key(chunk.text, principal=principal)
+    with deadline.within(workflow_timeout(None)):
+        try:
+            state = await run_coalesced(key, chunk.text, lambda: in_worker(process_text, chunk.text, key))
+        except usage.BudgetExceeded as e:
+            return {"index": chunk.index, "offset": chunk.offset, "status": 429, "error": str(e)}
+        except deadline.DeadlineExceeded as e:
+            return {"index": chunk.index, "offset": chunk.offset, "status": 504, "error": str(e)}
+        except Exception as e:
+            # One failed chunk does not fail the rest of the document
+            logger.exception(f"Chunk {chunk.index} at offset {chunk.offset} failed")
+            return {"index": chunk.index, "offset": chunk.offset, "status": 500, "error": str(e)}
+    return {
+        "index": chunk.index,
+        "offset": chunk.offset,
+        "originalText": chunk.text,
+        "adaptedText": state["result"],
+        "expressions": shift(
+            [{**e, "original": chunk.text[e["startIndex"]:e["endIndex"]]} for e in state["expressions"]],
+            chunk.offset,
+        ),
+        "partial": state.get("partial", False),
+    }
+
+def read_results(results: IO[bytes], block_size: int = 64 * 1024) -> Iterator[bytes]:
+    try:
+        results.seek(0)
+        while block := results.read(block_size):
+            yield block
+    finally:
+        results.close()
+
+@router.post("/adapt/document")
+async def adapt_document(
+    request: Request,
+    principal: OptionalRequestPrincipal,
+    filename: str | None = None,
+    x_priority: Annotated[priority.Lane, Header()] = "batch",
+):
+    """
+    Adapt a .txt, .md, .docx or .pdf document of up to DOCUMENT_MAX_BYTES,
+    sent either as a multipart/form-data file or as the request body (named
+    by the `filename` query parameter or typed by its Content-Type). The
+    document is cut into sentence chunks as it arrives, and chunks are
+    adapted while the rest is still being uploaded. The response is NDJSON:
+    one line per chunk, in order, followed by a summary line.
+    """
+    document_conf = conf.get_document_conf()
+    if int(request.headers.get("content-length") or 0) > document_conf.max_bytes:
+        raise HTTPException(status_code=413, detail=f"Documents are limited to {document_conf.max_bytes} bytes")
+    content_type = request.headers.get("content-type", "")
+    media_type, options = parse_options_header(content_type)
+    if media_type == b"multipart/form-data":
+        if b"boundary" not in options:
+            raise HTTPException(status_code=400, detail="Missing multipart boundary")
+        upload = MultipartUpload(options[b"boundary"])
+    else:
+        upload = RawUpload(filename, content_type)
+
+    concurrency = max(1, document_conf.concurrency)
+    slots = asyncio.Semaphore(concurrency)
+    chunker = Chunker(document_conf.chunk_chars)
+    # Results are written to a spooled file in order as they complete and
+    # only sent once the upload has been read in full
+    results = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    pending: collections.deque[asyncio.Task] = collections.deque()
+    reader = None
+    fmt = None
+    size = 0
+    counts = collections.Counter()
+
+    async def adapt(chunk: Chunk) -> dict:
+        async with slots:
+            return await adapt_chunk(chunk, principal_id)
+
+    async def write_next() -> None:
+        result = await pending.popleft()
+        outcome = "failed" if "error" in result else "partial" if result["partial"] else "ok"
+        counts[outcome] += 1
+        metrics.inc("document_chunks_total", outcome=outcome)
+        results.write(json.dumps(result, ensure_ascii=False).encode() + b"\n")
+
+    def abort() -> None:
+        # Also aborts the upstream calls of chunks still in flight
+        scope.cancel()
+        for task in pending:
+            task.cancel()
+        results.close()
+
+    async def submit(text: str) -> None:
+        for chunk in chunker.feed(text):
+            # Reading the upload waits while this many chunks are unfinished
+            while len(pending) >= 2 * concurrency:
+                await write_next()
+            pending.append(asyncio.ensure_future(adapt(chunk)))
+
+    principal_id = principal.claims.get("sub") or usage.ANONYMOUS
+    with (
+        usage.track(principal_id) as document_usage,
+        priority.lane(x_priority),
+        deadline.within(None) as scope,
+    ):
+        try:
+            async for data in request.stream():
+                size += len(data)
+                if size > document_conf.max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Documents are limited to {document_conf.max_bytes} bytes")
+                for part in upload.write(data):
+                    if reader is None:
+                        fmt = detect_format(upload.filename, upload.media_type)
+                        reader = get_reader(fmt)
+                    await submit(reader.feed(part))
+            if reader is None:
+                raise HTTPException(status_code=400, detail="No document in the request")
+            # Spooled formats are parsed only now, off the event loop
+            rest = reader.finish()
+            while (text := await asyncio.to_thread(next, rest, None)) is not None:
+                await submit(text)
+            for chunk in chunker.finish():
+                pending.append(asyncio.ensure_future(adapt(chunk)))
+            while pending:
+                await write_next()
+        except UnsupportedDocument as e:
+            abort()
+            raise HTTPException(status_code=415, detail=str(e))
+        except ClientDisconnect:
+            abort()
+            logger.info(f"Client disconnected during the upload of {upload.filename or 'a document'}")
+            raise HTTPException(status_code=499, detail="Client disconnected")
+        except BaseException:
+            abort()
+            raise
+        finally:
+            if reader is not None:
+                reader.close()
+
+    metrics.inc("documents_total", format=fmt)
+    summary = {
+        "done": True,
+        "chunks": sum(counts.values()),
+        "failed": counts["failed"],
+        "partial": counts["partial"],
+        "characters": chunker.characters,
+        "bytes": size,
+        "usage": document_usage.report(),
+    }
+    results.write(json.dumps(summary).encode() + b"\n")
+    return StreamingResponse(read_results(results), media_type="application/x-ndjson")
@@ -0,0 +1,150 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, ValidationError
+from typing import NamedTuple
+import asyncio
+import functools
+import json
+from routes.adaptation import (
+    AdaptationResponse,
+    CompactAdaptationResponse,
+    build_compact_response,
+    build_response,
+    get_adaptation_store,
+    new_record,
+    workflow_timeout,
+)
+from routes.utils import OptionalRequestPrincipal
+from utils import log, metrics
+from workflows.incremental import process_text_incremental
+from workflows.metaphor import process_text
+from workflows import deadline, usage
+import conf
+
+logger = log.get_logger(__name__)
+
+class LiveRevision(BaseModel):
+    # Increasing number the client gives each revision; echoed in the result
+    revision: int
+    text: str
+    compact: bool = False
+    includeUsage: bool = False
+
+class LiveResult(BaseModel):
+    revision: int
+    status: int = 200
+    adaptation: AdaptationResponse | CompactAdaptationResponse | None = None
+    error: str | None = None
+
+class LiveRun(NamedTuple):
+    revision: LiveRevision
+    task: asyncio.Task
+    scope: deadline.Scope
+    usage: usage.Usage
+
+router = APIRouter()
+
+async def receive_message(websocket: WebSocket) -> str | bytes:
+    """The data of the next text or binary message."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    return message.get("text") or message.get("bytes") or ""
+
+@router.websocket("/adapt/live")
+async def adapt_live(websocket: WebSocket, principal: OptionalRequestPrincipal):
+    """
+    As-you-type adaptation. The client sends revisions of its text as
+    LiveRevision messages; a revision is analyzed once no newer one has arrived
+    for LIVE_DEBOUNCE_MS and answered with a LiveResult. A newer revision
+    cancels the run of an older one along with its upstream calls, and
+    sentences unchanged since the last result are not analyzed again.
+    """
+    await websocket.accept()
+    debounce = conf.get_live_debounce_ms() / 1000
+    principal_id = principal.claims.get("sub") or usage.ANONYMOUS
+    store = get_adaptation_store()
+
+    # Newest revision, waiting for the debounce time to pass
+    queued: LiveRevision | None = None
+    running: LiveRun | None = None
+    # Last complete result, which the next run reuses unchanged sentences of
+    base: dict | None = None
+
+    def start(revision: LiveRevision) -> LiveRun:
+        if base is None:
+            run = functools.partial(process_text, revision.text)
+        else:
+            run = functools.partial(
+                process_text_incremental, revision.text, base["originalText"], base["expressions"],
+            )
+        with usage.track(principal_id) as run_usage, deadline.within(workflow_timeout(None)) as scope:
+            task = asyncio.ensure_future(asyncio.to_thread(run))
+        # Superseded runs are not awaited
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return LiveRun(revision, task, scope, run_usage)
+
+    def finish(run: LiveRun) -> LiveResult:
+        nonlocal base
+        revision = run.revision
+        try:
+            state = run.task.result()
+        except usage.BudgetExceeded as e:
+            return LiveResult(revision=revision.revision, status=429, error=str(e))
+        except deadline.DeadlineExceeded as e:
+            return LiveResult(revision=revision.revision, status=504, error=str(e))
+        except Exception:
+            logger.exception(f"Live adaptation of revision {revision.revision} failed")
+            return LiveResult(revision=revision.revision, status=500, error="Adaptation failed")
+
+        record = new_record(revision.text, state, run.usage.report())
+        store.put(record["id"], record, owner=principal_id)
+        if not record["partial"]:
+            base = record
+        metrics.inc("live_revisions_total", outcome="completed")
+        if revision.compact:
+            adaptation = build_compact_response(record, revision.includeUsage)
+        else:
+            adaptation = build_response(record, revision.includeUsage)
+        return LiveResult(revision=revision.revision, adaptation=adaptation)
+
+    receive = asyncio.ensure_future(receive_message(websocket))
+    try:
+        while True:
+            waiting = {receive} if running is None else {receive, running.task}
+            done, _ = await asyncio.wait(
+                waiting, timeout=debounce if queued is not None else None, return_when=asyncio.FIRST_COMPLETED,
+            )
+            if receive in done:
+                data = receive.result()
+                receive = asyncio.ensure_future(receive_message(websocket))
+                # A malformed message is answered, and the connection kept
+                try:
+                    message = json.loads(data)
+                except ValueError as e:
+                    result = LiveResult(revision=-1, status=400, error=f"Invalid JSON: {e}")
+                    await websocket.send_text(result.model_dump_json(exclude_none=True))
+                    continue
+                try:
+                    queued = LiveRevision.model_validate(message)
+                except ValidationError as e:
+                    revision = message.get("revision", -1) if isinstance(message, dict) else -1
+                    result = LiveResult(revision=revision if isinstance(revision, int) else -1, status=422, error=str(e))
+                    await websocket.send_text(result.model_dump_json(exclude_none=True))
+                    continue
+                if running is not None:
+                    running.scope.cancel()
+                    running = None
+                    metrics.inc("live_revisions_total", outcome="superseded")
+            elif running is not None and running.task in done:
+                result = finish(running)
+                running = None
+                await websocket.send_text(result.model_dump_json(exclude_none=True))
+            elif queued is not None:
+                running = start(queued)
+                queued = None
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receive.cancel()
+        if running is not None:
+            running.scope.cancel()
@@ -1,16 +1,21 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
-from fastapi.security import HTTPBearer
-from typing import Annotated, AsyncGenerator
+from fastapi.requests import HTTPConnection
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from typing import TYPE_CHECKING, Annotated, AsyncGenerator
 from pydantic import BaseModel
-from sqlalchemy.ext.asyncio import AsyncSession
 
-from utils import auth, log
+from utils import log
 import conf
 
 logger = log.get_logger(__name__)
 
 #### Auth ####
 
+# utils.auth (and with it jwt) is only imported by the app when
+# authentication is enabled, so it is a type-checking import here
+if TYPE_CHECKING:
+    from utils.auth import AuthClient as _AuthClient
+
 class InvalidPrincipalException(HTTPException):
     def __init__(self, detail="Invalid principal"):
         super().__init__(
@@ -27,7 +32,7 @@ class PrincipalInfo(BaseModel):
 def get_auth_client(app: FastAPI = Depends()):
     return app.state.auth_client
 
-AuthClient = Annotated[auth.AuthClient, Depends(get_auth_client)]
+AuthClient = Annotated["_AuthClient", Depends(get_auth_client)]
 
 http_bearer = HTTPBearer()
 
@@ -50,6 +55,24 @@ def get_request_principal(
 
 RequestPrincipal = Annotated[PrincipalInfo, Depends(get_request_principal)]
 
+def get_optional_request_principal(request: HTTPConnection) -> PrincipalInfo:
+    """
+    Same as get_request_principal when authentication is enabled; otherwise
+    requests get a principal without claims instead of being rejected. Also
+    works for WebSocket routes.
+    """
+    if not conf.USE_AUTH:
+        return PrincipalInfo(claims={})
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        raise InvalidPrincipalException()
+    return get_request_principal(
+        HTTPAuthorizationCredentials(scheme=scheme, credentials=credentials),
+        request.app.state.auth_client,
+    )
+
+OptionalRequestPrincipal = Annotated[PrincipalInfo, Depends(get_optional_request_principal)]
+
 # NOTE: Implement variants on RequestPrincipal with constraints as needed, e.g.:
 #
 # def get_user_request_principal(
@@ -63,7 +86,10 @@ RequestPrincipal = Annotated[PrincipalInfo, Depends(get_request_principal)]
 
 #### Database ####
 
-async def get_db_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+async def get_db_session(request: Request) -> AsyncGenerator["AsyncSession", None]:
     """
     FastAPI dependency that provides an AsyncSession for database operations.
 
@@ -83,8 +109,17 @@ async def get_db_session(request: Request) -> AsyncGenerator[AsyncSession, None]
         yield session
 
 
-# Type alias for dependency injection
-DBSession = Annotated[AsyncSession, Depends(get_db_session)]
+def __getattr__(name: str):
+    # DBSession is built on first import so that sqlalchemy is only loaded by
+    # services that actually use Postgres
+    if name == "DBSession":
+        from sqlalchemy.ext.asyncio import AsyncSession
+
+        # Type alias for dependency injection
+        global DBSession
+        DBSession = Annotated[AsyncSession, Depends(get_db_session)]
+        return DBSession
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 #### Couchbase ####
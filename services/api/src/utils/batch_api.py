@@ -0,0 +1,100 @@
+"""
+Client for OpenAI-style batch APIs (/files and /batches).
+
+Chat completion requests are written to a JSONL file, which is uploaded and
+run as one batch job; the job is polled until it ends and its output and
+error files are matched back to the requests. BatchTransport plugs this into
+an httpx client, so that an OpenAI-compatible chat client sends its requests
+as batch jobs without knowing: each request blocks its caller until the job
+it was collected into has finished.
+"""
+
+import json
+import time
+
+import httpx
+
+from utils import log, metrics
+from utils.batching import MicroBatcher
+
+logger = log.get_logger(__name__)
+
+ENDPOINT = "/v1/chat/completions"
+
+# Job statuses after which a job makes no more progress
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+class BatchRequestFailed(Exception):
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+#### Client ####
+
+class BatchApiClient():
+    def __init__(self, base_url: str, api_key: str, poll_seconds: float):
+        from openai import OpenAI
+
+        self.poll_seconds = poll_seconds
+        self._client = OpenAI(base_url=base_url, api_key=api_key, max_retries=5)
+
+    def run(self, bodies: list[dict]) -> list[dict | Exception]:
+        """
+        Runs chat completion request bodies as one batch job and returns the
+        response body (or an exception) of each, in order.
+        """
+        lines = [
+            json.dumps({"custom_id": str(i), "method": "POST", "url": ENDPOINT, "body": body})
+            for i, body in enumerate(bodies)
+        ]
+        upload = self._client.files.create(
+            file=("requests.jsonl", "\n".join(lines).encode(), "application/jsonl"), purpose="batch",
+        )
+        job = self._client.batches.create(input_file_id=upload.id, endpoint=ENDPOINT, completion_window="24h")
+        logger.info(f"Submitted batch job {job.id} of {len(bodies)} request(s)")
+        start = time.monotonic()
+        while job.status not in FINAL_STATUSES:
+            time.sleep(self.poll_seconds)
+            job = self._client.batches.retrieve(job.id)
+        elapsed = time.monotonic() - start
+        metrics.inc("batch_api_jobs_total", status=job.status)
+        metrics.inc("batch_api_requests_total", len(bodies))
+        metrics.inc("batch_api_job_seconds_total", elapsed)
+        logger.info(f"Batch job {job.id} {job.status} after {elapsed:.0f}s")
+
+        results: dict[str, dict | Exception] = {}
+        # An expired or cancelled job still returns the requests it finished
+        for file_id in (job.output_file_id, job.error_file_id):
+            if file_id:
+                for line in self._client.files.content(file_id).text.splitlines():
+                    if line.strip():
+                        item = json.loads(line)
+                        results[item["custom_id"]] = parse_result(item)
+        missing = BatchRequestFailed(f"Not answered by batch job {job.id} ({job.status})")
+        return [results.get(str(i), missing) for i in range(len(bodies))]
+
+def parse_result(item: dict) -> dict | Exception:
+    response = item.get("response") or {}
+    if response.get("status_code") == 200:
+        return response["body"]
+    error = item.get("error") or (response.get("body") or {}).get("error") or {}
+    return BatchRequestFailed(error.get("message", "Batch request failed"), response.get("status_code") or 500)
+
+#### Transport ####
+
+class BatchTransport(httpx.BaseTransport):
+    """
+    Answers chat completion requests from batch jobs. Requests of concurrent
+    callers are collected into jobs by the batcher.
+    """
+
+    def __init__(self, batcher: MicroBatcher[dict, dict]):
+        self.batcher = batcher
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        future = self.batcher.submit(json.loads(request.read()))
+        try:
+            body = future.result()
+        except BatchRequestFailed as e:
+            return httpx.Response(e.status_code, json={"error": {"message": str(e)}}, request=request)
+        return httpx.Response(200, json=body, request=request)
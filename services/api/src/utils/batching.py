@@ -0,0 +1,102 @@
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Callable, Generic, TypeVar
+
+from utils import log, metrics
+
+logger = log.get_logger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+#### Micro Batcher ####
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects items submitted by concurrent callers into batches that are
+    processed with one call of `process`, which returns a result (or an
+    exception) per item, in order.
+
+    A batch is dispatched `max_wait` seconds after its first item arrived, or
+    as soon as it reaches `max_size`, measured in `size(item)` units. Batches
+    are processed on a pool of `workers` threads, so a slow batch does not
+    hold up the next one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process: Callable[[list[T]], list[R | Exception]],
+        max_wait: float,
+        max_size: float,
+        size: Callable[[T], float] = lambda item: 1,
+        workers: int = 4,
+    ):
+        self.name = name
+        self.process = process
+        self.max_wait = max_wait
+        self.max_size = max_size
+        self.size = size
+        self._lock = threading.Lock()
+        self._items: list[tuple[T, Future]] = []
+        self._items_size = 0.0
+        self._timer: threading.Timer | None = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"batch-{name}")
+
+    def submit(self, item: T) -> Future:
+        """Adds the item to the open batch; the returned future resolves to its result."""
+        future: Future = Future()
+        size = self.size(item)
+        with self._lock:
+            if self._items and self._items_size + size > self.max_size:
+                self._dispatch()
+            self._items.append((item, future))
+            self._items_size += size
+            if self._items_size >= self.max_size:
+                self._dispatch()
+            elif len(self._items) == 1:
+                self._timer = threading.Timer(self.max_wait, self._expire, args=(self._items,))
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+
+    def close(self) -> None:
+        with self._lock:
+            if self._items:
+                self._dispatch()
+        self._executor.shutdown(wait=True)
+
+    def _expire(self, items: list[tuple[T, Future]]) -> None:
+        with self._lock:
+            # The batch may have been dispatched for its size in the meantime
+            if self._items is items:
+                self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hands the open batch to the pool; called with the lock held."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._items, self._items_size = self._items, [], 0.0
+        metrics.inc("batch_dispatches_total", batcher=self.name)
+        metrics.inc("batch_items_total", len(items), batcher=self.name)
+        self._executor.submit(self._run, items)
+
+    def _run(self, items: list[tuple[T, Future]]) -> None:
+        # Callers that gave up (e.g. on their deadline) cancelled their future
+        live = [(item, future) for item, future in items if not future.cancelled()]
+        if not live:
+            return
+        try:
+            results = self.process([item for item, _ in live])
+        except Exception as e:
+            logger.warning(f"Batch {self.name} of {len(live)} item(s) failed: {e}")
+            results = [e] * len(live)
+        for (_, future), result in zip(live, results):
+            try:
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            except InvalidStateError:
+                pass
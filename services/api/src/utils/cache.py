@@ -0,0 +1,161 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from utils import log, tracing
+
+logger = log.get_logger(__name__)
+
+#### Cache ####
+
+class Cache():
+    """
+    In-memory LRU cache with optional SQLite write-through persistence.
+
+    Every entry belongs to a namespace (e.g. a prompt/model version), and only
+    entries in the current namespace are ever returned, so bumping the namespace
+    invalidates everything cached before it. Values must be JSON-serializable.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        max_entries: int = 10_000,
+        path: str | None = None,
+        max_persisted_entries: int | None = None,
+    ):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_persisted_entries = max_persisted_entries or max_entries * 10
+        self.path = path or None
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        self._db: sqlite3.Connection | None = None
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> Any | None:
+        """Returns the cached value for `key`, or None on a miss."""
+        with tracing.span("cache.get", {"cache.persistent": self._db is not None}) as span:
+            value = self._get(key)
+            span.set_attribute("cache.hit", value is not None)
+            return value
+
+    def _get(self, key: str) -> Any | None:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            value = self._load(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._remember(key, value)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        """Stores `value` under `key` in the current namespace."""
+        with self._lock:
+            self._remember(key, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value), time.time()),
+                )
+                self._db.commit()
+                self._puts_since_prune += 1
+                if self._puts_since_prune >= 1000:
+                    self._prune()
+
+    def invalidate(self, namespace: str | None = None) -> int:
+        """
+        Drops cached entries. With no namespace, drops every entry that does not
+        belong to the current namespace (e.g. after a prompt or model change);
+        otherwise drops all entries of the given namespace.
+        Returns the number of persisted entries removed.
+        """
+        with self._lock:
+            if namespace == self.namespace:
+                self._entries.clear()
+            removed = 0
+            if self._db is not None:
+                if namespace is None:
+                    cursor = self._db.execute(
+                        "DELETE FROM cache WHERE namespace != ?", (self.namespace,)
+                    )
+                else:
+                    cursor = self._db.execute(
+                        "DELETE FROM cache WHERE namespace = ?", (namespace,)
+                    )
+                self._db.commit()
+                removed = cursor.rowcount
+            return removed
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current size."""
+        with self._lock:
+            return {
+                "namespace": self.namespace,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    #### Internals ####
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key: str) -> Any | None:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT value FROM cache WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None:
+            return None
+        self._db.execute(
+            "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+            (time.time(), self.namespace, key),
+        )
+        self._db.commit()
+        return json.loads(row[0])
+
+    def _prune(self) -> None:
+        self._puts_since_prune = 0
+        cursor = self._db.execute(
+            "DELETE FROM cache WHERE rowid IN ("
+            " SELECT rowid FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_persisted_entries,),
+        )
+        self._db.commit()
+        if cursor.rowcount:
+            logger.debug(f"Pruned {cursor.rowcount} persisted cache entries")
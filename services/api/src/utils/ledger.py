@@ -0,0 +1,85 @@
+import datetime
+import sqlite3
+import threading
+
+from utils import log
+
+logger = log.get_logger(__name__)
+
+#### Ledger ####
+
+class UsageLedger():
+    """
+    Token and cost totals per principal, model and (UTC) day on SQLite.
+
+    Kept in memory by default; given a path, the totals are stored in that
+    file and shared by every process using it, so budgets hold across workers.
+    """
+
+    def __init__(self, path: str | None = None):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=30)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            " principal TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " day TEXT NOT NULL,"
+            " calls INTEGER NOT NULL,"
+            " input_tokens INTEGER NOT NULL,"
+            " output_tokens INTEGER NOT NULL,"
+            " cost_usd REAL NOT NULL,"
+            " PRIMARY KEY (principal, model, day))"
+        )
+        self._db.commit()
+
+    def record(self, principal: str, model: str, input_tokens: int, output_tokens: int, cost_usd: float) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO usage VALUES (?, ?, ?, 1, ?, ?, ?)"
+                " ON CONFLICT (principal, model, day) DO UPDATE SET"
+                " calls = calls + 1,"
+                " input_tokens = input_tokens + excluded.input_tokens,"
+                " output_tokens = output_tokens + excluded.output_tokens,"
+                " cost_usd = cost_usd + excluded.cost_usd",
+                (principal, model, today(), input_tokens, output_tokens, cost_usd),
+            )
+            self._db.commit()
+
+    def spent_today(self, principal: str) -> float:
+        """Cost in USD of the principal's calls today, over all models."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COALESCE(SUM(cost_usd), 0) FROM usage WHERE principal = ? AND day = ?",
+                (principal, today()),
+            ).fetchone()
+        return row[0]
+
+    def summary(self, day: str | None = None, principal: str | None = None) -> list[dict]:
+        """Totals per principal and model, for one day or all time, of one principal or all."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT principal, model, SUM(calls), SUM(input_tokens), SUM(output_tokens), SUM(cost_usd)"
+                " FROM usage WHERE (? IS NULL OR day = ?) AND (? IS NULL OR principal = ?)"
+                " GROUP BY principal, model ORDER BY principal, model",
+                (day, day, principal, principal),
+            ).fetchall()
+        return [
+            {
+                "principal": principal,
+                "model": model,
+                "calls": calls,
+                "inputTokens": input_tokens,
+                "outputTokens": output_tokens,
+                "costUsd": round(cost, 6),
+            }
+            for principal, model, calls, input_tokens, output_tokens, cost in rows
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+def today() -> str:
+    return datetime.datetime.now(datetime.UTC).date().isoformat()
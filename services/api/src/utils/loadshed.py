@@ -0,0 +1,150 @@
+"""
+Event loop lag monitoring and load shedding.
+
+A LoopMonitor task sleeps for LOAD_SHED_INTERVAL_MS at a time and measures
+how much later than asked it wakes up: the time callbacks ahead of it held
+the loop. The lag (decaying from its last peak) and the number of requests in
+flight are exported as gauges. While either is beyond the threshold of a
+request's lane (its X-Priority header, or the route's default lane), the
+request is rejected with 503 and Retry-After before any work is done for it,
+so that lower lanes give way first and the pod keeps answering the requests
+that matter. Health and readiness checks are never shed.
+"""
+
+import asyncio
+import math
+
+from fastapi.routing import APIRoute
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from utils import log, metrics
+import conf
+
+logger = log.get_logger(__name__)
+
+# Never shed (nor counted as in flight), so that probes and scrapes get through an overload
+EXEMPT_PATHS = frozenset({"/health", "/ready", "/metrics"})
+
+LANES = ("interactive", "batch", "background")
+
+# The reported lag halves this often once the loop has caught up
+LAG_HALF_LIFE_SECONDS = 1.0
+
+#### Monitor ####
+
+class LoopMonitor():
+    def __init__(self, shed_conf: conf.LoadShedConf):
+        self.conf = shed_conf
+        self.interval = max(shed_conf.interval_ms, 1.0) / 1000
+        self.in_flight = 0
+        self._lag = 0.0
+        self._expected: float | None = None
+        self._sampled = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def lag_ms(self) -> float:
+        """
+        Current lag: the decayed peak of past samples, or the time the monitor
+        is overdue by if that is more, e.g. right after the loop was blocked.
+        """
+        now = asyncio.get_running_loop().time()
+        lag = self._lag * 0.5 ** ((now - self._sampled) / LAG_HALF_LIFE_SECONDS)
+        if self._expected is not None:
+            lag = max(lag, now - self._expected)
+        return lag * 1000
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            decayed = self._lag * 0.5 ** ((now - self._sampled) / LAG_HALF_LIFE_SECONDS)
+            self._lag = max(now - self._expected, decayed)
+            self._sampled = now
+            metrics.gauge("event_loop_lag_ms", round(self._lag * 1000, 1))
+            metrics.gauge("http_requests_in_flight", self.in_flight)
+
+_monitor: LoopMonitor | None = None
+
+def init() -> None:
+    """Starts monitoring the running event loop."""
+    global _monitor
+    close()
+    _monitor = LoopMonitor(conf.get_load_shed_conf())
+    _monitor.start()
+
+def close() -> None:
+    global _monitor
+    if _monitor is not None:
+        _monitor.stop()
+        _monitor = None
+
+def get_monitor() -> LoopMonitor | None:
+    return _monitor
+
+#### Middleware ####
+
+# Default lane by route, read from the route's X-Priority header parameter
+_route_lanes: dict[int, str] = {}
+
+def route_lane(route: APIRoute) -> str:
+    """The lane of a route's requests without an X-Priority header."""
+    lane = _route_lanes.get(id(route))
+    if lane is None:
+        defaults = [param.default for param in route.dependant.header_params if param.alias == "x-priority"]
+        lane = _route_lanes[id(route)] = defaults[0] if defaults and defaults[0] in LANES else "interactive"
+    return lane
+
+def request_lane(scope) -> str:
+    for key, value in scope["headers"]:
+        if key == b"x-priority":
+            lane = value.decode("latin-1").strip().lower()
+            # An invalid lane is left for the route to reject
+            return lane if lane in LANES else "interactive"
+    for route in scope["app"].router.routes:
+        if isinstance(route, APIRoute) and route.matches(scope)[0] == Match.FULL:
+            return route_lane(route)
+    return "interactive"
+
+class LoadShedMiddleware():
+    """ASGI middleware that rejects requests of overloaded lanes with 503."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        monitor = _monitor
+        if monitor is None or scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+        shed_conf = monitor.conf
+        lane = request_lane(scope)
+        lag_ms = monitor.lag_ms()
+        reason = None
+        if lane in shed_conf.lag_ms and lag_ms > shed_conf.lag_ms[lane]:
+            reason = "lag"
+        elif lane in shed_conf.in_flight and monitor.in_flight >= shed_conf.in_flight[lane]:
+            reason = "in_flight"
+        if reason is not None:
+            metrics.inc("requests_shed_total", lane=lane, reason=reason)
+            logger.debug(f"Shed {scope['method']} {scope['path']} in lane {lane} ({reason}: {lag_ms:.0f}ms lag, {monitor.in_flight} in flight)")
+            # Ask clients to stay away at least as long as the loop is behind
+            retry_after = max(shed_conf.retry_after_seconds, math.ceil(lag_ms / 1000))
+            response = JSONResponse(
+                {"detail": "Server overloaded; retry later"}, status_code=503, headers={"Retry-After": str(retry_after)},
+            )
+            return await response(scope, receive, send)
+        monitor.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            monitor.in_flight -= 1
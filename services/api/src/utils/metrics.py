@@ -0,0 +1,31 @@
+import threading
+
+#### State ####
+
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_gauges: dict[str, float] = {}
+
+#### API ####
+
+def _name(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}"
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    """Increments a counter."""
+    key = _name(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def gauge(name: str, value: float, **labels) -> None:
+    """Sets a gauge to the given value."""
+    key = _name(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+def snapshot() -> dict:
+    """Returns a copy of all counters and gauges."""
+    with _lock:
+        return {"counters": dict(_counters), "gauges": dict(_gauges)}
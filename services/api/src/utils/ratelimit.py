@@ -0,0 +1,97 @@
+import sqlite3
+import threading
+import time
+
+from utils import log
+
+logger = log.get_logger(__name__)
+
+#### Rate Limiter ####
+
+class RateLimiter():
+    """
+    Token bucket rate limiter.
+
+    By default the bucket lives in memory and only limits the current process.
+    Given a SQLite path, the bucket is stored in that file and every process
+    using the same path and name draws from one shared budget.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, burst: float | None = None, path: str | None = None):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1.0, rate_per_minute / 60.0)
+        self.path = path or None
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated_at = time.time()
+        self._db: sqlite3.Connection | None = None
+        if self.path:
+            self._db = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None, timeout=30,
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                " name TEXT PRIMARY KEY,"
+                " tokens REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    def acquire(self, tokens: float = 1.0, timeout: float | None = None) -> bool:
+        """
+        Blocks until `tokens` are available and takes them.
+        Returns False if that would take longer than `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_take(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            logger.trace(f"Rate limit {self.name} exhausted; waiting {wait:.2f}s")
+            time.sleep(wait)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    #### Internals ####
+
+    def _refill(self, available: float, updated_at: float, now: float) -> float:
+        return min(self.capacity, available + (now - updated_at) * self.rate)
+
+    def _try_take(self, tokens: float) -> float:
+        """Takes tokens if available; otherwise returns the seconds to wait."""
+        with self._lock:
+            now = time.time()
+            if self._db is None:
+                available = self._refill(self._tokens, self._updated_at, now)
+                wait = self._take(available, tokens)
+                self._tokens = available - tokens if wait <= 0 else available
+                self._updated_at = now
+                return wait
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT tokens, updated_at FROM rate_limits WHERE name = ?", (self.name,)
+                ).fetchone()
+                available = self._refill(*row, now) if row else self.capacity
+                wait = self._take(available, tokens)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?)",
+                    (self.name, available - tokens if wait <= 0 else available, now),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            return wait
+
+    def _take(self, available: float, tokens: float) -> float:
+        if available >= tokens:
+            return 0.0
+        return (tokens - available) / self.rate
@@ -0,0 +1,22 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+#### Responses ####
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+
+    Returning one of these from a route bypasses FastAPI's `response_model`
+    handling, which would otherwise re-validate the returned model and run it
+    through `jsonable_encoder` before encoding. Only use it for models the
+    route built (and therefore validated) itself.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            content = content.model_dump(mode="json")
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from utils import log, metrics
+
+logger = log.get_logger(__name__)
+
+#### Fair Scheduler ####
+
+class FairScheduler():
+    """
+    Admits work to a fixed number of concurrent slots.
+
+    Waiting work is queued by lane and, within a lane, by principal. Free slots
+    go to the lanes by weighted fair queuing (start-time fair queuing over the
+    lanes' weights) and, within a lane, round-robin between its principals, so
+    that one principal's burst does not hold up the others. Lanes other than
+    the first only get slots while more than `reserved` are free; those are
+    kept for the first lane, so that it never waits behind bulk work.
+    """
+
+    def __init__(self, name: str, capacity: int, weights: dict[str, float], reserved: int = 0):
+        self.name = name
+        self.capacity = capacity
+        self.weights = weights
+        self.lanes = list(weights)
+        self.reserved = min(reserved, capacity - 1)
+        self._lock = threading.Lock()
+        self._queues: dict[str, OrderedDict[str, deque[tuple[Future, float]]]] = {
+            lane: OrderedDict() for lane in self.lanes
+        }
+        self._waiting = {lane: 0 for lane in self.lanes}
+        self._in_use = {lane: 0 for lane in self.lanes}
+        # Virtual time at which each lane's next slot starts
+        self._tags = {lane: 0.0 for lane in self.lanes}
+        self._vtime = 0.0
+
+    def submit(self, lane: str, principal: str) -> Future:
+        """
+        Queues a request for a slot; the returned future resolves once it is
+        granted. A cancelled future gives up its place in the queue. Granted
+        slots must be given back with release().
+        """
+        if lane not in self._queues:
+            raise ValueError(f"Unknown lane {lane!r}, expected one of {', '.join(self.lanes)}")
+        future: Future = Future()
+        with self._lock:
+            if not self._waiting[lane]:
+                # A lane that was idle does not get credit for the time it was
+                self._tags[lane] = max(self._tags[lane], self._vtime)
+            self._queues[lane].setdefault(principal, deque()).append((future, time.monotonic()))
+            self._waiting[lane] += 1
+            self._dispatch()
+            self._report(lane)
+        return future
+
+    def release(self, lane: str) -> None:
+        with self._lock:
+            self._in_use[lane] -= 1
+            self._dispatch()
+            self._report(lane)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            return {lane: {"waiting": self._waiting[lane], "in_use": self._in_use[lane]} for lane in self.lanes}
+
+    #### Internals ####
+
+    def _eligible(self, lane: str, free: int) -> bool:
+        return self._waiting[lane] > 0 and (lane == self.lanes[0] or free > self.reserved)
+
+    def _dispatch(self) -> None:
+        """Grants free slots to waiting work; called with the lock held."""
+        while True:
+            free = self.capacity - sum(self._in_use.values())
+            lanes = [lane for lane in self.lanes if self._eligible(lane, free)]
+            if free <= 0 or not lanes:
+                return
+            lane = min(lanes, key=lambda lane: self._tags[lane])
+            principal, queue = next(iter(self._queues[lane].items()))
+            future, queued_at = queue.popleft()
+            # Round-robin: the principal goes to the back of the lane
+            del self._queues[lane][principal]
+            if queue:
+                self._queues[lane][principal] = queue
+            self._waiting[lane] -= 1
+            if not future.set_running_or_notify_cancel():
+                metrics.inc("scheduler_cancelled_total", scheduler=self.name, lane=lane)
+                continue
+            self._vtime = self._tags[lane]
+            self._tags[lane] += 1 / self.weights[lane]
+            self._in_use[lane] += 1
+            wait_ms = (time.monotonic() - queued_at) * 1000
+            metrics.inc("scheduler_admitted_total", scheduler=self.name, lane=lane)
+            metrics.inc("scheduler_wait_ms_total", wait_ms, scheduler=self.name, lane=lane)
+            if wait_ms > 1000:
+                logger.debug(f"{lane} work of {principal} waited {wait_ms:.0f}ms for a {self.name} slot")
+            future.set_result(None)
+            self._report(lane)
+
+    def _report(self, lane: str) -> None:
+        metrics.gauge("scheduler_queue_depth", self._waiting[lane], scheduler=self.name, lane=lane)
+        metrics.gauge("scheduler_in_use", self._in_use[lane], scheduler=self.name, lane=lane)
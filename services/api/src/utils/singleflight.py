@@ -0,0 +1,69 @@
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+from utils import log, metrics
+
+logger = log.get_logger(__name__)
+
+T = TypeVar("T")
+
+#### Types ####
+
+class _Call():
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+#### Single Flight ####
+
+class SingleFlight():
+    """
+    Deduplicates concurrent calls by key: while a call for a key is in flight,
+    further callers with the same key wait for its result instead of starting
+    their own. All callers receive the same result or exception.
+
+    A caller being cancelled (e.g. a client disconnecting) does not affect the
+    others; the shared call's task is cancelled only once every caller is
+    gone. Cancelling a task does not stop work it handed to a thread, so `fn`
+    must stop that itself when cancelled (e.g. by cancelling its deadline
+    scope).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[str, _Call] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def pending(self, key: str) -> bool:
+        """Whether a call for `key` is in flight, i.e. do() would join it."""
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            metrics.inc("singleflight_calls_total", flight=self.name)
+        else:
+            metrics.inc("singleflight_coalesced_total", flight=self.name)
+        metrics.gauge("singleflight_in_flight", len(self._calls), flight=self.name)
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                logger.debug(f"Cancelling {self.name} call; no callers are left waiting")
+                call.task.cancel()
+                metrics.inc("singleflight_cancelled_total", flight=self.name)
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        metrics.gauge("singleflight_in_flight", len(self._calls), flight=self.name)
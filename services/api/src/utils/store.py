@@ -0,0 +1,142 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from utils import log
+
+logger = log.get_logger(__name__)
+
+#### Store ####
+
+class Store():
+    """
+    Minimal JSON document store on SQLite.
+
+    Documents are kept in a SQLite file when given a path (and are then shared
+    by every process using it), otherwise in an in-memory database. Only the
+    newest `max_documents` documents are retained. Documents may be put with
+    an owner, and reads given an owner only see that owner's documents.
+    """
+
+    def __init__(self, collection: str, path: str | None = None, max_documents: int = 10_000):
+        self.collection = collection
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=30)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " collection TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " body TEXT NOT NULL,"
+            " owner TEXT,"
+            " PRIMARY KEY (collection, id))"
+        )
+        # Databases created before documents had owners
+        if "owner" not in [row[1] for row in self._db.execute("PRAGMA table_info(documents)")]:
+            self._db.execute("ALTER TABLE documents ADD COLUMN owner TEXT")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS documents_created_at"
+            " ON documents (collection, created_at)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS documents_owner_created_at"
+            " ON documents (collection, owner, created_at)"
+        )
+        self._db.commit()
+
+    def get(self, id: str, owner: str | None = None) -> dict | None:
+        where, params = self._where(owner)
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT body FROM documents WHERE {where} AND id = ?", (*params, id),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, ids: list[str]) -> dict[str, dict]:
+        """The documents with the given ids that exist, by id."""
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, body FROM documents WHERE collection = ? AND id IN ({', '.join('?' * len(ids))})",
+                (self.collection, *ids),
+            ).fetchall()
+        return {id: json.loads(body) for id, body in rows}
+
+    def contains(self, id: str, owner: str | None = None) -> bool:
+        where, params = self._where(owner)
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT 1 FROM documents WHERE {where} AND id = ?", (*params, id),
+            ).fetchone()
+        return row is not None
+
+    def ids(self, offset: int = 0, limit: int = -1, owner: str | None = None) -> list[str]:
+        """Ids of the documents, newest first, without loading the documents."""
+        where, params = self._where(owner)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id FROM documents WHERE {where}"
+                " ORDER BY created_at DESC, id LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, owner: str | None = None) -> int:
+        where, params = self._where(owner)
+        with self._lock:
+            return self._db.execute(
+                f"SELECT COUNT(*) FROM documents WHERE {where}", params,
+            ).fetchone()[0]
+
+    def put(self, id: str, document: Any, owner: str | None = None) -> None:
+        body = json.dumps(document, ensure_ascii=False)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (collection, id, created_at, body, owner)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (self.collection, id, time.time(), body, owner),
+            )
+            self._db.commit()
+            self._puts_since_prune += 1
+            if self._puts_since_prune >= 100:
+                self._prune()
+
+    def delete(self, id: str) -> bool:
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM documents WHERE collection = ? AND id = ?",
+                (self.collection, id),
+            )
+            self._db.commit()
+        return cursor.rowcount > 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    #### Internals ####
+
+    def _where(self, owner: str | None) -> tuple[str, tuple]:
+        """Condition selecting the collection's documents, or only the owner's."""
+        if owner is None:
+            return "collection = ?", (self.collection,)
+        return "collection = ? AND owner = ?", (self.collection, owner)
+
+    def _prune(self) -> None:
+        self._puts_since_prune = 0
+        cursor = self._db.execute(
+            "DELETE FROM documents WHERE collection = ? AND id IN ("
+            " SELECT id FROM documents WHERE collection = ?"
+            " ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.collection, self.collection, self.max_documents),
+        )
+        self._db.commit()
+        if cursor.rowcount:
+            logger.debug(f"Pruned {cursor.rowcount} documents from {self.collection}")
@@ -0,0 +1,208 @@
+"""
+OpenTelemetry tracing of requests, workflow nodes, cache lookups and upstream
+calls.
+
+Off unless TRACING_EXPORTER is set, and then requires the optional `tracing`
+extra (opentelemetry-sdk and the OTLP exporter). Spans are sampled by trace
+once the request has finished: traces with a failed span or of requests
+slower than TRACING_SLOW_MS are always kept, the rest with probability
+TRACING_SAMPLE_RATIO. Kept spans are exported in batches in the background.
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Iterator
+
+from utils import log, metrics
+import conf
+
+if TYPE_CHECKING:
+    from opentelemetry.sdk.trace import ReadableSpan, Span, TracerProvider
+    from opentelemetry.trace import Tracer
+
+logger = log.get_logger(__name__)
+
+SERVICE_NAME = "api"
+
+#### Sampling ####
+
+class TailSampler():
+    """
+    Span processor that holds a trace's spans until its local root span ends,
+    then passes all of them on to `processor` or drops them. Spans ending
+    after their root follow the decision made for it.
+    """
+
+    def __init__(self, processor, slow_ms: float, sample_ratio: float, max_spans: int = 20_000):
+        self.processor = processor
+        self.slow_ms = slow_ms
+        self.sample_ratio = sample_ratio
+        self.max_spans = max_spans
+        self._lock = threading.Lock()
+        self._traces: OrderedDict[int, list["ReadableSpan"]] = OrderedDict()
+        self._spans = 0
+        # Recent decisions, for spans of background work ending late
+        self._decisions: OrderedDict[int, bool] = OrderedDict()
+
+    # The SDK calls these on every span processor
+    def on_start(self, span: "Span", parent_context=None) -> None:
+        pass
+
+    def _on_ending(self, span: "Span") -> None:
+        pass
+
+    def on_end(self, span: "ReadableSpan") -> None:
+        trace_id = span.context.trace_id
+        with self._lock:
+            if trace_id in self._decisions:
+                keep, spans = self._decisions[trace_id], [span]
+            else:
+                self._traces.setdefault(trace_id, []).append(span)
+                self._spans += 1
+                if span.parent is not None and not span.parent.is_remote:
+                    self._evict()
+                    return
+                spans = self._traces.pop(trace_id)
+                self._spans -= len(spans)
+                keep = self._decide(span, spans)
+                self._decisions[trace_id] = keep
+                if len(self._decisions) > 1000:
+                    self._decisions.popitem(last=False)
+        if keep:
+            for kept in spans:
+                self.processor.on_end(kept)
+
+    def _decide(self, root: "ReadableSpan", spans: list["ReadableSpan"]) -> bool:
+        from opentelemetry.trace import StatusCode
+
+        if any(s.status.status_code == StatusCode.ERROR for s in spans):
+            reason = "failed"
+        elif (root.end_time - root.start_time) / 1e6 >= self.slow_ms:
+            reason = "slow"
+        # The trace id is random, so its low bits make a deterministic coin
+        elif (root.context.trace_id & 0xFFFFFFFFFFFFFFFF) < self.sample_ratio * 2**64:
+            reason = "sampled"
+        else:
+            reason = "dropped"
+        metrics.inc("traces_total", decision=reason)
+        return reason != "dropped"
+
+    def _evict(self) -> None:
+        """Drops the oldest unfinished traces beyond max_spans; called with the lock held."""
+        while self._spans > self.max_spans and self._traces:
+            _, spans = self._traces.popitem(last=False)
+            self._spans -= len(spans)
+            metrics.inc("traces_total", decision="evicted")
+
+    def shutdown(self) -> None:
+        self.processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.processor.force_flush(timeout_millis)
+
+#### Setup ####
+
+_provider: "TracerProvider | None" = None
+_tracer: "Tracer | None" = None
+
+def init() -> None:
+    """Sets up the configured exporter; tracing stays off if there is none."""
+    global _provider, _tracer
+    tracing_conf = conf.get_tracing_conf()
+    if tracing_conf.exporter is None or _provider is not None:
+        return
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        logger.warning("opentelemetry-sdk is not installed (install the `tracing` extra); tracing disabled")
+        return
+
+    if tracing_conf.exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        exporter = OTLPSpanExporter(endpoint=tracing_conf.otlp_endpoint)
+        target = tracing_conf.otlp_endpoint
+    else:
+        out = open(tracing_conf.file_path, "a", encoding="utf-8")
+        exporter = ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+        target = tracing_conf.file_path
+
+    _provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    _provider.add_span_processor(TailSampler(
+        BatchSpanProcessor(exporter), tracing_conf.slow_ms, tracing_conf.sample_ratio,
+    ))
+    _tracer = _provider.get_tracer(__name__)
+    logger.info(f"Exporting traces to {target}")
+
+def close() -> None:
+    """Exports the spans still queued and stops tracing."""
+    global _provider, _tracer
+    if _provider is not None:
+        _provider.shutdown()
+    _provider = _tracer = None
+
+#### Spans ####
+
+class _NoopSpan():
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: dict[str, Any]) -> None:
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+@contextmanager
+def span(name: str, attributes: dict[str, Any] | None = None) -> Iterator["Span | _NoopSpan"]:
+    """
+    Runs the block in a child span of the current one; exceptions escaping
+    the block mark the span as failed. A no-op when tracing is off.
+    """
+    if _tracer is None:
+        yield NOOP_SPAN
+        return
+    attributes = {key: value for key, value in (attributes or {}).items() if value is not None}
+    with _tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+class TracingMiddleware():
+    """ASGI middleware that traces every HTTP request, continuing the caller's trace if it sent one."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _tracer is None or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        from opentelemetry import propagate
+        from opentelemetry.trace import SpanKind, Status, StatusCode
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        method = scope["method"]
+        status = None
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with _tracer.start_as_current_span(
+            f"{method} {scope['path']}",
+            context=propagate.extract(headers),
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": scope["path"]},
+        ) as current:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                if route := scope.get("route"):
+                    current.update_name(f"{method} {route.path}")
+                    current.set_attribute("http.route", route.path)
+                if status is not None:
+                    current.set_attribute("http.response.status_code", status)
+                    if status >= 500:
+                        current.set_status(Status(StatusCode.ERROR))
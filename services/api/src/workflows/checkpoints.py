@@ -0,0 +1,311 @@
+"""
+Durable checkpoints of workflow runs on SQLite.
+
+The graph saves its state after every completed node under the run's id
+(the LangGraph thread id). A run that fails or is interrupted is resumed
+from the last completed node by the next run with the same id, instead of
+paying for the earlier LLM calls again. Only the latest checkpoint of a run
+is kept, states are stored as compressed msgpack, and a run's checkpoints
+are deleted once it finishes; runs that are never resumed expire.
+
+Workers sharing the file coordinate through leases: a run only reads or
+writes the checkpoints of its id while holding the id's lease, so that two
+workers given the same id never resume, overwrite or delete each other's
+checkpoints.
+
+Imported on first use only, as it depends on langgraph.
+"""
+
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Iterator, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from utils import log
+
+logger = log.get_logger(__name__)
+
+# Serialized values at least this large are stored compressed
+COMPRESS_MIN_BYTES = 512
+
+# Lease duration for runs without a deadline
+LEASE_SECONDS = 900
+
+#### Checkpointer ####
+
+class SQLiteCheckpointer(BaseCheckpointSaver[str]):
+    """
+    Checkpoint saver keeping the latest checkpoint and its pending writes per
+    run. In-memory by default; given a path, checkpoints are stored in that
+    file and survive restarts.
+    """
+
+    def __init__(self, path: str | None = None, ttl_seconds: float = 86400):
+        super().__init__()
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=30)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " thread_id TEXT NOT NULL,"
+            " checkpoint_ns TEXT NOT NULL,"
+            " checkpoint_id TEXT NOT NULL,"
+            " parent_id TEXT,"
+            " checkpoint BLOB NOT NULL,"
+            " metadata BLOB NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (thread_id, checkpoint_ns))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoint_writes ("
+            " thread_id TEXT NOT NULL,"
+            " checkpoint_ns TEXT NOT NULL,"
+            " checkpoint_id TEXT NOT NULL,"
+            " task_id TEXT NOT NULL,"
+            " idx INTEGER NOT NULL,"
+            " channel TEXT NOT NULL,"
+            " value BLOB NOT NULL,"
+            " task_path TEXT NOT NULL,"
+            " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoint_leases ("
+            " thread_id TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self.expire()
+
+    #### Serialization ####
+
+    def _dumps(self, value: Any) -> bytes:
+        kind, data = self.serde.dumps_typed(value)
+        if len(data) >= COMPRESS_MIN_BYTES:
+            return b"z" + kind.encode() + b"\x00" + zlib.compress(data, 1)
+        return b"r" + kind.encode() + b"\x00" + data
+
+    def _loads(self, blob: bytes) -> Any:
+        kind, _, data = blob[1:].partition(b"\x00")
+        if blob[:1] == b"z":
+            data = zlib.decompress(data)
+        return self.serde.loads_typed((kind.decode(), data))
+
+    #### Saver ####
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            row = self._db.execute(
+                "SELECT checkpoint_id, parent_id, checkpoint, metadata FROM checkpoints"
+                " WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns),
+            ).fetchone()
+            if row is None or (get_checkpoint_id(config) not in (None, row[0])):
+                return None
+            writes = self._db.execute(
+                "SELECT task_id, channel, value FROM checkpoint_writes"
+                " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+                " ORDER BY task_path, task_id, idx",
+                (thread_id, checkpoint_ns, row[0]),
+            ).fetchall()
+        checkpoint_id, parent_id, checkpoint, metadata = row
+        return CheckpointTuple(
+            config=self._config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint=self._loads(checkpoint),
+            metadata=self._loads(metadata),
+            parent_config=self._config(thread_id, checkpoint_ns, parent_id) if parent_id else None,
+            pending_writes=[(task_id, channel, self._loads(value)) for task_id, channel, value in writes],
+        )
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config is None:
+            with self._lock:
+                threads = self._db.execute(
+                    "SELECT thread_id, checkpoint_ns FROM checkpoints ORDER BY updated_at DESC"
+                ).fetchall()
+        else:
+            threads = [(config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))]
+        for thread_id, checkpoint_ns in threads:
+            if limit is not None and limit <= 0:
+                return
+            found = self.get_tuple(self._config(thread_id, checkpoint_ns, get_checkpoint_id(config or {})))
+            if found is None:
+                continue
+            if before is not None and found.config["configurable"]["checkpoint_id"] >= get_checkpoint_id(before):
+                continue
+            if filter and any(found.metadata.get(k) != v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield found
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_blob = self._dumps(checkpoint)
+        metadata_blob = self._dumps(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            # The new checkpoint replaces the previous one, and with it the
+            # writes pending on that
+            self._db.execute(
+                "DELETE FROM checkpoint_writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id != ?",
+                (thread_id, checkpoint_ns, checkpoint["id"]),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                    checkpoint_blob, metadata_blob, time.time(),
+                ),
+            )
+            self._db.commit()
+        return self._config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = [
+            (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, self._dumps(value), task_path)
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        # Special writes (errors, interrupts) replace earlier ones of the
+        # task; regular writes are only stored once
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO checkpoint_writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for row in rows if row[4] < 0],
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO checkpoint_writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for row in rows if row[4] >= 0],
+            )
+            self._db.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self._db.execute("DELETE FROM checkpoint_writes WHERE thread_id = ?", (thread_id,))
+            self._db.commit()
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return self.get_tuple(config)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    #### Leases ####
+
+    def acquire(self, thread_id: str, seconds: float | None = None) -> str | None:
+        """
+        Takes the lease on a run's id for `seconds` (the run's deadline), or
+        LEASE_SECONDS without; returns the lease's token, or None if another
+        run holds it. Expired leases are taken over.
+        """
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM checkpoint_leases WHERE thread_id = ? AND expires_at < ?", (thread_id, now),
+            )
+            taken = self._db.execute(
+                "INSERT OR IGNORE INTO checkpoint_leases VALUES (?, ?, ?)", (thread_id, token, now + (seconds or LEASE_SECONDS)),
+            ).rowcount
+            self._db.commit()
+        return token if taken else None
+
+    def release(self, thread_id: str, token: str) -> None:
+        """Gives up a lease taken by `acquire`, unless it was taken over since."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM checkpoint_leases WHERE thread_id = ? AND owner = ?", (thread_id, token),
+            )
+            self._db.commit()
+
+    #### Maintenance ####
+
+    def expire(self) -> int:
+        """Deletes the checkpoints of runs not updated within the TTL; returns how many."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            threads = [row[0] for row in self._db.execute(
+                "SELECT DISTINCT thread_id FROM checkpoints WHERE updated_at < ?", (cutoff,),
+            )]
+            self._db.executemany("DELETE FROM checkpoints WHERE thread_id = ?", [(t,) for t in threads])
+            self._db.executemany("DELETE FROM checkpoint_writes WHERE thread_id = ?", [(t,) for t in threads])
+            self._db.execute("DELETE FROM checkpoint_leases WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+        if threads:
+            logger.info(f"Expired the checkpoints of {len(threads)} abandoned run(s)")
+        return len(threads)
+
+    def runs(self) -> int:
+        """Number of runs with a checkpoint, i.e. unfinished runs."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(DISTINCT thread_id) FROM checkpoints").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def _config(thread_id: str, checkpoint_ns: str, checkpoint_id: str | None) -> RunnableConfig:
+        configurable = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}
+        if checkpoint_id:
+            configurable["checkpoint_id"] = checkpoint_id
+        return {"configurable": configurable}
@@ -0,0 +1,139 @@
+"""
+Request deadlines and cancellation for workflow runs.
+
+A request sets its deadline with within(); like the usage context, it follows
+the run into worker threads. The Scope it yields can also be cancelled early,
+e.g. when a newer revision of the text supersedes the run. LLM calls are not
+started once the deadline has passed or the scope is cancelled, and calls in
+flight are aborted, which closes the upstream request. Workflow nodes check
+the deadline between steps and return what they have so far, marking the
+state as partial, instead of failing the whole request.
+"""
+
+import concurrent.futures
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Callable, Iterator
+
+#### Types ####
+
+class DeadlineExceeded(Exception):
+    def __init__(self, message: str = "Request deadline exceeded"):
+        super().__init__(message)
+
+class Scope():
+    """A deadline that can be cancelled before it is reached."""
+
+    def __init__(self, at: float | None, parent: "Scope | None" = None):
+        # time.monotonic() value by which the run must finish
+        bounds = [t for t in (at, parent.at if parent is not None else None) if t is not None]
+        self.at = min(bounds) if bounds else None
+        self.parent = parent
+        self._cancelled = threading.Event()
+        self._callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Calls `callback` once the scope or an outer one is cancelled (right
+        away if it already is); returns a function that unregisters it.
+        """
+        chain = []
+        scope = self
+        while scope is not None:
+            with scope._lock:
+                scope._callbacks.append(callback)
+            chain.append(scope)
+            scope = scope.parent
+        if self.cancelled:
+            callback()
+
+        def unregister() -> None:
+            for scope in chain:
+                scope._remove(callback)
+        return unregister
+
+    def _remove(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+#### State ####
+
+_scope: contextvars.ContextVar[Scope | None] = contextvars.ContextVar("deadline", default=None)
+
+#### API ####
+
+@contextlib.contextmanager
+def within(seconds: float | None = None) -> Iterator[Scope]:
+    """
+    Runs the block in a new scope with a deadline `seconds` from now (None
+    for no deadline of its own). Nested scopes never extend an outer deadline
+    and are cancelled along with the outer scope.
+    """
+    at = None if seconds is None else time.monotonic() + max(seconds, 0.0)
+    scope = Scope(at, parent=_scope.get())
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+def current() -> Scope | None:
+    return _scope.get()
+
+def remaining() -> float | None:
+    """Seconds left until the deadline (0 once cancelled), or None without one."""
+    scope = _scope.get()
+    if scope is None:
+        return None
+    if scope.cancelled:
+        return 0.0
+    if scope.at is None:
+        return None
+    return max(scope.at - time.monotonic(), 0.0)
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+def check() -> None:
+    """Raises DeadlineExceeded if the deadline has passed or the run was cancelled."""
+    scope = _scope.get()
+    if scope is not None and scope.cancelled:
+        raise DeadlineExceeded("Run cancelled")
+    if expired():
+        raise DeadlineExceeded()
+
+def wait(future: concurrent.futures.Future, what: str):
+    """
+    Returns the future's result. If the deadline passes or the run is
+    cancelled first, cancels the future and raises DeadlineExceeded.
+    """
+    scope = _scope.get()
+    if scope is None:
+        return future.result()
+    check()
+    unregister = scope.on_cancel(future.cancel)
+    try:
+        return future.result(timeout=remaining())
+    except TimeoutError as e:
+        future.cancel()
+        raise DeadlineExceeded(f"Request deadline exceeded waiting for {what}") from e
+    except concurrent.futures.CancelledError as e:
+        raise DeadlineExceeded("Run cancelled") from e
+    finally:
+        unregister()
@@ -0,0 +1,213 @@
+"""
+Incremental text extraction and chunking of uploaded documents.
+
+A reader takes the bytes of a document as they arrive and returns its text,
+and a Chunker cuts that text at sentence boundaries into chunks of about
+DOCUMENT_CHUNK_CHARS characters, which are adapted independently. Plain text
+and Markdown are decoded as they arrive, so the first chunks are ready long
+before the upload ends. DOCX and PDF files keep their index at the end, so
+they are spooled (to disk once large) and read paragraph by paragraph or page
+by page once complete. Either way, only a bounded part of the document is in
+memory at a time.
+"""
+
+import codecs
+import importlib.util
+import os
+import tempfile
+import zipfile
+from typing import IO, Iterator, NamedTuple
+from xml.etree import ElementTree
+
+from workflows.spans import split_sentences
+
+# Spooled documents move from memory to a temporary file beyond this size
+SPOOL_MEMORY_BYTES = 1024 * 1024
+
+FORMATS = {
+    ".txt": "text",
+    ".text": "text",
+    ".md": "text",
+    ".markdown": "text",
+    ".docx": "docx",
+    ".pdf": "pdf",
+}
+
+MEDIA_TYPES = {
+    "text/plain": "text",
+    "text/markdown": "text",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/pdf": "pdf",
+}
+
+# WordprocessingML namespace of document.xml
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+class UnsupportedDocument(ValueError):
+    pass
+
+#### Chunks ####
+
+class Chunk(NamedTuple):
+    index: int
+    # Offset of the chunk in the document's extracted text
+    offset: int
+    text: str
+
+class Chunker():
+    """
+    Cuts a stream of text into chunks of whole sentences. A chunk ends at the
+    last sentence boundary within `chunk_chars`, or after its first sentence
+    if that is longer. Text without a sentence boundary in twice that many
+    characters is cut at whitespace, so the buffer never grows beyond it.
+    """
+
+    def __init__(self, chunk_chars: int):
+        self.chunk_chars = max(1, chunk_chars)
+        self.characters = 0
+        self._buffer = ""
+        self._index = 0
+
+    def feed(self, text: str) -> Iterator[Chunk]:
+        self._buffer += text
+        while len(self._buffer) > self.chunk_chars:
+            cut = self._cut()
+            if cut is None:
+                return
+            yield from self._emit(cut)
+
+    def finish(self) -> Iterator[Chunk]:
+        yield from self._emit(len(self._buffer))
+
+    def _cut(self) -> int | None:
+        """Where the next chunk ends, or None to wait for more text."""
+        window = self._buffer[:2 * self.chunk_chars]
+        # The last sentence may go on in text not received yet
+        ends = [end for _, end in split_sentences(window)[:-1]]
+        if ends:
+            within = [end for end in ends if end <= self.chunk_chars]
+            return within[-1] if within else ends[0]
+        if len(window) < 2 * self.chunk_chars:
+            return None
+        space = max(window.rfind(" ", 0, self.chunk_chars), window.rfind("\n", 0, self.chunk_chars))
+        return space + 1 if space > 0 else self.chunk_chars
+
+    def _emit(self, cut: int) -> Iterator[Chunk]:
+        text = self._buffer[:cut]
+        stripped = text.strip()
+        if stripped:
+            offset = self.characters + len(text) - len(text.lstrip())
+            yield Chunk(self._index, offset, stripped)
+            self._index += 1
+        self.characters += cut
+        self._buffer = self._buffer[cut:]
+
+#### Readers ####
+
+class TextReader():
+    """UTF-8 text or Markdown, decoded as it arrives."""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+
+    def feed(self, data: bytes) -> str:
+        return self._decoder.decode(data)
+
+    def finish(self) -> Iterator[str]:
+        yield self._decoder.decode(b"", final=True)
+
+    def close(self) -> None:
+        pass
+
+class SpooledReader():
+    """A format that can only be read once the whole document has arrived."""
+
+    def __init__(self):
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+
+    def feed(self, data: bytes) -> str:
+        self._file.write(data)
+        return ""
+
+    def finish(self) -> Iterator[str]:
+        self._file.seek(0)
+        yield from self.read(self._file)
+
+    def read(self, f: IO[bytes]) -> Iterator[str]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self._file.close()
+
+class DocxReader(SpooledReader):
+    """Word documents, parsed paragraph by paragraph."""
+
+    def read(self, f: IO[bytes]) -> Iterator[str]:
+        try:
+            archive = zipfile.ZipFile(f)
+            xml = archive.open("word/document.xml")
+        except (zipfile.BadZipFile, KeyError):
+            raise UnsupportedDocument("Not a valid DOCX document")
+        body = None
+        with archive, xml:
+            try:
+                for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+                    if event == "start":
+                        if element.tag == W + "body":
+                            body = element
+                        continue
+                    if element.tag != W + "p":
+                        continue
+                    yield "".join(paragraph_text(element)) + "\n\n"
+                    # Parsed paragraphs are dropped so the tree stays small
+                    element.clear()
+                    if body is not None:
+                        body.clear()
+            except ElementTree.ParseError as e:
+                raise UnsupportedDocument(f"Not a valid DOCX document: {e}")
+
+def paragraph_text(paragraph: ElementTree.Element) -> Iterator[str]:
+    for element in paragraph.iter():
+        if element.tag == W + "t" and element.text:
+            yield element.text
+        elif element.tag == W + "tab":
+            yield "\t"
+        elif element.tag in (W + "br", W + "cr"):
+            yield "\n"
+
+class PdfReader(SpooledReader):
+    """PDF documents, extracted page by page with pypdf."""
+
+    def read(self, f: IO[bytes]) -> Iterator[str]:
+        import pypdf
+
+        try:
+            pdf = pypdf.PdfReader(f)
+            for page in pdf.pages:
+                yield (page.extract_text() or "") + "\n\n"
+        except pypdf.errors.PdfReadError as e:
+            raise UnsupportedDocument(f"Not a valid PDF document: {e}")
+
+Reader = TextReader | DocxReader | PdfReader
+
+def detect_format(filename: str | None, media_type: str | None) -> str:
+    """Finds the format of a document by its file extension or else its media type."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in FORMATS:
+        return FORMATS[ext]
+    media_type = (media_type or "").split(";")[0].strip().lower()
+    if media_type in MEDIA_TYPES:
+        return MEDIA_TYPES[media_type]
+    raise UnsupportedDocument(
+        f"Unsupported document {filename or media_type or 'without a name or type'};"
+        f" expected one of {', '.join(FORMATS)}"
+    )
+
+def get_reader(fmt: str) -> Reader:
+    if fmt == "text":
+        return TextReader()
+    if fmt == "docx":
+        return DocxReader()
+    if importlib.util.find_spec("pypdf") is None:
+        raise UnsupportedDocument("PDF support is not installed (install the `documents` extra)")
+    return PdfReader()
@@ -0,0 +1,128 @@
+"""
+Local CPU sentence embeddings.
+
+Uses a fastembed (ONNX) model, or with EMBEDDING_MODEL=hashing a hashing
+encoder over word and character n-grams. The latter captures lexical rather
+than semantic similarity ("break the ice" is close to "break the bank", "ill"
+far from "under the weather"), so its scores are not used to decide anything
+on their own. All encoders return L2-normalized float32 rows, so cosine
+similarity is a plain dot product.
+"""
+
+import re
+import zlib
+from typing import TYPE_CHECKING, Protocol
+
+from utils import log
+import conf
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = log.get_logger(__name__)
+
+#### Types ####
+
+class Encoder(Protocol):
+    name: str
+    # Whether similar scores mean similar meaning
+    semantic: bool
+
+    def encode(self, texts: list[str]) -> "np.ndarray": ...
+
+#### Encoders ####
+
+class HashingEncoder():
+    """Signed feature hashing of words and character trigrams."""
+
+    name = "hashing"
+    semantic = False
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def features(self, text: str) -> list[str]:
+        words = re.findall(r"\w+", text.lower())
+        grams = [w[i:i + 3] for w in (f"<{w}>" for w in words) for i in range(len(w) - 2)]
+        return words + grams
+
+    def encode(self, texts: list[str]) -> "np.ndarray":
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter(
+                (zlib.crc32(f.encode()) for f in self.features(text)), dtype=np.uint32,
+            )
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], hashes % self.dim, signs)
+        return normalize_rows(vectors)
+
+class FastEmbedEncoder():
+    """Wraps a fastembed ONNX sentence embedding model."""
+
+    semantic = True
+
+    def __init__(self, model: str):
+        from fastembed import TextEmbedding
+
+        self.name = model
+        self._model = TextEmbedding(model_name=model)
+
+    def encode(self, texts: list[str]) -> "np.ndarray":
+        import numpy as np
+
+        return normalize_rows(np.asarray(list(self._model.embed(texts)), dtype=np.float32))
+
+#### API ####
+
+def normalize_rows(vectors: "np.ndarray") -> "np.ndarray":
+    import numpy as np
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def similarities(encoder: Encoder, a: list[str], b: list[str]) -> "np.ndarray":
+    """Cosine similarity of each a[i] with b[i], encoded in a single batch."""
+    import numpy as np
+
+    if not a:
+        return np.zeros(0, dtype=np.float32)
+    vectors = encoder.encode(a + b)
+    return np.einsum("ij,ij->i", vectors[:len(a)], vectors[len(a):])
+
+_encoder: Encoder | None = None
+_load_error: Exception | None = None
+
+def get_encoder() -> Encoder:
+    """
+    Returns the configured encoder, loading it on first use. A model that
+    cannot be loaded raises rather than silently degrading to the hashing
+    encoder; the failure is kept, so the load is not retried on every call.
+    """
+    global _encoder, _load_error
+    if _encoder is None:
+        if _load_error is not None:
+            raise _load_error
+        model = conf.get_embedding_model()
+        if model == HashingEncoder.name:
+            logger.warning("Using the lexical hashing encoder; every guardrail pair will go to the LLM judge")
+            _encoder = HashingEncoder()
+        else:
+            try:
+                _encoder = FastEmbedEncoder(model)
+            except Exception as e:
+                _load_error = e
+                logger.warning(
+                    f"Could not load embedding model {model} ({e}); the guardrail and few-shot"
+                    " retrieval are skipped until it is provisioned and the service restarted"
+                )
+                raise
+    return _encoder
+
+def get_encoder_or_none() -> Encoder | None:
+    """Returns the configured encoder, or None if it cannot be loaded."""
+    try:
+        return get_encoder()
+    except Exception:
+        return None
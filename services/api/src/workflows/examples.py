@@ -0,0 +1,261 @@
+"""
+Retrieval of few-shot examples for detection.
+
+An index of annotated figurative sentences is built offline from the
+ingested corpora (see models.operations.corpora) with:
+    python -m workflows.examples build data/corpora data/examples [--corpora id10 magpie]
+
+The index directory holds the L2-normalized sentence embeddings
+(vectors.npy), grouped by k-means cluster (offsets.npy, centroids.npy), and
+the examples themselves (examples.arrow). Both are memory-mapped at startup.
+A lookup scores the centroids and then only the rows of the nearest
+clusters, which keeps it around a millisecond for indexes of the size of
+the idiom corpora.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import TYPE_CHECKING
+
+from utils import log, metrics
+from workflows.embeddings import get_encoder, get_encoder_or_none
+import conf
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = log.get_logger(__name__)
+
+# Upper bound that keeps the few-shot block of the prompt small
+MAX_EXAMPLE_CHARS = 300
+
+EXAMPLE_COLUMNS = ("text", "expression", "type", "lemma", "explanation")
+
+#### Index ####
+
+class ExampleIndex():
+    def __init__(self, directory: str):
+        # numpy and pyarrow are imported on first use, to keep them out of
+        # the import of the API when few-shot retrieval is off
+        import numpy as np
+        import pyarrow as pa
+
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        self.centroids = np.load(os.path.join(directory, "centroids.npy"))
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"))
+        self._source = pa.memory_map(os.path.join(directory, "examples.arrow"))
+        self.examples = pa.ipc.open_file(self._source).read_all()
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def search(self, queries: "np.ndarray", k: int, probes: int | None = None) -> list[int]:
+        """
+        Rows of the k examples most similar to any of the query vectors, best
+        first, with at most one example per lemma. Probes default to a fixed
+        share of the clusters, which keeps recall steady as the index grows.
+        """
+        if probes is None:
+            probes = max(8, len(self.centroids) // 16)
+        best: dict[int, float] = {}
+        centroid_scores = queries @ self.centroids.T
+        probes = min(probes, len(self.centroids))
+        for query, scores in zip(queries, centroid_scores):
+            # Clusters are contiguous row ranges, so they are scored as slices
+            for c in (-scores).argpartition(probes - 1)[:probes]:
+                start, end = int(self.offsets[c]), int(self.offsets[c + 1])
+                if start == end:
+                    continue
+                row_scores = self.vectors[start:end] @ query
+                # Over-fetch, as several rows may share a lemma
+                top = (-row_scores).argpartition(min(k * 4, end - start) - 1)[:k * 4]
+                for i in top:
+                    row = start + int(i)
+                    best[row] = max(best.get(row, -1.0), float(row_scores[i]))
+
+        lemmas = self.examples.column("lemma")
+        selected, seen = [], set()
+        for row in sorted(best, key=best.get, reverse=True):
+            lemma = lemmas[row].as_py()
+            if lemma not in seen:
+                seen.add(lemma)
+                selected.append(row)
+                if len(selected) == k:
+                    break
+        return selected
+
+    def get(self, rows: list[int]) -> list[dict]:
+        return self.examples.take(rows).to_pylist() if rows else []
+
+    def close(self) -> None:
+        self.examples = None
+        self._source.close()
+
+_index: ExampleIndex | None = None
+_index_loaded = False
+
+def get_index() -> ExampleIndex | None:
+    """Returns the configured example index, or None if few-shot retrieval is off."""
+    global _index, _index_loaded
+    if not _index_loaded:
+        _index_loaded = True
+        few_shot = conf.get_few_shot_conf()
+        if few_shot.index_path and few_shot.examples > 0:
+            index = ExampleIndex(few_shot.index_path)
+            encoder = get_encoder_or_none()
+            if encoder is None:
+                index.close()
+            elif index.meta["encoder"] != encoder.name:
+                logger.warning(
+                    f"Few-shot index was built with encoder {index.meta['encoder']}"
+                    f" but {encoder.name} is configured; few-shot retrieval disabled"
+                )
+                index.close()
+            else:
+                logger.info(f"Loaded few-shot index with {len(index)} examples")
+                _index = index
+    return _index
+
+def close() -> None:
+    global _index, _index_loaded
+    if _index is not None:
+        _index.close()
+    _index, _index_loaded = None, False
+
+#### Retrieval ####
+
+def retrieve(text: str) -> list[dict]:
+    """
+    Returns the configured number of annotated examples most similar to text.
+    The text is encoded as a single query: encoding costs far more than the
+    lookup, and would grow with the number of sentences if each were a query.
+    """
+    index = get_index()
+    if index is None:
+        return []
+    rows = index.search(get_encoder().encode([text]), conf.get_few_shot_conf().examples)
+    metrics.inc("few_shot_examples_total", len(rows))
+    return index.get(rows)
+
+def format_examples(examples: list[dict]) -> str:
+    """Renders examples as a prompt block; empty when there are none."""
+    if not examples:
+        return ""
+    lines = ["\n\nAnnotated examples:"]
+    for example in examples:
+        line = f'- "{example["text"][:MAX_EXAMPLE_CHARS]}" contains the {example["type"].replace("_", " ")} "{example["expression"]}"'
+        if example["explanation"]:
+            line += f' ({example["explanation"][:MAX_EXAMPLE_CHARS]})'
+        lines.append(line)
+    return "\n".join(lines)
+
+#### Building ####
+
+def kmeans(
+    vectors: "np.ndarray", clusters: int, iterations: int = 10, seed: int = 0,
+) -> tuple["np.ndarray", "np.ndarray"]:
+    """Spherical k-means; returns the cluster of each row and the centroids."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(clusters):
+            members = vectors[assignment == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return np.argmax(vectors @ centroids.T, axis=1), centroids
+
+def build(
+    corpora_root: str, directory: str, corpora: list[str], max_per_lemma: int, batch_size: int = 256,
+) -> int:
+    """Indexes up to max_per_lemma figurative training examples per lemma of each corpus."""
+    import numpy as np
+    from models.operations.corpora import open_corpus
+
+    examples: dict[str, list] = {name: [] for name in EXAMPLE_COLUMNS}
+    for corpus in corpora:
+        per_lemma: dict[str, int] = {}
+        with open_corpus(corpora_root, corpus) as reader:
+            for record in reader.iter_records(split="train"):
+                if not record.figurative or not record.text or per_lemma.get(record.lemma, 0) >= max_per_lemma:
+                    continue
+                per_lemma[record.lemma] = per_lemma.get(record.lemma, 0) + 1
+                examples["text"].append(record.text)
+                examples["expression"].append(record.expression)
+                examples["type"].append(record.type)
+                examples["lemma"].append(record.lemma)
+                examples["explanation"].append(record.explanation)
+    if not examples["text"]:
+        raise ValueError("No figurative training examples with text found")
+
+    encoder = get_encoder()
+    vectors = np.concatenate([
+        encoder.encode(examples["text"][i:i + batch_size])
+        for i in range(0, len(examples["text"]), batch_size)
+    ])
+    write_index(directory, examples, vectors, {"encoder": encoder.name, "corpora": corpora})
+    return len(vectors)
+
+def write_index(directory: str, examples: dict[str, list], vectors: "np.ndarray", meta: dict) -> None:
+    """Writes examples (EXAMPLE_COLUMNS, all strings) and their normalized vectors."""
+    import numpy as np
+    import pyarrow as pa
+
+    vectors = vectors.astype(np.float32)
+
+    # Store rows grouped by cluster so each cluster is a contiguous range
+    clusters = max(1, int(np.sqrt(len(vectors))))
+    assignment, centroids = kmeans(vectors, clusters)
+    order = np.argsort(assignment, kind="stable")
+    offsets = np.searchsorted(assignment[order], np.arange(clusters + 1))
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "vectors.npy"), vectors[order])
+    np.save(os.path.join(directory, "centroids.npy"), centroids)
+    np.save(os.path.join(directory, "offsets.npy"), offsets)
+    schema = pa.schema([(name, pa.string()) for name in EXAMPLE_COLUMNS])
+    table = pa.table(examples, schema=schema).take(order)
+    with pa.OSFile(os.path.join(directory, "examples.arrow"), "wb") as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            writer.write_table(table)
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({**meta, "dim": vectors.shape[1], "examples": len(vectors)}, f)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Few-shot example index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build an index from ingested corpora")
+    build_parser.add_argument("corpora_root", help="Root directory of the ingested corpora")
+    build_parser.add_argument("out", help="Index directory")
+    build_parser.add_argument("--corpora", nargs="+", default=["id10", "magpie"])
+    build_parser.add_argument("--max-per-lemma", type=int, default=3)
+    query_parser = subparsers.add_parser("query", help="Show the examples retrieved for a text")
+    query_parser.add_argument("index", help="Index directory")
+    query_parser.add_argument("text")
+    query_parser.add_argument("-k", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build(args.corpora_root, args.out, args.corpora, args.max_per_lemma)
+        print(f"Indexed {count} examples with encoder {get_encoder().name}")
+        return
+
+    index = ExampleIndex(args.index)
+    queries = get_encoder().encode([args.text])
+    start = time.perf_counter()
+    rows = index.search(queries, args.k)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(format_examples(index.get(rows)).strip())
+    print(f"Lookup over {len(index)} examples took {elapsed:.3f} ms")
+
+if __name__ == "__main__":
+    log.init(conf.get_log_level())
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Dictionary of known idioms with human-written explanations.
+
+Built offline from the ingested corpora (see models.operations.corpora) with:
+    python -m workflows.idioms build data/corpora data/idioms [--corpora id10 magpie]
+
+Every idiom with an explanation becomes an entry (entries.arrow). It is found
+under its canonical form, the surface forms it was annotated with in the
+corpora, and both folded to their base forms (keys.npy, rows.npy, kinds.npy:
+64-bit key hashes sorted for binary search, with the entry and kind of
+each). All files are memory-mapped at startup, so a lookup is a few
+microseconds and no LLM call.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from typing import Literal, NamedTuple
+
+from utils import log, metrics, tracing
+import conf
+
+logger = log.get_logger(__name__)
+
+# Model reported for simplifications taken from the dictionary as they are
+MODEL = "dictionary"
+
+# Longest explanation that is used as a replacement in the text as it is
+MAX_REPLACEMENT_WORDS = 6
+
+ENTRY_COLUMNS = ("lemma", "type", "explanation", "replacement")
+
+# Kinds of keys; lower is preferred when keys collide
+CANONICAL, VARIANT = 0, 1
+
+Match = Literal["exact", "variant"]
+
+class Entry(NamedTuple):
+    lemma: str
+    type: str
+    explanation: str
+    # Literal paraphrase that fits wherever the canonical form does; None when
+    # the explanation is too long to stand in for the expression
+    replacement: str | None
+    match: Match
+
+#### Keys ####
+
+# Pronouns in idioms vary with the context ("pull someone's leg", "pulling
+# her leg"); all of them are folded into one placeholder
+PRONOUNS = {
+    "my", "your", "his", "her", "its", "our", "their", "one's", "someone's", "somebody's",
+    "me", "you", "him", "us", "them", "someone", "somebody", "one",
+}
+REFLEXIVES = {
+    "myself", "yourself", "himself", "herself", "itself", "ourselves", "yourselves", "themselves", "oneself",
+}
+IRREGULAR = {
+    "was": "be", "were": "be", "is": "be", "are": "be", "am": "be", "been": "be",
+    "has": "have", "had": "have", "does": "do", "did": "do", "done": "do",
+    "went": "go", "gone": "go", "goes": "go", "broke": "break", "broken": "break",
+    "bit": "bite", "bitten": "bite", "took": "take", "taken": "take", "gave": "give", "given": "give",
+    "got": "get", "gotten": "get", "made": "make", "kept": "keep", "ran": "run", "came": "come",
+    "threw": "throw", "thrown": "throw", "caught": "catch", "held": "hold", "lost": "lose",
+    "left": "leave", "brought": "bring", "fell": "fall", "fallen": "fall", "spilt": "spill",
+    "saw": "see", "seen": "see", "said": "say", "told": "tell", "stole": "steal", "stolen": "steal",
+    "drew": "draw", "drawn": "draw", "blew": "blow", "blown": "blow", "burnt": "burn", "bent": "bend",
+    "found": "find", "sat": "sit", "stood": "stand", "struck": "strike", "swept": "sweep",
+    "spun": "spin", "wore": "wear", "worn": "wear", "shot": "shoot", "paid": "pay", "laid": "lay",
+    "rang": "ring", "rung": "ring", "sold": "sell", "felt": "feel", "met": "meet", "led": "lead",
+    "bore": "bear", "borne": "bear", "tore": "tear", "torn": "tear", "shook": "shake", "shaken": "shake",
+}
+
+def canonical_key(expression: str) -> str:
+    """Lowercases and strips punctuation, like the corpora's lemmas."""
+    return " ".join(re.findall(r"[\w'-]+", expression.lower()))
+
+def stem(word: str) -> str:
+    """
+    Crude base form of a word. Dictionary keys and lookups are folded the
+    same way, so it only needs to map the inflections of a word together.
+    """
+    if word in IRREGULAR:
+        word = IRREGULAR[word]
+    elif len(word) > 4:
+        if word.endswith(("ies", "ied")):
+            word = word[:-3] + "y"
+        elif word.endswith("ing"):
+            word = word[:-3]
+        elif word.endswith("ed"):
+            word = word[:-2]
+        elif word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        # hitting -> hit, but not spilling -> spil
+        if len(word) > 2 and word[-1] == word[-2] and word[-1] in "bdgmnprt":
+            word = word[:-1]
+    if word.endswith("e") and len(word) > 3:
+        word = word[:-1]
+    return word
+
+def folded_key(expression: str) -> str:
+    """Canonical key with pronouns replaced by placeholders and words stemmed."""
+    words = []
+    for word in canonical_key(expression).split():
+        if word in PRONOUNS:
+            words.append("<someone>")
+        elif word in REFLEXIVES:
+            words.append("<oneself>")
+        else:
+            words.append(stem(word))
+    return " ".join(words)
+
+def key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+def replacement_for(lemma: str, explanation: str) -> str | None:
+    """The explanation as a literal replacement, if it is short and plain enough."""
+    text = explanation.strip().rstrip(".")
+    # Verb phrases are explained as infinitives: "spill the beans" -> "to reveal a secret"
+    if text.lower().startswith("to ") and not lemma.startswith("to "):
+        text = text[3:]
+    if not text or re.search(r"[;:,()\"]", text) or len(text.split()) > MAX_REPLACEMENT_WORDS:
+        return None
+    return text
+
+#### Dictionary ####
+
+class IdiomDictionary():
+    def __init__(self, directory: str):
+        # numpy and pyarrow are imported on first use, to keep them out of
+        # the import of the API when the dictionary is off
+        import numpy as np
+        import pyarrow as pa
+
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.keys = np.load(os.path.join(directory, "keys.npy"), mmap_mode="r")
+        self.rows = np.load(os.path.join(directory, "rows.npy"), mmap_mode="r")
+        self.kinds = np.load(os.path.join(directory, "kinds.npy"), mmap_mode="r")
+        self._source = pa.memory_map(os.path.join(directory, "entries.arrow"))
+        self.entries = pa.ipc.open_file(self._source).read_all()
+
+    def __len__(self) -> int:
+        return self.entries.num_rows
+
+    def _find(self, key: str) -> tuple[int, int] | None:
+        """Entry row and kind of a key."""
+        hashed = self.keys.dtype.type(key_hash(key))
+        i = int(self.keys.searchsorted(hashed))
+        if i < len(self.keys) and self.keys[i] == hashed:
+            return int(self.rows[i]), int(self.kinds[i])
+        return None
+
+    def lookup(self, expression: str, type: str | None = None) -> Entry | None:
+        """
+        The entry of an expression as it occurs in a text. The match is exact
+        when it occurs in its canonical form, and a variant otherwise.
+        """
+        found = self._find(canonical_key(expression)) or self._find(folded_key(expression))
+        if found is None:
+            return None
+        row, kind = found
+        entry = {name: self.entries.column(name)[row].as_py() for name in ENTRY_COLUMNS}
+        if type is not None and entry["type"] != type:
+            return None
+        # A folded key that happens to be a canonical form is still a variant
+        exact = kind == CANONICAL and canonical_key(expression) == entry["lemma"]
+        return Entry(**entry, match="exact" if exact else "variant")
+
+    def close(self) -> None:
+        self.entries = None
+        self._source.close()
+
+_dictionary: IdiomDictionary | None = None
+_dictionary_loaded = False
+
+def get_dictionary() -> IdiomDictionary | None:
+    """Returns the configured idiom dictionary, or None if there is none."""
+    global _dictionary, _dictionary_loaded
+    if not _dictionary_loaded:
+        _dictionary_loaded = True
+        path = conf.get_idiom_dictionary_path()
+        if path:
+            _dictionary = IdiomDictionary(path)
+            logger.info(f"Loaded idiom dictionary with {len(_dictionary)} entries")
+    return _dictionary
+
+def close() -> None:
+    global _dictionary, _dictionary_loaded
+    if _dictionary is not None:
+        _dictionary.close()
+    _dictionary, _dictionary_loaded = None, False
+
+def lookup(expression: str, type: str | None = None) -> Entry | None:
+    """Looks an expression up in the configured dictionary."""
+    dictionary = get_dictionary()
+    if dictionary is None:
+        return None
+    with tracing.span("idioms.lookup") as span:
+        entry = dictionary.lookup(expression, type)
+        outcome = entry.match if entry else "miss"
+        span.set_attribute("idioms.outcome", outcome)
+    metrics.inc("idiom_lookups_total", outcome=outcome)
+    return entry
+
+#### Building ####
+
+def build(corpora_root: str, directory: str, corpora: list[str], types: list[str]) -> int:
+    """Collects the explained expressions of the given types and their surface forms."""
+    from models.operations.corpora import open_corpus
+
+    explanations: dict[str, tuple[str, str]] = {}
+    surfaces: dict[str, set[str]] = {}
+    for corpus in corpora:
+        with open_corpus(corpora_root, corpus) as reader:
+            for record in reader.iter_records():
+                if not record.figurative or record.type not in types:
+                    continue
+                surfaces.setdefault(record.lemma, set()).add(record.expression)
+                if record.explanation and record.lemma not in explanations:
+                    explanations[record.lemma] = (record.type, record.explanation.strip())
+    if not explanations:
+        raise ValueError("No explained expressions found")
+
+    entries: dict[str, list] = {name: [] for name in ENTRY_COLUMNS}
+    keys: list[tuple[str, int, int]] = []
+    for row, (lemma, (type, explanation)) in enumerate(sorted(explanations.items())):
+        entries["lemma"].append(lemma)
+        entries["type"].append(type)
+        entries["explanation"].append(explanation)
+        entries["replacement"].append(replacement_for(lemma, explanation))
+        keys.append((canonical_key(lemma), row, CANONICAL))
+        keys.append((folded_key(lemma), row, VARIANT))
+        for surface in surfaces.get(lemma, ()):
+            keys.append((canonical_key(surface), row, VARIANT))
+            keys.append((folded_key(surface), row, VARIANT))
+    write_dictionary(directory, entries, keys, {"corpora": corpora, "types": types})
+    return len(entries["lemma"])
+
+def write_dictionary(
+    directory: str, entries: dict[str, list], keys: list[tuple[str, int, int]], meta: dict,
+) -> None:
+    """Writes entries (ENTRY_COLUMNS) and their (key, row, kind) lookup keys."""
+    import numpy as np
+    import pyarrow as pa
+
+    # One row per hash; canonical forms win over variants, then earlier rows
+    best: dict[int, tuple[int, int]] = {}
+    for key, row, kind in keys:
+        hashed = key_hash(key)
+        if hashed not in best or (kind, row) < (best[hashed][1], best[hashed][0]):
+            best[hashed] = (row, kind)
+    hashes = np.array(sorted(best), dtype=np.uint64)
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "keys.npy"), hashes)
+    np.save(os.path.join(directory, "rows.npy"), np.array([best[int(h)][0] for h in hashes], dtype=np.int32))
+    np.save(os.path.join(directory, "kinds.npy"), np.array([best[int(h)][1] for h in hashes], dtype=np.uint8))
+    schema = pa.schema([(name, pa.string()) for name in ENTRY_COLUMNS])
+    with pa.OSFile(os.path.join(directory, "entries.arrow"), "wb") as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            writer.write_table(pa.table(entries, schema=schema))
+    # Identifies the content, so cached simplifications follow rebuilds
+    digest = hashlib.sha256(json.dumps(entries, sort_keys=True).encode()).hexdigest()[:12]
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({**meta, "entries": len(entries["lemma"]), "keys": len(hashes), "version": digest}, f)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Idiom dictionary.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build a dictionary from ingested corpora")
+    build_parser.add_argument("corpora_root", help="Root directory of the ingested corpora")
+    build_parser.add_argument("out", help="Dictionary directory")
+    build_parser.add_argument("--corpora", nargs="+", default=["id10", "magpie"])
+    build_parser.add_argument("--types", nargs="+", default=["idiom"])
+    query_parser = subparsers.add_parser("query", help="Look an expression up")
+    query_parser.add_argument("dictionary", help="Dictionary directory")
+    query_parser.add_argument("expression")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build(args.corpora_root, args.out, args.corpora, args.types)
+        print(f"Built a dictionary of {count} expressions")
+        return
+
+    dictionary = IdiomDictionary(args.dictionary)
+    start = time.perf_counter()
+    entry = dictionary.lookup(args.expression)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(entry._asdict() if entry else "Not found")
+    print(f"Lookup over {dictionary.meta['keys']} keys took {elapsed:.3f} ms")
+
+if __name__ == "__main__":
+    log.init(conf.get_log_level())
+    sys.exit(main())
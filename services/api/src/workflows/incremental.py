@@ -0,0 +1,121 @@
+"""
+Incremental re-adaptation of edited documents.
+
+Diffs the new text against a previous adaptation at sentence level, reuses the
+previous expressions (with shifted offsets) for unchanged sentences and only
+runs the workflow on changed sentences and their direct neighbours, so cost
+scales with the size of the edit rather than the size of the document.
+"""
+
+from difflib import SequenceMatcher
+from typing import NamedTuple
+
+from utils import log, metrics
+from workflows import deadline
+from workflows.metaphor import MetaphorState, get_edits, process_text
+from workflows.spans import apply_edits, split_sentences
+
+logger = log.get_logger(__name__)
+
+#### Types ####
+
+class Plan(NamedTuple):
+    # (start, end, shift) ranges of the previous text whose expressions are
+    # kept, moved by `shift` characters
+    reuse: list[tuple[int, int, int]]
+    # (start, end) ranges of the new text that have to be re-analyzed
+    chunks: list[tuple[int, int]]
+
+#### Planning ####
+
+def plan(previous_text: str, text: str) -> Plan:
+    old = split_sentences(previous_text)
+    new = split_sentences(text)
+    # Sentence spans end with the whitespace after them, which is compared
+    # out, so that e.g. typing a space after the last sentence changes nothing
+    matcher = SequenceMatcher(
+        None,
+        [previous_text[a:b].rstrip() for a, b in old],
+        [text[a:b].rstrip() for a, b in new],
+        autojunk=False,
+    )
+
+    # Mark changed sentences, and their neighbours whose context changed.
+    # Sentences appended to the end are analyzed on their own, starting at
+    # the last sentence boundary, so appending leaves the old text alone.
+    dirty = [False] * len(new)
+    matches: dict[int, int] = {}
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            matches.update((j1 + k, i1 + k) for k in range(i2 - i1))
+            continue
+        appended = tag == "insert" and i1 == len(old)
+        for j in range(j1 if appended else max(0, j1 - 1), min(len(new), j2 + 1)):
+            dirty[j] = True
+
+    reuse = []
+    chunks = []
+    for j, (start, end) in enumerate(new):
+        if not dirty[j]:
+            old_start, old_end = old[matches[j]]
+            reuse.append((old_start, old_end, start - old_start))
+        elif chunks and chunks[-1][1] == start:
+            chunks[-1] = (chunks[-1][0], end)
+        else:
+            chunks.append((start, end))
+    return Plan(reuse=reuse, chunks=chunks)
+
+#### Processing ####
+
+def process_text_incremental(
+    text: str, previous_text: str, previous_expressions: list[dict], run_id: str | None = None,
+) -> MetaphorState:
+    """
+    Process text through the workflow, reusing the expressions of a previous
+    adaptation of an earlier version of the same text wherever it is unchanged.
+    Changed parts not reached before the deadline are left without expressions
+    and the result is marked as partial. With a `run_id`, the run of each
+    changed part is checkpointed (see process_text).
+    """
+    p = plan(previous_text, text)
+
+    expressions = []
+    timings: dict[str, float] = {}
+    partial = False
+    for old_start, old_end, shift in p.reuse:
+        expressions.extend(
+            {**e, "startIndex": e["startIndex"] + shift, "endIndex": e["endIndex"] + shift}
+            for e in previous_expressions
+            if old_start <= e["startIndex"] and e["endIndex"] <= old_end
+        )
+    for start, end in p.chunks:
+        try:
+            state = process_text(text[start:end], None if run_id is None else f"{run_id}:{start}:{end}")
+        except deadline.DeadlineExceeded:
+            logger.info("Deadline reached; leaving the remaining changed parts unanalyzed")
+            partial = True
+            break
+        partial = partial or state.get("partial", False)
+        for stage, ms in state["timings"].items():
+            timings[stage] = timings.get(stage, 0.0) + ms
+        expressions.extend(
+            {**e, "startIndex": e["startIndex"] + start, "endIndex": e["endIndex"] + start}
+            for e in state["expressions"]
+        )
+        if partial:
+            logger.info("Deadline reached; leaving the remaining changed parts unanalyzed")
+            break
+    expressions.sort(key=lambda e: e["startIndex"])
+
+    reanalyzed = sum(end - start for start, end in p.chunks)
+    metrics.inc("incremental_chars_total", len(text))
+    metrics.inc("incremental_chars_reanalyzed_total", reanalyzed)
+    logger.debug(f"Re-analyzed {reanalyzed} of {len(text)} characters in {len(p.chunks)} chunk(s)")
+
+    return {
+        "text": text,
+        "result": apply_edits(text, get_edits(expressions)),
+        "expressions": expressions,
+        "partial": partial,
+        "timings": timings,
+    }
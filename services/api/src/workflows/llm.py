@@ -0,0 +1,231 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Iterator, TypeVar
+from pydantic import BaseModel, Field, create_model
+from utils import metrics, tracing
+from utils.batching import MicroBatcher
+from utils.ratelimit import RateLimiter
+from workflows import deadline, priority, usage
+import conf
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+R = TypeVar("R")
+
+#### Clients ####
+
+@functools.lru_cache(maxsize=8)
+def _llm(api_key: str, base_url: str, model: str) -> "ChatOpenAI":
+    # langchain_openai is imported on first use, as it dominates import time
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(api_key=api_key, base_url=base_url, model=model)
+
+@functools.lru_cache(maxsize=8)
+def _batch_llm(model: str) -> "ChatOpenAI":
+    import httpx
+    from langchain_openai import ChatOpenAI
+    from utils.batch_api import BatchTransport
+
+    return ChatOpenAI(
+        api_key=conf.get_batch_api_conf().api_key,
+        model=model,
+        http_client=httpx.Client(transport=BatchTransport(get_batch_api_batcher()), timeout=None),
+    )
+
+def get_llm(model: str | None = None) -> "ChatOpenAI":
+    """Returns a client for the model (the configured one by default), reusing its connection pool."""
+    if _batch_api.get():
+        return _batch_llm(model or conf.get_openrouter_model())
+    return _llm(
+        conf.get_openrouter_api_key(),
+        conf.get_openrouter_base_url(),
+        model or conf.get_openrouter_model(),
+    )
+
+_upstream_limiter: RateLimiter | None = None
+
+def get_upstream_limiter() -> RateLimiter | None:
+    """Returns the upstream LLM rate limiter, or None if unlimited."""
+    global _upstream_limiter
+    rpm = conf.get_upstream_rate_limit_rpm()
+    if rpm <= 0:
+        return None
+    if _upstream_limiter is None:
+        _upstream_limiter = RateLimiter(
+            name="upstream", rate_per_minute=rpm, path=conf.get_shared_state_path(),
+        )
+    return _upstream_limiter
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_thread: threading.Thread | None = None
+_loop_lock = threading.Lock()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the event loop that upstream calls of runs with a deadline are
+    made on, so that they can be aborted (which closes the connection) when
+    the deadline passes or the run is cancelled.
+    """
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="upstream", daemon=True)
+            _loop_thread.start()
+    return _loop
+
+def invoke(chain, inputs: dict, model: str):
+    """Invokes the chain, aborting the call if the run's deadline passes or it is cancelled."""
+    if deadline.current() is None or _batch_api.get():
+        return chain.invoke(inputs)
+    deadline.check()
+    return deadline.wait(asyncio.run_coroutine_threadsafe(chain.ainvoke(inputs), get_loop()), model)
+
+def call_llm(prompt, schema, inputs: dict, model: str | None = None):
+    """
+    Runs a prompt with structured output on the model (the configured one by
+    default) and returns the parsed result. Every call goes through here so
+    that budgets, priority lanes, the upstream rate limit, the request
+    deadline and usage accounting apply.
+    """
+    deadline.check()
+    prompt_chars = sum(len(str(m.content)) for m in prompt.format_messages(**inputs))
+    model = usage.choose_model(model or conf.get_openrouter_model(), prompt_chars)
+
+    batched = _batch_api.get()
+    price_factor = conf.get_batch_api_conf().price_factor if batched else 1.0
+    attributes = {"gen_ai.operation.name": "chat", "gen_ai.request.model": model, "gen_ai.output.schema": schema.__name__}
+    start = time.perf_counter()
+    with (
+        tracing.span(f"chat {model}", {**attributes, "upstream.lane": priority.current(), "upstream.batch_api": batched}) as span,
+        contextlib.nullcontext() if batched else priority.slot(),
+    ):
+        span.set_attribute("upstream.queue_wait_ms", (time.perf_counter() - start) * 1000)
+        if not batched and (limiter := get_upstream_limiter()) is not None:
+            start = time.perf_counter()
+            if not limiter.acquire(timeout=deadline.remaining()):
+                raise deadline.DeadlineExceeded("Request deadline exceeded waiting for the upstream rate limit")
+            span.set_attribute("upstream.rate_limit_wait_ms", (time.perf_counter() - start) * 1000)
+        chain = prompt | get_llm(model).with_structured_output(schema, include_raw=True)
+        response = invoke(chain, inputs, model)
+
+        tokens = getattr(response["raw"], "usage_metadata", None) or {}
+        input_tokens, output_tokens = tokens.get("input_tokens", 0), tokens.get("output_tokens", 0)
+        usage.record(model, input_tokens, output_tokens, price_factor)
+        span.set_attributes({
+            "gen_ai.usage.input_tokens": input_tokens,
+            "gen_ai.usage.output_tokens": output_tokens,
+            "gen_ai.usage.cost_usd": usage.cost(model, input_tokens, output_tokens) * price_factor,
+        })
+        if response.get("parsing_error") is not None:
+            raise response["parsing_error"]
+        return response["parsed"]
+
+@functools.cache
+def scored(schema: type[BaseModel]) -> type[BaseModel]:
+    """The schema with an added self-reported confidence (under the same name)."""
+    return create_model(
+        schema.__name__,
+        __base__=schema,
+        confidence=(float, Field(description="How confident you are that this answer is complete and correct, from 0 to 1")),
+    )
+
+def call_cascade(prompt, schema: type[BaseModel], inputs: dict) -> tuple[BaseModel, str]:
+    """
+    Like call_llm, but tries the cascade model first and only escalates to the
+    configured model when its self-reported confidence is below the
+    threshold. Returns the result and the model that produced it.
+    """
+    cascade = conf.get_cascade_conf()
+    if cascade.model:
+        response = call_llm(prompt, scored(schema), inputs, model=cascade.model)
+        if response.confidence >= cascade.confidence_threshold:
+            metrics.inc("cascade_results_total", schema=schema.__name__, outcome="accepted")
+            return schema.model_validate(response.model_dump(exclude={"confidence"})), cascade.model
+        metrics.inc("cascade_results_total", schema=schema.__name__, outcome="escalated")
+    model = conf.get_openrouter_model()
+    return call_llm(prompt, schema, inputs, model=model), model
+
+#### Batch API ####
+
+# Batch jobs polled at once
+BATCH_API_JOBS = 32
+
+_batch_api: contextvars.ContextVar[bool] = contextvars.ContextVar("batch_api", default=False)
+
+_batch_api_batcher: MicroBatcher[dict, dict] | None = None
+_batch_api_lock = threading.Lock()
+
+def get_batch_api_batcher() -> MicroBatcher[dict, dict]:
+    """Returns the batcher that collects the requests of batched calls into batch jobs."""
+    global _batch_api_batcher
+    # httpx and the openai client are imported on first use, like langchain_openai
+    from utils.batch_api import BatchApiClient
+
+    with _batch_api_lock:
+        if _batch_api_batcher is None:
+            batch_conf = conf.get_batch_api_conf()
+            client = BatchApiClient(batch_conf.base_url, batch_conf.api_key, batch_conf.poll_seconds)
+            _batch_api_batcher = MicroBatcher(
+                "batch_api",
+                client.run,
+                max_wait=batch_conf.max_wait_seconds,
+                max_size=batch_conf.max_requests,
+                workers=BATCH_API_JOBS,
+            )
+    return _batch_api_batcher
+
+@contextlib.contextmanager
+def batch_api(enabled: bool = True) -> Iterator[None]:
+    """
+    Sends the LLM calls made within the block to the provider's batch API
+    instead of calling it synchronously. Calls then take as long as a batch
+    job (minutes to hours) at a lower price, so this is only for offline
+    work; priority lanes, the upstream rate limit and deadlines do not apply.
+    """
+    token = _batch_api.set(enabled)
+    try:
+        yield
+    finally:
+        _batch_api.reset(token)
+
+def batched() -> bool:
+    """Whether LLM calls in the current context go to the batch API."""
+    return _batch_api.get()
+
+def gather(calls: list[Callable[[], R]]) -> list[R]:
+    """
+    Makes independent calls side by side, in the caller's context, so that
+    batched calls share a batch job instead of waiting for one each. Raises
+    the first exception a call raised.
+    """
+    if len(calls) <= 1:
+        return [call() for call in calls]
+    with ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="gather") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, call) for call in calls]
+        return [future.result() for future in futures]
+
+def close() -> None:
+    global _upstream_limiter, _loop, _loop_thread, _batch_api_batcher
+    _llm.cache_clear()
+    _batch_llm.cache_clear()
+    with _batch_api_lock:
+        if _batch_api_batcher is not None:
+            _batch_api_batcher.close()
+            _batch_api_batcher = None
+    with _loop_lock:
+        if _loop is not None:
+            _loop.call_soon_threadsafe(_loop.stop)
+            _loop_thread.join()
+            _loop.close()
+            _loop = _loop_thread = None
+    if _upstream_limiter is not None:
+        _upstream_limiter.close()
+        _upstream_limiter = None
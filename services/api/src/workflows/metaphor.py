@@ -1,49 +1,529 @@
-from typing import TypedDict
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langgraph.graph import StateGraph, START, END
+import functools
+import operator
+import re
+import time
+from typing import TYPE_CHECKING, Annotated, Literal, NamedTuple, TypedDict
+from pydantic import BaseModel
+from utils.batching import MicroBatcher
+from utils.cache import Cache
+from utils import log, metrics, tracing
+from workflows import deadline, examples as few_shot, idioms, priority, usage, validation as guardrail
+from workflows.llm import batched, call_cascade, call_llm, gather
+from workflows.spans import apply_edits
 import conf
 
+if TYPE_CHECKING:
+    from workflows.checkpoints import SQLiteCheckpointer
+
+logger = log.get_logger(__name__)
+
+# Bump whenever the simplification prompt changes, so that cached
+# explanations produced by the old prompt are no longer served.
+SIMPLIFICATION_PROMPT_VERSION = "1"
+
+# Define Structured Outputs
+class DetectedExpression(BaseModel):
+    type: Literal["idiom", "conceptual_metaphor"]
+    original: str
+
+class Detection(BaseModel):
+    expressions: list[DetectedExpression]
+
+class BatchedDetection(BaseModel):
+    id: int
+    expressions: list[DetectedExpression]
+
+class BatchDetection(BaseModel):
+    texts: list[BatchedDetection]
+
+class Simplification(BaseModel):
+    explanation: str
+    simplifiedVersion: str
+
+class Rephrasing(BaseModel):
+    simplifiedVersion: str
+
+# A text waiting to be detected in a batch
+class DetectionRequest(NamedTuple):
+    text: str
+    examples: list[dict]
+    usage: usage.Usage | None
+    lane: priority.Lane
+    # time.monotonic() value of the submitting request's deadline
+    until: float | None
+
+DETECTION_PROMPT = "You are an expert at identifying metaphors and idioms. Analyze the following text and list every idiom and conceptual metaphor it contains, quoting each one exactly as it appears in the text."
+
+BATCH_DETECTION_PROMPT = "You are an expert at identifying metaphors and idioms. The user message holds several independent texts, each preceded by its id in brackets. For every text, give its id and list every idiom and conceptual metaphor it contains, quoting each one exactly as it appears in that text. Include every id, with an empty list for texts without any."
+
 # Define State
 class MetaphorState(TypedDict):
     text: str
     result: str
+    expressions: list[dict]
+    # Set when the deadline cut the run short and some expressions were left
+    # unsimplified
+    partial: bool
+    # Milliseconds spent per stage
+    timings: Annotated[dict[str, float], operator.or_]
 
-# Define Node
-def metaphor_identification(state: MetaphorState):
-    api_key = conf.get_openrouter_api_key()
-    base_url = conf.get_openrouter_base_url()
-    model_name = conf.get_openrouter_model()
+#### Utilities ####
+
+def workflow_version() -> str:
+    """Identifies everything besides the input text that affects the output."""
+    version = f"{SIMPLIFICATION_PROMPT_VERSION}:{conf.get_openrouter_model()}"
+    cascade = conf.get_cascade_conf()
+    if cascade.model:
+        version += f":{cascade.model}@{cascade.confidence_threshold}"
+    if dictionary := idioms.get_dictionary():
+        version += f":idioms@{dictionary.meta['version']}"
+    return version
+
+def normalize(text: str) -> str:
+    """Lowercases, collapses whitespace and strips surrounding punctuation."""
+    return re.sub(r"\s+", " ", text).strip(" \t\n.,;:!?\"'()").lower()
+
+def get_context(text: str, start: int, end: int, words: int) -> tuple[str, str]:
+    """Returns the `words` words before and after the span [start, end)."""
+    before = text[:start].split()[-words:] if words > 0 else []
+    after = text[end:].split()[:words] if words > 0 else []
+    return " ".join(before), " ".join(after)
+
+def locate(text: str, original: str, offset: int) -> tuple[int, int] | None:
+    """Finds `original` in `text` at or after `offset`, falling back to anywhere."""
+    index = text.find(original, offset)
+    if index < 0:
+        index = text.find(original)
+    if index < 0:
+        return None
+    return index, index + len(original)
+
+def get_edits(expressions: list[dict]) -> list[tuple[int, int, str]]:
+    """Returns the edits that turn the input text into the adapted text."""
+    return [
+        (e["startIndex"], e["endIndex"], e["simplifiedVersion"])
+        for e in sorted(expressions, key=lambda e: e["startIndex"])
+    ]
+
+_expression_cache: Cache | None = None
 
-    llm = ChatOpenAI(
-        api_key=api_key,
-        base_url=base_url,
-        model=model_name,
-    )
+def get_expression_cache() -> Cache | None:
+    """Returns the process-wide expression cache, or None if disabled."""
+    global _expression_cache
+    cache_conf = conf.get_expression_cache_conf()
+    if not cache_conf.enabled:
+        return None
+    if _expression_cache is None:
+        _expression_cache = Cache(
+            namespace=workflow_version(),
+            max_entries=cache_conf.max_entries,
+            path=cache_conf.path,
+        )
+    return _expression_cache
+
+_checkpointer: "SQLiteCheckpointer | None" = None
+
+def get_checkpointer() -> "SQLiteCheckpointer | None":
+    """Returns the process-wide checkpointer, or None if disabled."""
+    global _checkpointer
+    checkpoint_conf = conf.get_checkpoint_conf()
+    if not checkpoint_conf.enabled:
+        return None
+    if _checkpointer is None:
+        from workflows.checkpoints import SQLiteCheckpointer
+
+        _checkpointer = SQLiteCheckpointer(checkpoint_conf.path, checkpoint_conf.ttl_seconds)
+    return _checkpointer
+
+_detection_batcher: MicroBatcher[DetectionRequest, Detection] | None = None
+
+def get_detection_batcher() -> MicroBatcher[DetectionRequest, Detection] | None:
+    """Returns the process-wide detection batcher, or None if batching is disabled."""
+    global _detection_batcher
+    batching = conf.get_batching_conf()
+    if batching.max_wait_ms <= 0:
+        return None
+    if _detection_batcher is None:
+        _detection_batcher = MicroBatcher(
+            "detection",
+            detect_batch,
+            max_wait=batching.max_wait_ms / 1000,
+            max_size=batching.max_tokens,
+            size=lambda request: len(request.text) * usage.TOKENS_PER_CHAR,
+        )
+    return _detection_batcher
+
+def close() -> None:
+    """Releases the process-wide expression cache, checkpointer and batcher."""
+    global _expression_cache, _checkpointer, _detection_batcher
+    if _detection_batcher is not None:
+        _detection_batcher.close()
+        _detection_batcher = None
+    if _expression_cache is not None:
+        _expression_cache.close()
+        _expression_cache = None
+    if _checkpointer is not None:
+        _checkpointer.close()
+        _checkpointer = None
+    get_graph.cache_clear()
+
+def expression_cache_key(text: str, expression: dict, words: int) -> str:
+    start, end = expression["startIndex"], expression["endIndex"]
+    before, after = get_context(text, start, end, words)
+    return "\x1f".join([
+        expression["type"],
+        normalize(text[start:end]),
+        normalize(before),
+        normalize(after),
+    ])
+
+def timed(stage: str):
+    """Records how long a node takes in the state's timings and in metrics."""
+    def decorator(node):
+        @functools.wraps(node)
+        def wrapper(state: MetaphorState):
+            start = time.perf_counter()
+            with tracing.span(f"workflow.{stage}") as span:
+                update = node(state)
+                timings = {**update.get("timings", {}), stage: (time.perf_counter() - start) * 1000}
+                span.set_attributes({
+                    "workflow.expressions": len(update.get("expressions", state["expressions"])),
+                    **{f"workflow.{name}_ms": ms for name, ms in timings.items()},
+                })
+            for name, ms in timings.items():
+                metrics.inc("stage_duration_ms_total", ms, stage=name)
+                metrics.inc("stage_runs_total", stage=name)
+            return {**update, "timings": timings}
+        return wrapper
+    return decorator
+
+def detect(text: str, examples: list[dict]) -> Detection:
+    """
+    Detects the expressions in a text. Short texts are batched with those of
+    concurrent requests when batching is enabled; they are detected on their
+    own if the batch fails or misses them.
+    """
+    from langchain_core.prompts import ChatPromptTemplate
+
+    batcher = get_detection_batcher()
+    # Budgets are checked per request up front, as batch calls are shared
+    # Calls to the batch API are batched already
+    if (
+        batcher is not None
+        and not batched()
+        and len(text) * usage.TOKENS_PER_CHAR <= conf.get_batching_conf().max_item_tokens
+        and usage.within_budget(conf.get_openrouter_model(), len(text))
+    ):
+        remaining = deadline.remaining()
+        request = DetectionRequest(
+            text, examples, usage.current(), priority.current(),
+            None if remaining is None else time.monotonic() + remaining,
+        )
+        try:
+            return deadline.wait(batcher.submit(request), "a detection batch")
+        except deadline.DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.debug(f"Detecting on its own after the batch failed: {e}")
+            metrics.inc("batch_fallbacks_total", batcher="detection")
 
     prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are an expert at identifying metaphors. Analyze the following text and determine if it contains any metaphors."),
+        ("system", DETECTION_PROMPT + "{examples}"),
         ("user", "{text}")
     ])
+    response, _ = call_cascade(prompt, Detection, {"text": text, "examples": few_shot.format_examples(examples)})
+    return response
 
-    chain = prompt | llm
-    
-    response = chain.invoke({"text": state["text"]})
-    
-    return {"result": response.content}
+def detect_batch(requests: list[DetectionRequest]) -> list[Detection | Exception]:
+    """Detects the expressions in several texts with one LLM call."""
+    from langchain_core.prompts import ChatPromptTemplate
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", BATCH_DETECTION_PROMPT + "{examples}"),
+        ("user", "{texts}")
+    ])
+    examples = list({(e["text"], e["expression"]): e for r in requests for e in r.examples}.values())
+    texts = "\n\n".join(f"[{i}] {r.text}" for i, r in enumerate(requests))
+
+    # The call may take as long as the most patient request allows, runs in
+    # the most urgent lane, and its usage is split between the requests by
+    # text length
+    until = [r.until for r in requests]
+    timeout = None if None in until else max(until) - time.monotonic()
+    with (
+        usage.shared([(r.usage, len(r.text)) for r in requests]),
+        priority.lane(priority.first([r.lane for r in requests])),
+        deadline.within(timeout),
+    ):
+        response, _ = call_cascade(
+            prompt, BatchDetection, {"texts": texts, "examples": few_shot.format_examples(examples)},
+        )
+
+    found = {t.id: Detection(expressions=t.expressions) for t in response.texts}
+    return [found.get(i) or LookupError(f"Batch answer has no text {i}") for i in range(len(requests))]
+
+# Define Nodes
+@timed("detection")
+def metaphor_identification(state: MetaphorState):
+    """
+    Detects the expressions in the text. If the deadline passes first, the
+    text is left without expressions and the state is marked as partial.
+    """
+    start = time.perf_counter()
+    examples = few_shot.retrieve(state["text"])
+    timings = {"detection.retrieval": (time.perf_counter() - start) * 1000}
+
+    try:
+        response = detect(state["text"], examples)
+    except deadline.DeadlineExceeded:
+        logger.info("Deadline reached during detection; returning the text unanalyzed")
+        return {"expressions": [], "partial": True, "timings": timings}
+
+    expressions = []
+    offset = 0
+    for detected in response.expressions:
+        span = locate(state["text"], detected.original, offset)
+        if span is None:
+            logger.debug(f"Dropping expression not found in text: {detected.original!r}")
+            continue
+        if any(span[0] < e["endIndex"] and e["startIndex"] < span[1] for e in expressions):
+            logger.debug(f"Dropping overlapping expression: {detected.original!r}")
+            continue
+        expressions.append({
+            "type": detected.type,
+            "startIndex": span[0],
+            "endIndex": span[1],
+        })
+        offset = span[1]
+
+    expressions.sort(key=lambda e: e["startIndex"])
+    return {"expressions": expressions, "timings": timings}
+
+def simplify(text: str, expression: dict, words: int, escalate: bool = False) -> dict:
+    """
+    Returns the explanation and simplified version of an expression, and the
+    model that produced them. Known idioms are explained from the idiom
+    dictionary. With `escalate`, the dictionary and the cascade are skipped.
+    """
+    from langchain_core.prompts import ChatPromptTemplate
+
+    if not escalate:
+        original = text[expression["startIndex"]:expression["endIndex"]]
+        entry = idioms.lookup(original, expression["type"])
+        if entry is not None:
+            return rephrase(text, expression, words, entry)
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "You rewrite figurative language into Easy-to-Read English. Explain what the expression means and give a plain, literal replacement that fits into the sentence in its place."),
+        ("user", "Expression: {original}\nContext: {before} [{original}] {after}")
+    ])
+    before, after = get_context(text, expression["startIndex"], expression["endIndex"], words)
+    inputs = {
+        "original": text[expression["startIndex"]:expression["endIndex"]],
+        "before": before,
+        "after": after,
+    }
+    if escalate:
+        model = conf.get_openrouter_model()
+        response = call_llm(prompt, Simplification, inputs, model=model)
+    else:
+        response, model = call_cascade(prompt, Simplification, inputs)
+    return {**response.model_dump(), "model": model}
+
+def rephrase(text: str, expression: dict, words: int, entry: idioms.Entry) -> dict:
+    """
+    Simplifies a known idiom. Its explanation is taken from the dictionary;
+    so is its replacement if the idiom occurs in its canonical form, and
+    otherwise the LLM only fits the known meaning into the context.
+    """
+    from langchain_core.prompts import ChatPromptTemplate
+
+    if entry.match == "exact" and entry.replacement:
+        metrics.inc("idiom_simplifications_total", source="dictionary")
+        return {"explanation": entry.explanation, "simplifiedVersion": entry.replacement, "model": idioms.MODEL}
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "You rewrite figurative language into Easy-to-Read English. Give a plain, literal replacement for the expression, with the given meaning, that fits into the sentence in its place."),
+        ("user", "Expression: {original}\nMeaning: {meaning}\nContext: {before} [{original}] {after}")
+    ])
+    before, after = get_context(text, expression["startIndex"], expression["endIndex"], words)
+    inputs = {
+        "original": text[expression["startIndex"]:expression["endIndex"]],
+        "meaning": entry.explanation,
+        "before": before,
+        "after": after,
+    }
+    response, model = call_cascade(prompt, Rephrasing, inputs)
+    metrics.inc("idiom_simplifications_total", source="rephrased")
+    return {"explanation": entry.explanation, "simplifiedVersion": response.simplifiedVersion, "model": model}
+
+@timed("simplification")
+def simplification(state: MetaphorState):
+    """
+    Simplifies the detected expressions. Once the deadline has passed, the
+    remaining ones are left as they are (cached results are still used) and
+    the state is marked as partial.
+    """
+    cache = get_expression_cache()
+    words = conf.get_expression_cache_conf().context_words
+
+    keys = [expression_cache_key(state["text"], e, words) for e in state["expressions"]]
+    found = [cache.get(key) if cache is not None else None for key in keys]
+    if batched():
+        # Batch jobs take minutes, so the expressions share one rather than
+        # waiting for a job each
+        missing = [i for i, cached in enumerate(found) if cached is None]
+        results = gather([
+            functools.partial(simplify, state["text"], state["expressions"][i], words) for i in missing
+        ])
+        for i, result in zip(missing, results):
+            found[i] = result
+            if cache is not None:
+                cache.put(keys[i], result)
+
+    expressions = []
+    partial = False
+    for expression, key, cached in zip(state["expressions"], keys, found):
+        if cached is None and not partial:
+            try:
+                cached = simplify(state["text"], expression, words)
+            except deadline.DeadlineExceeded:
+                logger.info("Deadline reached; returning the remaining expressions unsimplified")
+                partial = True
+            else:
+                if cache is not None:
+                    cache.put(key, cached)
+        expressions.append({**expression, **(cached or {})})
+
+    return {"expressions": expressions, "partial": partial or state["partial"]}
+
+@timed("validation")
+def validation(state: MetaphorState):
+    """
+    Checks that simplifications preserve meaning, reverting rejected ones to
+    the original wording, and composes the adapted text. Expressions left
+    unsimplified keep their original wording.
+    """
+    text = state["text"]
+    expressions = state["expressions"]
+    timings = {}
+
+    pending = [i for i, e in enumerate(expressions) if "simplifiedVersion" in e and "validation" not in e]
+    # Verdicts forced by the deadline, which must not be cached
+    unsettled: set[int] = set()
+    if conf.get_guardrail_conf().enabled and pending and guardrail.available():
+        words = conf.get_expression_cache_conf().context_words
+        results, timings = guardrail.validate(text, [expressions[i] for i in pending])
+        expressions = list(expressions)
+        for i, result in zip(pending, results):
+            expressions[i] = {**expressions[i], "validation": result}
+            if result.get("deadline"):
+                unsettled.add(i)
+
+        # Rejected answers of the cascade model get a second chance on the
+        # configured model, as far as the deadline allows
+        strong = conf.get_openrouter_model()
+        rejected = [
+            i for i in pending
+            if expressions[i]["validation"]["verdict"] == guardrail.REJECTED
+            and expressions[i].get("model", strong) != strong
+        ]
+        retry = []
+        if rejected:
+            metrics.inc("cascade_results_total", len(rejected), schema="Simplification", outcome="rejected")
+        for i in rejected:
+            try:
+                expressions[i] = {**expressions[i], **simplify(text, expressions[i], words, escalate=True)}
+                retry.append(i)
+            except deadline.DeadlineExceeded:
+                unsettled.add(i)
+        if retry:
+            results, retry_timings = guardrail.validate(text, [expressions[i] for i in retry])
+            for i, result in zip(retry, results):
+                expressions[i] = {**expressions[i], "validation": result}
+                if result.get("deadline"):
+                    unsettled.add(i)
+            for stage, ms in retry_timings.items():
+                timings[stage] = timings.get(stage, 0.0) + ms
+
+        cache = get_expression_cache()
+        if cache is not None:
+            for i in pending:
+                if i in unsettled:
+                    continue
+                cache.put(expression_cache_key(text, expressions[i], words), {
+                    key: expressions[i][key]
+                    for key in ("explanation", "simplifiedVersion", "model", "validation")
+                    if key in expressions[i]
+                })
+
+    expressions = [
+        {**e, "simplifiedVersion": text[e["startIndex"]:e["endIndex"]]}
+        if e.get("validation", {}).get("verdict") == guardrail.REJECTED else e
+        for e in expressions
+    ]
+    expressions = [
+        e if "simplifiedVersion" in e
+        else {**e, "explanation": "", "simplifiedVersion": text[e["startIndex"]:e["endIndex"]]}
+        for e in expressions
+    ]
+
+    return {
+        "expressions": expressions,
+        "result": apply_edits(text, get_edits(expressions)),
+        "timings": timings,
+    }
 
 # Build Graph
-builder = StateGraph(MetaphorState)
-builder.add_node("metaphor_identification", metaphor_identification)
-builder.add_edge(START, "metaphor_identification")
-builder.add_edge("metaphor_identification", END)
+@functools.cache
+def get_graph(checkpointer: "SQLiteCheckpointer | None" = None):
+    """
+    Compiles the workflow on first use, keeping langgraph out of import time.
+    A graph with a checkpointer must be invoked with a thread id.
+    """
+    from langgraph.graph import StateGraph, START, END
 
-graph = builder.compile()
+    builder = StateGraph(MetaphorState)
+    builder.add_node("metaphor_identification", metaphor_identification)
+    builder.add_node("simplification", simplification)
+    builder.add_node("validation", validation)
+    builder.add_edge(START, "metaphor_identification")
+    builder.add_edge("metaphor_identification", "simplification")
+    builder.add_edge("simplification", "validation")
+    builder.add_edge("validation", END)
+    return builder.compile(checkpointer=checkpointer)
 
-def process_text(text: str) -> str:
+def process_text(text: str, run_id: str | None = None) -> MetaphorState:
     """
     Process text through the Metaphor Identification Workflow.
+
+    With a `run_id` (and checkpointing enabled) the run is checkpointed after
+    every node, and an earlier run with the same id that failed or was
+    interrupted is resumed after its last completed node, unless it had
+    reached its deadline: this run may have more time, so it starts over.
+    While another run (of this or another worker) holds the id, this one
+    runs without checkpoints.
     """
-    initial_state = {"text": text, "result": ""}
-    final_state = graph.invoke(initial_state)
-    return final_state["result"]
+    initial_state = {"text": text, "result": "", "expressions": [], "partial": False, "timings": {}}
+    checkpointer = get_checkpointer() if run_id is not None else None
+    lease = checkpointer.acquire(run_id, deadline.remaining()) if checkpointer else None
+    if lease is None:
+        if checkpointer is not None:
+            logger.info(f"Run {run_id} is already in progress; running without checkpoints")
+            metrics.inc("checkpoint_lease_conflicts_total")
+        return get_graph().invoke(initial_state)
+
+    try:
+        graph = get_graph(checkpointer)
+        config = {"configurable": {"thread_id": run_id}}
+        snapshot = graph.get_state(config)
+        resume = bool(snapshot.next) and snapshot.values.get("text") == text and not snapshot.values.get("partial")
+        if resume:
+            logger.info(f"Resuming run {run_id} at {', '.join(snapshot.next)}")
+            metrics.inc("checkpoint_resumes_total", node=snapshot.next[0])
+        final_state = graph.invoke(None if resume else initial_state, config)
+        # Finished runs are never resumed
+        checkpointer.delete_thread(run_id)
+    finally:
+        checkpointer.release(run_id, lease)
+    return final_state
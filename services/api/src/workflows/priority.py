@@ -0,0 +1,88 @@
+"""
+Priority lanes of upstream LLM calls.
+
+Work runs in the interactive lane unless it says otherwise with lane(); like
+the usage context, the lane follows the run into worker threads. When
+UPSTREAM_CONCURRENCY is set, upstream calls wait for one of that many slots,
+which are shared between the lanes by their UPSTREAM_LANE_WEIGHTS and between
+the principals of a lane equally. UPSTREAM_RESERVED_SLOTS of them are kept
+for interactive calls, so bulk work only takes spare capacity.
+"""
+
+import contextlib
+import contextvars
+from typing import Iterator, Literal
+
+from utils.scheduler import FairScheduler
+from workflows import deadline, usage
+import conf
+
+Lane = Literal["interactive", "batch", "background"]
+
+# In order of precedence
+LANES: tuple[Lane, ...] = ("interactive", "batch", "background")
+
+_current: contextvars.ContextVar[Lane] = contextvars.ContextVar("lane", default="interactive")
+
+_scheduler: FairScheduler | None = None
+
+def get_scheduler() -> FairScheduler | None:
+    """Returns the upstream scheduler, or None if upstream concurrency is unlimited."""
+    global _scheduler
+    scheduler_conf = conf.get_scheduler_conf()
+    if scheduler_conf.concurrency <= 0:
+        return None
+    if _scheduler is None:
+        _scheduler = FairScheduler(
+            "upstream",
+            capacity=scheduler_conf.concurrency,
+            weights={lane: scheduler_conf.weights.get(lane, 1.0) for lane in LANES},
+            reserved=scheduler_conf.reserved,
+        )
+    return _scheduler
+
+def close() -> None:
+    global _scheduler
+    _scheduler = None
+
+@contextlib.contextmanager
+def lane(name: Lane) -> Iterator[None]:
+    """Runs the LLM calls made within the block in the given lane."""
+    token = _current.set(name)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+def current() -> Lane:
+    return _current.get()
+
+def first(lanes: list[Lane]) -> Lane:
+    """The most urgent of the lanes, e.g. for a call made on behalf of several requests."""
+    return min(lanes, key=LANES.index, default="interactive")
+
+@contextlib.contextmanager
+def slot() -> Iterator[None]:
+    """
+    Holds an upstream slot for the block, waiting in the current lane for one
+    as long as the deadline allows.
+    """
+    scheduler = get_scheduler()
+    if scheduler is None:
+        yield
+        return
+    request_usage = usage.current()
+    principal = request_usage.principal if request_usage is not None else usage.ANONYMOUS
+    name = current()
+    granted = scheduler.submit(name, principal)
+    try:
+        deadline.wait(granted, "an upstream slot")
+    except BaseException:
+        # Granted just as the wait gave up
+        if not granted.cancel():
+            scheduler.release(name)
+        raise
+    try:
+        yield
+    finally:
+        scheduler.release(name)
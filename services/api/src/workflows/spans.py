@@ -0,0 +1,78 @@
+import re
+from array import array
+from typing import Iterable, Iterator
+
+# Expression types, indexed by the type ids stored in `Spans`
+TYPES = ("idiom", "conceptual_metaphor")
+
+# A sentence runs up to and including its terminal punctuation (and any
+# closing quotes/brackets) plus trailing whitespace, or to a blank line
+SENTENCE = re.compile(r"\S.*?(?:[.!?…]+[\"')\]]*(?=\s|$)|(?=\n\s*\n)|$)\s*", re.DOTALL)
+
+#### Spans ####
+
+class Spans():
+    """
+    Array-backed expression spans over a single text.
+
+    Stores two offsets and a type id per expression in flat machine-int arrays
+    instead of one dict or model (and one copied substring) per expression;
+    the expression text itself is only materialized on demand.
+    """
+
+    __slots__ = ("starts", "ends", "type_ids")
+
+    def __init__(self, starts: Iterable[int] = (), ends: Iterable[int] = (), type_ids: Iterable[int] = ()):
+        self.starts = array("l", starts)
+        self.ends = array("l", ends)
+        self.type_ids = array("b", type_ids)
+
+    @classmethod
+    def from_expressions(cls, expressions: list[dict]) -> "Spans":
+        return cls(
+            (e["startIndex"] for e in expressions),
+            (e["endIndex"] for e in expressions),
+            (TYPES.index(e["type"]) for e in expressions),
+        )
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[tuple[int, int, str]]:
+        for start, end, type_id in zip(self.starts, self.ends, self.type_ids):
+            yield start, end, TYPES[type_id]
+
+    def offsets(self) -> list[int]:
+        """Returns the spans as one flat [start0, end0, start1, end1, ...] list."""
+        flat = array("l", bytes(2 * self.starts.itemsize * len(self.starts)))
+        flat[0::2] = self.starts
+        flat[1::2] = self.ends
+        return flat.tolist()
+
+    def text(self, source: str, i: int) -> str:
+        return source[self.starts[i]:self.ends[i]]
+
+#### Sentences ####
+
+def split_sentences(text: str) -> list[tuple[int, int]]:
+    """
+    Splits text into sentence spans. The spans are contiguous and cover the
+    whole text, except for any leading whitespace.
+    """
+    return [m.span() for m in SENTENCE.finditer(text)]
+
+#### Edits ####
+
+def apply_edits(text: str, edits: Iterable[tuple[int, int, str]]) -> str:
+    """
+    Replaces each [start, end) range of `text` with its replacement.
+    Edits must be sorted by start and must not overlap.
+    """
+    parts = []
+    position = 0
+    for start, end, replacement in edits:
+        parts.append(text[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(text[position:])
+    return "".join(parts)
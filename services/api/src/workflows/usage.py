@@ -0,0 +1,192 @@
+"""
+Token and cost accounting for upstream LLM calls.
+
+A request opens a Usage with track(); every call_llm in the workflow then
+records its usage there (the context follows the run into worker threads),
+in the process metrics and in the ledger of the request's principal. Before a
+call, choose_model() checks the request and principal budgets against an
+estimate of the call's cost, and switches to the fallback model or cuts the
+request off if the configured model would exceed them.
+"""
+
+import contextlib
+import contextvars
+import threading
+from typing import Iterator
+
+from utils import log, metrics
+from utils.ledger import UsageLedger
+import conf
+
+logger = log.get_logger(__name__)
+
+ANONYMOUS = "anonymous"
+
+# Rough prompt size in tokens per character, for estimates before a call
+TOKENS_PER_CHAR = 0.25
+
+#### Types ####
+
+class BudgetExceeded(Exception):
+    def __init__(self, scope: str, spent: float, budget: float):
+        super().__init__(f"{scope.capitalize()} budget of ${budget:.4f} would be exceeded (${spent:.4f} spent)")
+        self.scope = scope
+
+class Usage():
+    """Usage of a single request, per model."""
+
+    def __init__(self, principal: str = ANONYMOUS):
+        self.principal = principal
+        self.models: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cost_usd(self) -> float:
+        return sum(m["costUsd"] for m in self.models.values())
+
+    def add(self, model: str, input_tokens: int, output_tokens: int, cost_usd: float) -> None:
+        with self._lock:
+            totals = self.models.setdefault(
+                model, {"calls": 0, "inputTokens": 0, "outputTokens": 0, "costUsd": 0.0},
+            )
+            totals["calls"] += 1
+            totals["inputTokens"] += input_tokens
+            totals["outputTokens"] += output_tokens
+            totals["costUsd"] += cost_usd
+
+    def report(self) -> dict:
+        with self._lock:
+            models = {model: {**totals, "costUsd": round(totals["costUsd"], 6)} for model, totals in self.models.items()}
+        return {
+            "inputTokens": sum(m["inputTokens"] for m in models.values()),
+            "outputTokens": sum(m["outputTokens"] for m in models.values()),
+            "costUsd": round(sum(m["costUsd"] for m in models.values()), 6),
+            "models": models,
+        }
+
+class Shared(Usage):
+    """
+    Usage of one call made on behalf of several requests (e.g. a batch),
+    split between their usages in proportion to the given weights.
+    """
+
+    def __init__(self, parts: list[tuple[Usage | None, float]]):
+        super().__init__()
+        total = sum(weight for _, weight in parts) or 1.0
+        self.parts = [(usage, weight / total) for usage, weight in parts]
+
+#### State ####
+
+_current: contextvars.ContextVar[Usage | None] = contextvars.ContextVar("usage", default=None)
+
+# Observed output tokens per call and model, for estimates before a call
+_output_tokens: dict[str, float] = {}
+DEFAULT_OUTPUT_TOKENS = 512
+
+_ledger: UsageLedger | None = None
+
+def get_ledger() -> UsageLedger:
+    global _ledger
+    if _ledger is None:
+        _ledger = UsageLedger(conf.get_usage_ledger_path())
+    return _ledger
+
+def close() -> None:
+    global _ledger
+    if _ledger is not None:
+        _ledger.close()
+        _ledger = None
+
+#### API ####
+
+@contextlib.contextmanager
+def track(principal: str = ANONYMOUS) -> Iterator[Usage]:
+    """Collects the usage of all LLM calls made within the block."""
+    usage = Usage(principal)
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+
+@contextlib.contextmanager
+def shared(parts: list[tuple[Usage | None, float]]) -> Iterator[Shared]:
+    """Splits the usage of all LLM calls made within the block between `parts`."""
+    usage = Shared(parts)
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+
+def current() -> Usage | None:
+    return _current.get()
+
+def cost(model: str, input_tokens: float, output_tokens: float) -> float:
+    price = conf.get_model_prices().get(model)
+    if price is None:
+        return 0.0
+    return (input_tokens * price.input + output_tokens * price.output) / 1_000_000
+
+def estimate(model: str, prompt_chars: int) -> float:
+    return cost(model, prompt_chars * TOKENS_PER_CHAR, _output_tokens.get(model, DEFAULT_OUTPUT_TOKENS))
+
+def _exceeded(model: str, prompt_chars: int) -> tuple[str, float, float] | None:
+    """Returns the first budget (scope, spent, budget) a call would exceed, if any."""
+    budget = conf.get_budget_conf()
+    usage = current()
+    if usage is None or isinstance(usage, Shared):
+        return None
+    remaining: list[tuple[str, float, float]] = []
+    if budget.request_usd > 0:
+        remaining.append(("request", usage.cost_usd, budget.request_usd))
+    if budget.principal_daily_usd > 0:
+        remaining.append(("daily", get_ledger().spent_today(usage.principal), budget.principal_daily_usd))
+    if not remaining:
+        return None
+    expected = estimate(model, prompt_chars)
+    return next(((s, spent, b) for s, spent, b in remaining if spent + expected > b), None)
+
+def within_budget(model: str, prompt_chars: int) -> bool:
+    return _exceeded(model, prompt_chars) is None
+
+def choose_model(model: str, prompt_chars: int) -> str:
+    """
+    Returns the model to call: `model` if its estimated cost fits the
+    remaining budgets, otherwise the fallback model if that fits. Raises
+    BudgetExceeded if neither does. Shared calls are not checked here; each
+    request checks its own share before joining one.
+    """
+    exceeded = _exceeded(model, prompt_chars)
+    if exceeded is None:
+        return model
+    fallback = conf.get_budget_conf().fallback_model
+    if fallback and within_budget(fallback, prompt_chars):
+        logger.info(f"Downgrading to {fallback} to stay within the {exceeded[0]} budget")
+        metrics.inc("budget_downgrades_total", scope=exceeded[0])
+        return fallback
+    metrics.inc("budget_cutoffs_total", scope=exceeded[0])
+    raise BudgetExceeded(*exceeded)
+
+def record(model: str, input_tokens: int, output_tokens: int, price_factor: float = 1.0) -> None:
+    """
+    Accounts a finished call to the current request, metrics and ledger; a
+    `price_factor` scales the model's price, e.g. for discounted batch calls.
+    """
+    call_cost = cost(model, input_tokens, output_tokens) * price_factor
+    previous = _output_tokens.get(model)
+    _output_tokens[model] = output_tokens if previous is None else 0.8 * previous + 0.2 * output_tokens
+
+    metrics.inc("llm_calls_total", model=model)
+    metrics.inc("llm_tokens_total", input_tokens, model=model, kind="input")
+    metrics.inc("llm_tokens_total", output_tokens, model=model, kind="output")
+    metrics.inc("llm_cost_usd_total", call_cost, model=model)
+
+    usage = current()
+    parts = usage.parts if isinstance(usage, Shared) else [(usage, 1.0)]
+    for part, share in parts:
+        part_input, part_output = round(input_tokens * share), round(output_tokens * share)
+        if part is not None:
+            part.add(model, part_input, part_output, call_cost * share)
+        principal = part.principal if part is not None else ANONYMOUS
+        get_ledger().record(principal, model, part_input, part_output, call_cost * share)
@@ -0,0 +1,185 @@
+"""
+Guardrail validation of simplified expressions.
+
+For every expression, the sentence it occurs in is compared with the same
+sentence after the simplification is substituted. All pairs of a request are
+embedded in one batch and scored locally; clear accepts and rejects are
+decided on the score alone, and only borderline pairs are sent to an LLM judge.
+With a lexical (non-semantic) encoder, every pair is judged; without an
+encoder (its model could not be loaded), the guardrail is skipped.
+
+Thresholds can be calibrated on labeled pairs with:
+    python -m workflows.validation calibrate pairs.jsonl [--precision 0.95]
+where each line holds {"original": ..., "adapted": ..., "equivalent": true|false}.
+"""
+
+import argparse
+import functools
+import json
+import sys
+import time
+from typing import TYPE_CHECKING
+
+from pydantic import BaseModel
+
+from utils import log, metrics
+from workflows import deadline
+from workflows.embeddings import get_encoder, get_encoder_or_none, similarities
+from workflows.llm import batched, call_llm, gather
+from workflows.spans import split_sentences
+import conf
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = log.get_logger(__name__)
+
+ACCEPTED = "accepted"
+REJECTED = "rejected"
+
+#### Types ####
+
+class Judgement(BaseModel):
+    equivalent: bool
+
+#### Validation ####
+
+def sentence_pairs(text: str, expressions: list[dict]) -> tuple[list[str], list[str]]:
+    """Returns each expression's sentence before and after its simplification."""
+    sentences = split_sentences(text)
+    originals, adapteds = [], []
+    i = 0
+    for e in sorted(expressions, key=lambda e: e["startIndex"]):
+        while i < len(sentences) - 1 and sentences[i][1] <= e["startIndex"]:
+            i += 1
+        start, end = sentences[i] if sentences else (0, len(text))
+        start, end = min(start, e["startIndex"]), max(end, e["endIndex"])
+        originals.append(text[start:end].strip())
+        adapteds.append(
+            (text[start:e["startIndex"]] + e["simplifiedVersion"] + text[e["endIndex"]:end]).strip()
+        )
+    return originals, adapteds
+
+def judge(original: str, adapted: str) -> bool:
+    from langchain_core.prompts import ChatPromptTemplate
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "You check Easy-to-Read rewrites. Answer whether the rewritten sentence keeps the meaning of the original sentence."),
+        ("user", "Original: {original}\nRewritten: {adapted}")
+    ])
+    return call_llm(prompt, Judgement, {"original": original, "adapted": adapted}).equivalent
+
+def available() -> bool:
+    """Whether the encoder can be loaded; loads it on first use."""
+    return get_encoder_or_none() is not None
+
+def validate(text: str, expressions: list[dict]) -> tuple[list[dict], dict[str, float]]:
+    """
+    Returns a {"verdict", "score", "judged"} result per expression (in the
+    order given) and the time spent per validation stage in milliseconds.
+    Borderline pairs that can no longer be judged before the deadline are
+    rejected, and their result is flagged with "deadline".
+    """
+    thresholds = conf.get_guardrail_conf()
+    order = sorted(range(len(expressions)), key=lambda i: expressions[i]["startIndex"])
+    originals, adapteds = sentence_pairs(text, [expressions[i] for i in order])
+
+    start = time.perf_counter()
+    encoder = get_encoder()
+    scores = similarities(encoder, originals, adapteds)
+    timings = {"validation.embedding": (time.perf_counter() - start) * 1000}
+
+    def borderline(score: float) -> bool:
+        if not encoder.semantic:
+            return True
+        return thresholds.reject_threshold <= score < thresholds.accept_threshold
+
+    start = time.perf_counter()
+    # Through the batch API, borderline pairs are judged side by side so
+    # that they share a batch job
+    verdicts: dict[int, bool] = {}
+    if batched():
+        escalated = [k for k in range(len(order)) if borderline(scores[k])]
+        judgements = gather([functools.partial(judge, originals[k], adapteds[k]) for k in escalated])
+        verdicts = dict(zip(escalated, judgements))
+
+    results: list[dict] = [{}] * len(expressions)
+    for k, i in enumerate(order):
+        score = float(scores[k])
+        judged = timed_out = False
+        if not borderline(score):
+            accepted = score >= thresholds.accept_threshold
+        else:
+            try:
+                accepted = verdicts[k] if k in verdicts else judge(originals[k], adapteds[k])
+                judged = True
+            except deadline.DeadlineExceeded:
+                accepted, timed_out = False, True
+        verdict = ACCEPTED if accepted else REJECTED
+        metrics.inc("guardrail_verdicts_total", verdict=verdict, judged=judged)
+        results[i] = {"verdict": verdict, "score": round(score, 4), "judged": judged}
+        if timed_out:
+            results[i]["deadline"] = True
+    timings["validation.judge"] = (time.perf_counter() - start) * 1000
+
+    return results, timings
+
+#### Calibration ####
+
+def calibrate(scores: "np.ndarray", labels: "np.ndarray", precision: float) -> tuple[float, float]:
+    """
+    Picks (reject_threshold, accept_threshold) so that scores at or above the
+    accept threshold are equivalent, and scores below the reject threshold are
+    not, each with at least the given precision. Pairs in between are judged.
+    """
+    import numpy as np
+
+    order = np.argsort(scores)
+    scores, labels = scores[order], labels[order].astype(bool)
+    n = len(scores)
+
+    # Precision of accepting everything from index i upwards
+    equivalent_above = np.cumsum(labels[::-1])[::-1]
+    accept_precision = equivalent_above / np.arange(n, 0, -1)
+    ok = np.nonzero(accept_precision >= precision)[0]
+    accept = float(scores[ok[0]]) if len(ok) else float("inf")
+
+    # Precision of rejecting everything below index i
+    different_below = np.cumsum(~labels)
+    reject_precision = different_below / np.arange(1, n + 1)
+    ok = np.nonzero(reject_precision >= precision)[0]
+    reject = float(np.nextafter(scores[ok[-1]], np.inf)) if len(ok) else float("-inf")
+
+    return min(reject, accept), accept
+
+def main() -> None:
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description="Guardrail threshold calibration.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = subparsers.add_parser("calibrate", help="Calibrate thresholds on labeled pairs")
+    calibrate_parser.add_argument("pairs", help="JSONL file with original, adapted and equivalent fields")
+    calibrate_parser.add_argument("--precision", type=float, default=0.95)
+    args = parser.parse_args()
+
+    originals, adapteds, labels = [], [], []
+    with open(args.pairs, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                pair = json.loads(line)
+                originals.append(pair["original"])
+                adapteds.append(pair["adapted"])
+                labels.append(bool(pair["equivalent"]))
+
+    scores = similarities(get_encoder(), originals, adapteds)
+    labels = np.asarray(labels)
+    reject, accept = calibrate(scores, labels, args.precision)
+    judged = float(np.mean((scores >= reject) & (scores < accept)))
+    print(f"Encoder: {get_encoder().name} ({len(labels)} pairs, {labels.mean():.0%} equivalent)")
+    print(f"GUARDRAIL_REJECT_THRESHOLD={reject:.4f}")
+    print(f"GUARDRAIL_ACCEPT_THRESHOLD={accept:.4f}")
+    print(f"Share of pairs escalated to the LLM judge: {judged:.0%}")
+
+if __name__ == "__main__":
+    log.init(conf.get_log_level())
+    sys.exit(main())
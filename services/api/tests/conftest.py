@@ -0,0 +1,9 @@
+import pytest
+
+import conf
+
+@pytest.fixture(autouse=True)
+def reload_conf():
+    """Keeps configuration read by one test out of the next."""
+    yield
+    conf.reload()
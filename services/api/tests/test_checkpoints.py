@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+from workflows import metaphor
+import conf
+from workflows.checkpoints import SQLiteCheckpointer
+
+EXPRESSION = {"type": "idiom", "startIndex": 0, "endIndex": 4}
+
+@pytest.fixture
+def workflow(tmp_path, monkeypatch):
+    """
+    Checkpoints to a file, as with several workers, and nodes that count
+    their calls instead of calling the LLM.
+    """
+    monkeypatch.setenv("CHECKPOINT_PATH", str(tmp_path / "checkpoints.sqlite3"))
+    conf.reload()
+    calls = {"detection": 0, "simplification": 0}
+    failures = {"simplification": 0}
+
+    def metaphor_identification(state):
+        calls["detection"] += 1
+        return {"expressions": [dict(EXPRESSION)]}
+
+    def simplification(state):
+        calls["simplification"] += 1
+        if failures["simplification"]:
+            failures["simplification"] -= 1
+            raise RuntimeError("upstream error")
+        return {"expressions": [{**e, "explanation": "x"} for e in state["expressions"]]}
+
+    def validation(state):
+        return {"result": state["text"].upper()}
+
+    monkeypatch.setattr(metaphor, "metaphor_identification", metaphor_identification)
+    monkeypatch.setattr(metaphor, "simplification", simplification)
+    monkeypatch.setattr(metaphor, "validation", validation)
+    metaphor.close()
+    yield calls, failures
+    metaphor.close()
+
+def test_lease_is_exclusive_until_released(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite3")
+    first, second = SQLiteCheckpointer(path), SQLiteCheckpointer(path)
+
+    token = first.acquire("run")
+    assert token is not None
+    assert second.acquire("run") is None
+    assert second.acquire("other") is not None
+
+    # Only the holder's token releases the lease
+    second.release("run", "not-the-token")
+    assert second.acquire("run") is None
+    first.release("run", token)
+    assert second.acquire("run") is not None
+
+def test_expired_lease_is_taken_over(tmp_path):
+    checkpointer = SQLiteCheckpointer(str(tmp_path / "checkpoints.sqlite3"))
+    stale = checkpointer.acquire("run", seconds=-1)
+
+    token = checkpointer.acquire("run")
+    assert token is not None
+    # The stale holder no longer releases the new lease
+    checkpointer.release("run", stale)
+    assert checkpointer.acquire("run") is None
+
+def test_failed_run_resumes_and_finished_run_is_deleted(workflow):
+    calls, failures = workflow
+    failures["simplification"] = 1
+
+    with pytest.raises(RuntimeError):
+        metaphor.process_text("text", "run")
+    assert metaphor.get_checkpointer().runs() == 1
+
+    state = metaphor.process_text("text", "run")
+    assert state["result"] == "TEXT"
+    # Detection completed in the failed run and is not repeated
+    assert calls == {"detection": 1, "simplification": 2}
+    assert metaphor.get_checkpointer().runs() == 0
+
+def test_changed_text_starts_over(workflow):
+    calls, failures = workflow
+    failures["simplification"] = 1
+
+    with pytest.raises(RuntimeError):
+        metaphor.process_text("text", "run")
+    assert metaphor.process_text("other", "run")["result"] == "OTHER"
+    assert calls["detection"] == 2
+
+def test_concurrent_runs_on_one_id(workflow, monkeypatch):
+    calls, _ = workflow
+    entered, proceed = threading.Event(), threading.Event()
+    identify = metaphor.metaphor_identification
+
+    def blocking_identification(state):
+        if not entered.is_set():
+            entered.set()
+            proceed.wait(5)
+        return identify(state)
+
+    monkeypatch.setattr(metaphor, "metaphor_identification", blocking_identification)
+    metaphor.close()
+    results = {}
+    first = threading.Thread(target=lambda: results.setdefault("first", metaphor.process_text("text", "run")))
+    first.start()
+    assert entered.wait(5)
+
+    # The first run holds the id: the second runs without touching its checkpoints
+    results["second"] = metaphor.process_text("text", "run")
+    checkpointer = metaphor.get_checkpointer()
+    assert checkpointer.runs() == 1
+    proceed.set()
+    first.join(5)
+
+    assert results["first"]["result"] == results["second"]["result"] == "TEXT"
+    assert calls["detection"] == 2
+    assert checkpointer.runs() == 0
+    assert checkpointer.acquire("run") is not None
@@ -0,0 +1,75 @@
+import io
+import json
+
+import pytest
+
+import cli
+
+def read_output(path) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def run(path, records: list[cli.Record], adapt, monkeypatch) -> cli.Checkpoint:
+    monkeypatch.setattr(cli, "adapt_record", adapt)
+    checkpoint = cli.Checkpoint.load(str(path))
+    with open(path, "a", encoding="utf-8") as out:
+        cli.run(iter(records), out, checkpoint, 2, cli.Progress(skipped=len(checkpoint), interval=60))
+    return cli.Checkpoint.load(str(path))
+
+def adapted(record: cli.Record, lane: str, batch_api: bool = False) -> dict:
+    return {"index": record.index, "id": record.id, "originalText": record.text, "adaptedText": record.text.upper()}
+
+def test_malformed_lines_are_errors():
+    f = io.StringIO('{"text": "a"}\nnot json\n\n[1]\n{"id": 7}\n{"text": "b", "id": 8}\n')
+    records = list(cli.read_records(f, "jsonl", "text", "id"))
+
+    assert [(r.index, r.id, r.text) for r in records] == [
+        (0, "0", "a"), (1, "1", ""), (2, "2", ""), (3, "7", ""), (4, "8", "b"),
+    ]
+    assert [bool(r.error) for r in records] == [False, True, True, True, False]
+
+def test_failed_records_are_retried_on_resume(tmp_path, monkeypatch):
+    path = tmp_path / "out.jsonl"
+    records = [cli.Record(i, str(i), f"text {i}") for i in range(10)] + [cli.Record(10, "10", "", error="Invalid JSON")]
+
+    def flaky(record, lane, batch_api=False):
+        if record.index in (3, 7):
+            raise RuntimeError("upstream error")
+        return adapted(record, lane)
+
+    checkpoint = run(path, records, flaky, monkeypatch)
+    assert checkpoint.watermark == 11
+    assert checkpoint.failed == {3, 7, 10}
+    assert len(checkpoint) == 8
+    assert {row["index"] for row in read_output(path) if "error" in row} == {3, 7, 10}
+
+    attempted = []
+
+    def recording(record, lane, batch_api=False):
+        attempted.append(record.index)
+        return adapted(record, lane)
+
+    checkpoint = run(path, records, recording, monkeypatch)
+    assert sorted(attempted) == [3, 7]
+    assert checkpoint.failed == {10}
+    assert checkpoint.done == set()
+    assert {row["index"] for row in read_output(path) if "adaptedText" in row} == set(range(10))
+
+def test_load_truncates_partial_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"index": 0}\n{"index": 2}\n{"index": 1, "error": "x"}\n{"index": 3, "adap')
+
+    checkpoint = cli.Checkpoint.load(str(path))
+    assert (checkpoint.watermark, checkpoint.failed) == (3, {1})
+    assert 1 not in checkpoint and 2 in checkpoint
+    assert path.read_text().endswith('"error": "x"}\n')
+
+@pytest.mark.parametrize("order", [[0, 1, 2, 3], [3, 1, 0, 2]])
+def test_watermark_advances_past_failures(order):
+    checkpoint = cli.Checkpoint()
+    for index in order:
+        checkpoint.add(index, failed=index == 1)
+
+    assert (checkpoint.watermark, checkpoint.done, checkpoint.failed) == (4, set(), {1})
+    checkpoint.add(1)
+    assert (len(checkpoint), checkpoint.failed) == (4, set())
@@ -0,0 +1,12 @@
+import conf
+
+def test_getters_parse_once_until_reload(monkeypatch):
+    monkeypatch.setenv("MODEL_PRICES", '{"small": {"input": 1, "output": 2}}')
+    conf.reload()
+    prices = conf.get_model_prices()
+    assert prices["small"].output == 2
+
+    monkeypatch.setenv("MODEL_PRICES", "{}")
+    assert conf.get_model_prices() is prices
+    conf.reload()
+    assert conf.get_model_prices() == {}
@@ -0,0 +1,38 @@
+import pytest
+
+from workflows import embeddings, metaphor
+import conf
+
+@pytest.fixture
+def unloadable_model(monkeypatch):
+    loads = []
+
+    class Unloadable():
+        def __init__(self, model: str):
+            loads.append(model)
+            raise OSError("offline")
+
+    monkeypatch.setattr(embeddings, "FastEmbedEncoder", Unloadable)
+    monkeypatch.setattr(embeddings, "_encoder", None)
+    monkeypatch.setattr(embeddings, "_load_error", None)
+    monkeypatch.setenv("EXPRESSION_CACHE_ENABLED", "false")
+    conf.reload()
+    return loads
+
+def test_load_is_not_retried(unloadable_model):
+    with pytest.raises(OSError):
+        embeddings.get_encoder()
+    assert embeddings.get_encoder_or_none() is None
+    assert embeddings.get_encoder_or_none() is None
+    assert len(unloadable_model) == 1
+
+def test_guardrail_is_skipped_without_model(unloadable_model):
+    text = "It is raining cats and dogs."
+    expression = {
+        "type": "idiom", "startIndex": 14, "endIndex": 27,
+        "explanation": "raining heavily", "simplifiedVersion": "very heavily",
+    }
+
+    state = metaphor.validation({"text": text, "expressions": [expression], "timings": {}})
+    assert state["result"] == "It is raining very heavily."
+    assert "validation" not in state["expressions"][0]
@@ -0,0 +1,16 @@
+import json
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+def loaded_by(module: str) -> set[str]:
+    script = f"import json, sys; import {module}; print(json.dumps(sorted(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", script], cwd=SRC, capture_output=True, text=True, check=True).stdout
+    return set(json.loads(output.splitlines()[-1]))
+
+def test_main_does_not_load_optional_dependencies():
+    loaded = loaded_by("main")
+    # Only needed with authentication, Postgres or when a request needs them
+    assert not {"jwt", "sqlalchemy", "numpy", "langgraph"} & loaded
@@ -0,0 +1,40 @@
+from workflows.incremental import plan
+
+TEXT = "One is here. Two is here. Three is here. Four is here. Five is here."
+
+def reused(previous: str, reuse: list[tuple[int, int, int]]) -> list[str]:
+    return [previous[start:end].strip() for start, end, _ in reuse]
+
+def test_unchanged_text_is_reused():
+    result = plan(TEXT, TEXT)
+    assert result.chunks == []
+    assert reused(TEXT, result.reuse) == [s.strip() + "." for s in TEXT.split(".")[:-1]]
+    assert {shift for _, _, shift in result.reuse} == {0}
+
+def test_edit_reanalyzes_sentence_and_neighbours():
+    text = TEXT.replace("Three is here", "Three was there")
+    result = plan(TEXT, text)
+
+    assert [text[start:end] for start, end in result.chunks] == ["Two is here. Three was there. Four is here. "]
+    assert reused(TEXT, result.reuse) == ["One is here.", "Five is here."]
+    # Sentences after the edit move by the change in length
+    assert result.reuse[-1][2] == 2
+
+def test_appended_sentence_leaves_old_text_alone():
+    text = TEXT + " Six is here."
+    result = plan(TEXT, text)
+
+    assert [text[start:end] for start, end in result.chunks] == ["Six is here."]
+    assert len(result.reuse) == 5
+
+def test_prepended_sentence_shifts_the_rest():
+    text = "Zero. " + TEXT
+    result = plan(TEXT, text)
+
+    assert [text[start:end] for start, end in result.chunks] == ["Zero. One is here. "]
+    assert reused(TEXT, result.reuse) == ["Two is here.", "Three is here.", "Four is here.", "Five is here."]
+    assert {shift for _, _, shift in result.reuse} == {len("Zero. ")}
+
+def test_trailing_whitespace_changes_nothing():
+    assert plan(TEXT, TEXT + "  \n").chunks == []
+    assert plan(TEXT + " ", TEXT).chunks == []
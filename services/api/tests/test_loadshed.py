@@ -0,0 +1,53 @@
+import contextlib
+from typing import Annotated
+
+import pytest
+from fastapi import FastAPI, Header
+from fastapi.testclient import TestClient
+
+from utils import loadshed
+import conf
+
+@pytest.fixture
+def client(monkeypatch):
+    """An app whose batch and background requests are always shed."""
+    monkeypatch.setenv("LOAD_SHED_LAG_MS", "")
+    monkeypatch.setenv("LOAD_SHED_IN_FLIGHT", "batch=0,background=0")
+    monkeypatch.setenv("LOAD_SHED_RETRY_AFTER_SECONDS", "7")
+    conf.reload()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: FastAPI):
+        loadshed.init()
+        yield
+        loadshed.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(loadshed.LoadShedMiddleware)
+    for path in sorted(loadshed.EXEMPT_PATHS):
+        app.get(path)(lambda: {"ok": True})
+
+    @app.get("/adapt")
+    def adapt(x_priority: Annotated[str, Header()] = "interactive"):
+        return {"lane": x_priority}
+
+    @app.get("/document")
+    def document(x_priority: Annotated[str, Header()] = "batch"):
+        return {"lane": x_priority}
+
+    with TestClient(app) as client:
+        yield client
+
+def test_exempt_paths_are_never_shed(client):
+    for path in loadshed.EXEMPT_PATHS:
+        assert client.get(path, headers={"X-Priority": "background"}).status_code == 200
+
+def test_requests_are_shed_by_lane(client):
+    assert client.get("/adapt").status_code == 200
+    shed = client.get("/adapt", headers={"X-Priority": "batch"})
+    assert shed.status_code == 503
+    assert shed.headers["retry-after"] == "7"
+
+def test_route_default_lane_applies_without_header(client):
+    assert client.get("/document").status_code == 503
+    assert client.get("/document", headers={"X-Priority": "interactive"}).status_code == 200
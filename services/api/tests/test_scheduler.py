@@ -0,0 +1,63 @@
+from utils.scheduler import FairScheduler
+
+def queue(scheduler: FairScheduler, order: list[str], lane: str, principal: str, label: str):
+    future = scheduler.submit(lane, principal)
+    future.add_done_callback(lambda f: f.cancelled() or order.append(label))
+    return future
+
+def drain(scheduler: FairScheduler, order: list[str], lanes: dict[str, str]) -> list[str]:
+    """Releases each granted slot in turn until nothing is left waiting."""
+    released = 0
+    while released < len(order):
+        scheduler.release(lanes[order[released]])
+        released += 1
+    return order
+
+def test_principals_of_a_lane_take_turns():
+    scheduler = FairScheduler("test", capacity=1, weights={"interactive": 1.0})
+    order: list[str] = []
+    lanes = {}
+    for label, principal in [("hold", "x"), ("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b"), ("c1", "c")]:
+        queue(scheduler, order, "interactive", principal, label)
+        lanes[label] = "interactive"
+
+    assert drain(scheduler, order, lanes) == ["hold", "a1", "b1", "c1", "a2", "a3"]
+
+def test_lanes_share_slots_by_weight():
+    scheduler = FairScheduler("test", capacity=1, weights={"interactive": 3.0, "batch": 1.0})
+    order: list[str] = []
+    lanes = {"hold": "interactive"}
+    queue(scheduler, order, "interactive", "x", "hold")
+    for i in range(8):
+        for lane in ("interactive", "batch"):
+            queue(scheduler, order, lane, "p", f"{lane}-{i}")
+            lanes[f"{lane}-{i}"] = lane
+
+    granted = [lanes[label] for label in drain(scheduler, order, lanes)[1:9]]
+    assert granted.count("interactive") == 6
+    assert granted.count("batch") == 2
+
+def test_reserved_slots_are_kept_for_the_first_lane():
+    scheduler = FairScheduler("test", capacity=3, weights={"interactive": 1.0, "batch": 1.0}, reserved=1)
+    batch = [scheduler.submit("batch", "p") for _ in range(3)]
+    assert [f.done() for f in batch] == [True, True, False]
+
+    interactive = scheduler.submit("interactive", "q")
+    assert interactive.done()
+    assert scheduler.stats() == {"interactive": {"waiting": 0, "in_use": 1}, "batch": {"waiting": 1, "in_use": 2}}
+
+    # The waiting batch call only gets a slot once more than the reserve is free
+    scheduler.release("interactive")
+    assert not batch[2].done()
+    scheduler.release("batch")
+    assert batch[2].done()
+
+def test_cancelled_request_gives_up_its_place():
+    scheduler = FairScheduler("test", capacity=1, weights={"interactive": 1.0})
+    held = scheduler.submit("interactive", "a")
+    first, second = scheduler.submit("interactive", "b"), scheduler.submit("interactive", "c")
+    assert held.done() and first.cancel()
+
+    scheduler.release("interactive")
+    assert second.done()
+    assert scheduler.stats()["interactive"] == {"waiting": 0, "in_use": 1}
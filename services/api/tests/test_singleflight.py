@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from utils.singleflight import SingleFlight
+
+def test_concurrent_callers_share_one_call():
+    async def main():
+        flight = SingleFlight("test")
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            call = calls
+            await asyncio.sleep(0.01)
+            return call
+
+        results = await asyncio.gather(*(flight.do("key", fn) for _ in range(3)), flight.do("other", fn))
+        return results, calls, flight.in_flight()
+
+    assert asyncio.run(main()) == ([1, 1, 1, 2], 2, 0)
+
+def test_cancelled_caller_leaves_the_call_to_the_others():
+    async def main():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flight.do("key", fn))
+        second = asyncio.create_task(flight.do("key", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "done"
+
+def test_call_is_cancelled_once_every_caller_is_gone():
+    async def main():
+        flight = SingleFlight("test")
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def fn():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(flight.do("key", fn)) for _ in range(2)]
+        await started.wait()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        return flight.pending("key")
+
+    assert asyncio.run(main()) is False
+
+def test_callers_share_the_exception():
+    async def main():
+        flight = SingleFlight("test")
+
+        async def fn():
+            await asyncio.sleep(0)
+            raise ValueError("upstream")
+
+        return await asyncio.gather(flight.do("key", fn), flight.do("key", fn), return_exceptions=True)
+
+    first, second = asyncio.run(main())
+    assert isinstance(first, ValueError) and first is second